@@ -0,0 +1,284 @@
+"""Headless HTTP API over BloodBankService for intake kiosks and integrations.
+
+Runs on aiohttp. Service calls go to a thread pool sized to the MongoDB connection
+pool, so the event loop never waits on the driver:
+
+    python blood.py --serve --host 0.0.0.0 --port 8080
+
+With BLOOD_BANK_STORAGE=sqlite it serves any other storage.Storage instead; only the
+inventory, donor, donation and collect/deposit routes are available then.
+
+Requests act on the branch in the X-Branch header (or ?branch=), defaulting to
+BLOOD_BANK_BRANCH. List endpoints are keyset-paginated: pass the returned "next"
+token as ?cursor= to get the following page.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import asyncio
+import base64
+import binascii
+import json
+import os
+import sqlite3
+
+from bson import json_util
+from pymongo.errors import ConnectionFailure, DuplicateKeyError, ServerSelectionTimeoutError
+
+from services import (
+    BLOOD_GROUPS,
+    EXPORT_FIELDS,
+    IMPORT_FIELDS,
+    MONGO_MAX_POOL_SIZE,
+    BloodBankService,
+    DeferralError,
+    InsufficientStockError,
+    InventoryError,
+    find_page,
+    search_filter,
+)
+
+API_HOST = os.environ.get("BLOOD_BANK_API_HOST", "127.0.0.1")
+API_PORT = int(os.environ.get("BLOOD_BANK_API_PORT", "8080"))
+# Threads running service calls; more than the connection pool would only queue inside the driver
+API_WORKERS = int(os.environ.get("BLOOD_BANK_API_WORKERS", str(MONGO_MAX_POOL_SIZE)))
+API_PAGE_SIZE = 100
+API_MAX_PAGE_SIZE = 1000
+# Most donations accepted by one POST /donations/batch
+API_BATCH_LIMIT = 1000
+
+
+class UnknownBranchError(Exception):
+    """Raised for a branch id with no stock and no users."""
+
+
+def to_json(data):
+    return json.dumps(data, default=str)
+
+
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(json_util.dumps(key).encode()).decode()
+
+
+def decode_cursor(token):
+    try:
+        return json_util.loads(base64.urlsafe_b64decode(token.encode()))
+    except (binascii.Error, ValueError):
+        raise ValueError("Invalid cursor")
+
+
+def allocation_json(allocations):
+    return [{"batch_id": batch_id, "units": units, "expires_at": expires_at}
+            for batch_id, units, expires_at in allocations]
+
+
+def create_app(service, workers=API_WORKERS):
+    """Build the aiohttp application serving service, a BloodBankService or another Storage."""
+    try:
+        from aiohttp import web
+    except ImportError:
+        raise RuntimeError("The HTTP API requires aiohttp (pip install aiohttp)")
+
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="api")
+
+    async def call(fn, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(executor, partial(fn, *args, **kwargs))
+
+    def reply(data, status=200):
+        return web.json_response(data, status=status, dumps=to_json)
+
+    # Services are kept per branch, so only ids that exist may create one
+    known_branches = {service.branch_id}
+
+    async def check_branch(branch_id):
+        if branch_id not in known_branches:
+            if not await call(service.branch_exists, branch_id):
+                raise UnknownBranchError(f"Unknown branch: {branch_id}")
+            known_branches.add(branch_id)
+
+    async def branch_service(request):
+        branch_id = request.headers.get("X-Branch") or request.query.get("branch") or service.branch_id
+        await check_branch(branch_id)
+        return service.for_branch(branch_id)
+
+    async def read_json(request):
+        try:
+            data = await request.json()
+        except json.JSONDecodeError:
+            raise ValueError("Request body must be JSON")
+        if not isinstance(data, dict):
+            raise ValueError("Request body must be a JSON object")
+        return data
+
+    def fields(data, names):
+        return [str(data.get(name) or "").strip() for name in names]
+
+    @web.middleware
+    async def errors(request, handler):
+        try:
+            return await handler(request)
+        except InsufficientStockError as e:
+            return reply({"error": str(e)}, 409)
+        except UnknownBranchError as e:
+            return reply({"error": str(e)}, 404)
+        except DeferralError as e:
+            return reply({"error": str(e), "next_date": e.next_date}, 409)
+        except (ValueError, InventoryError) as e:
+            return reply({"error": str(e)}, 400)
+        except (DuplicateKeyError, sqlite3.IntegrityError) as e:
+            return reply({"error": f"Already exists: {e}"}, 409)
+        except (ConnectionFailure, ServerSelectionTimeoutError, sqlite3.OperationalError) as e:
+            # Only these are worth a retry; any other database error is a 500
+            return reply({"error": f"Database unavailable: {e}"}, 503)
+
+    async def health(request):
+        await call(service.ping)
+        return reply({"status": "ok"})
+
+    async def inventory(request):
+        svc = await branch_service(request)
+        return reply({"branch": svc.branch_id, "amounts": await call(svc.inventory_snapshot)})
+
+    async def inventory_ledger(request):
+        q = request.query
+        if q.get("blood_group") not in BLOOD_GROUPS:
+            raise ValueError("blood_group is required")
+        after = decode_cursor(q["cursor"]) if q.get("cursor") else None
+        svc = await branch_service(request)
+        docs, next_key = await call(svc.ledger_history, q["blood_group"], after, page_limit(q))
+        return reply({"items": docs, "next": encode_cursor(next_key) if next_key else None})
+
+    async def stock_alerts(request):
+        alerts = service.cache.alerts
+        branch_id = request.headers.get("X-Branch") or request.query.get("branch")
+        return reply({"alerts": alerts.low(branch_id) if alerts is not None else []})
+
+    async def network_inventory(request):
+        return reply(await call(service.network_inventory))
+
+    async def add_donor(request):
+        data = await read_json(request)
+        svc = await branch_service(request)
+        donor = await call(svc.add_donor, *fields(data, IMPORT_FIELDS["donors"]), force=bool(data.get("force")))
+        return reply(donor, 202 if donor.get("journaled") else 201)
+
+    async def add_donation(request):
+        data = await read_json(request)
+        svc = await branch_service(request)
+        name, age, gender, blood_group, units, date = fields(data, IMPORT_FIELDS["donations"])
+        donation = await call(svc.record_donation, name, age, gender, blood_group, units, date or None,
+                              data.get("donor_id") or None, bool(data.get("force")))
+        return reply(donation, 202 if donation.get("journaled") else 201)
+
+    async def add_donations(request):
+        data = await read_json(request)
+        rows = data.get("donations")
+        if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+            raise ValueError("Body must be {\"donations\": [ {...}, ... ]}")
+        if len(rows) > API_BATCH_LIMIT:
+            raise ValueError(f"At most {API_BATCH_LIMIT} donations per batch")
+        svc = await branch_service(request)
+        stored, rejected = await call(svc.record_donations, rows)
+        return reply({
+            "stored": len(stored),
+            "ids": [donation["_id"] for donation in stored],
+            "journaled": any(donation.get("journaled") for donation in stored),
+            "errors": [{"index": i, "error": error} for i, error in rejected],
+        }, 202 if stored and stored[0].get("journaled") else 201)
+
+    async def transaction(request):
+        data = await read_json(request)
+        svc = await branch_service(request)
+        blood_group = data.get("blood_group")
+        transaction_type = data.get("type")
+        amount = data.get("amount")
+        if transaction_type not in ("collect", "deposit", "transfer"):
+            raise ValueError("type must be collect, deposit or transfer")
+        if blood_group not in BLOOD_GROUPS:
+            raise ValueError("blood_group must be one of " + ", ".join(BLOOD_GROUPS))
+        # JSON true and 2.9 would otherwise pass int() as 1 and 2 units
+        if isinstance(amount, bool) or not isinstance(amount, int):
+            raise ValueError("amount must be a whole number")
+        try:
+            if transaction_type == "transfer":
+                if not isinstance(service, BloodBankService):
+                    raise ValueError("Transfers need the MongoDB storage backend")
+                to_branch = str(data.get("to_branch") or "").strip()
+                if to_branch:
+                    await check_branch(to_branch)
+                doc, allocations = await call(svc.transfer, to_branch, blood_group, amount)
+            else:
+                doc, allocations = await call(svc.process_transaction, blood_group, transaction_type, amount)
+        except InsufficientStockError as e:
+            if not isinstance(service, BloodBankService):
+                raise
+            return reply({"error": str(e), "matches": await call(svc.find_matches, blood_group)}, 409)
+        return reply({"inventory": doc, "allocations": allocation_json(allocations)},
+                     202 if doc.get("journaled") else 200)
+
+    def page_limit(q):
+        try:
+            return max(min(int(q.get("limit", API_PAGE_SIZE)), API_MAX_PAGE_SIZE), 1)
+        except ValueError:
+            raise ValueError("limit must be a number")
+
+    def list_handler(collection_name):
+        async def handler(request):
+            q = request.query
+            limit = page_limit(q)
+            query, sort = search_filter(
+                q.get("name", ""), q.get("blood_group"), q.get("gender"), q.get("age_min"), q.get("age_max"),
+                q.get("date_from"), q.get("date_to")
+            )
+            projection = {field: 1 for field in EXPORT_FIELDS[collection_name]}
+            projection.update({field: 1 for field, _ in sort})
+            after = decode_cursor(q["cursor"]) if q.get("cursor") else None
+            collection = getattr(service, collection_name)
+            docs, next_key = await call(find_page, collection, query, sort, projection, after, limit)
+            return reply({"items": docs, "next": encode_cursor(next_key) if next_key else None})
+        return handler
+
+    async def donor_donations(request):
+        q = request.query
+        after = decode_cursor(q["cursor"]) if q.get("cursor") else None
+        docs, next_key = await call(service.donor_donations, request.match_info["donor_id"], after, page_limit(q))
+        return reply({"items": docs, "next": encode_cursor(next_key) if next_key else None})
+
+    async def donor_eligibility(request):
+        eligible, reason, next_date = await call(service.donor_eligibility, request.match_info["donor_id"],
+                                                 request.query.get("day"))
+        return reply({"eligible": eligible, "reason": reason, "next_date": next_date})
+
+    async def eligible_counts(request):
+        groups = request.query.getall("blood_group", []) or BLOOD_GROUPS
+        if any(group not in BLOOD_GROUPS for group in groups):
+            raise ValueError("Unknown blood group")
+        return reply(await call(service.eligible_counts, request.query.get("day"), groups))
+
+    async def shutdown(app):
+        executor.shutdown(wait=False)
+
+    app = web.Application(middlewares=[errors])
+    app.router.add_get("/health", health)
+    app.router.add_get("/inventory", inventory)
+    app.router.add_post("/donors", add_donor)
+    app.router.add_post("/donations", add_donation)
+    app.router.add_post("/transactions", transaction)
+    if isinstance(service, BloodBankService):
+        app.router.add_get("/inventory/network", network_inventory)
+        app.router.add_get("/inventory/ledger", inventory_ledger)
+        app.router.add_get("/alerts", stock_alerts)
+        app.router.add_get("/donors", list_handler("donors"))
+        app.router.add_get("/donors/eligible", eligible_counts)
+        app.router.add_get("/donors/{donor_id}/donations", donor_donations)
+        app.router.add_get("/donors/{donor_id}/eligibility", donor_eligibility)
+        app.router.add_get("/donations", list_handler("donations"))
+        app.router.add_post("/donations/batch", add_donations)
+    app.on_cleanup.append(shutdown)
+    return app
+
+
+def serve(service, host=API_HOST, port=API_PORT):
+    """Serve the API until interrupted."""
+    app = create_app(service)
+    from aiohttp import web
+    web.run_app(app, host=host, port=port, access_log=None)
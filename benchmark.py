@@ -0,0 +1,595 @@
+"""Load and stress checks for the blood bank data paths.
+
+Runs against a local mongod when --uri is given, otherwise against mongomock:
+
+    python benchmark.py stress --threads 16 --ops 2000
+    python benchmark.py --uri mongodb://localhost:27017/ stress
+    python benchmark.py journal --threads 16 --entries 2000
+    python benchmark.py --uri mongodb://localhost:27017/ branches --threads 32 --branches 1 8 32
+    python benchmark.py api --concurrency 64 --requests 5000
+    python benchmark.py api --url http://kiosk-server:8080 --concurrency 128
+    python benchmark.py --uri mongodb://localhost:27017/ match --donors 1000000
+    python benchmark.py --uri mongodb://localhost:27017/ eligibility --donors 1000000
+    python benchmark.py ledger --threads 8 --ops 500 --snapshots 4
+    python benchmark.py --uri mongodb://localhost:27017/ reports --donations 1000000 --months 12 --workers 8
+    python benchmark.py --uri mongodb://localhost:27017/ storage --scales 1000 100000
+
+Per-operation latency of the service layer is a pytest-benchmark suite under tests/benchmarks:
+
+    python -m pytest tests/benchmarks --uri mongodb://localhost:27017/ --benchmark-group-by=param:seeded
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+from services import (
+    BLOOD_GROUPS,
+    DEFAULT_BRANCH,
+    BloodBankService,
+    InventoryError,
+    WriteJournal,
+    LEDGER_SETTLE_SECONDS,
+    MAX_DONOR_AGE,
+    MIN_DONOR_AGE,
+    add_totals,
+    bootstrap_schema,
+    eligibility_cutoff,
+    ledger_changes,
+    name_key,
+    rebuild_inventory,
+    snapshot_totals,
+    take_snapshot,
+    update_inventory,
+)
+from storage import SQLiteStorage
+
+SEED_BATCH_SIZE = 10000
+
+
+def get_database(uri, name="blood_bank_benchmark"):
+    """Return a scratch database on the given server, or an in-memory mongomock one."""
+    if uri:
+        from pymongo import MongoClient
+        client = MongoClient(uri)
+    else:
+        import mongomock
+        client = mongomock.MongoClient()
+    client.drop_database(name)
+    return client[name]
+
+
+def stress_inventory(db, threads=8, ops=1000, initial=100, blood_group="O+"):
+    """Hammer one group with concurrent collects and deposits and check no unit is lost."""
+    inventory = db['blood_inventory']
+    inventory.insert_one({"branch_id": DEFAULT_BRANCH, "blood_group": blood_group, "amount": initial})
+
+    def clerk(seed):
+        rng = random.Random(seed)
+        collected = deposited = rejected = 0
+        for _ in range(ops):
+            units = rng.randint(1, 5)
+            if rng.random() < 0.6:
+                try:
+                    update_inventory(inventory, blood_group, "collect", units)
+                    collected += units
+                except InventoryError:
+                    rejected += 1
+            else:
+                update_inventory(inventory, blood_group, "deposit", units)
+                deposited += units
+        return collected, deposited, rejected
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(clerk, range(threads)))
+    elapsed = time.perf_counter() - start
+
+    collected = sum(r[0] for r in results)
+    deposited = sum(r[1] for r in results)
+    rejected = sum(r[2] for r in results)
+    expected = initial + deposited - collected
+    actual = inventory.find_one({"branch_id": DEFAULT_BRANCH, "blood_group": blood_group})['amount']
+    total_ops = threads * ops
+
+    print(f"{total_ops} transactions on {threads} threads in {elapsed:.2f}s "
+          f"({total_ops / elapsed:,.0f} tx/s), {rejected} collects rejected for low stock")
+    print(f"expected {expected} units, found {actual}")
+    return expected == actual and actual >= 0
+
+
+def stress_branches(db_factory, threads, ops, branch_counts, initial=1000):
+    """Run the same concurrent transaction mix with writers spread over more and more branches.
+
+    With one branch every writer hits the same eight documents; each extra branch adds eight
+    more, so per-document contention (and the latency it causes) drops. Checks no unit is lost.
+    """
+    print(f"{'branches':>9}{'tx/s':>12}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    ok = True
+    for branch_count in branch_counts:
+        db = db_factory()
+        inventory = db['blood_inventory']
+        branches = [f"branch{b}" for b in range(branch_count)]
+        inventory.create_index([("branch_id", 1), ("blood_group", 1)], unique=True)
+        inventory.insert_many([{"branch_id": branch, "blood_group": group, "amount": initial}
+                               for branch in branches for group in BLOOD_GROUPS])
+
+        def clerk(seed):
+            rng = random.Random(seed)
+            branch = branches[seed % branch_count]
+            net = {}
+            latencies = []
+            for _ in range(ops):
+                group = rng.choice(BLOOD_GROUPS)
+                units = rng.randint(1, 5)
+                kind = "collect" if rng.random() < 0.5 else "deposit"
+                start = time.perf_counter()
+                try:
+                    update_inventory(inventory, group, kind, units, branch_id=branch)
+                    net[(branch, group)] = net.get((branch, group), 0) + (units if kind == "deposit" else -units)
+                except InventoryError:
+                    pass
+                latencies.append(time.perf_counter() - start)
+            return net, latencies
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            results = list(pool.map(clerk, range(threads)))
+        elapsed = time.perf_counter() - start
+
+        expected = {(branch, group): initial for branch in branches for group in BLOOD_GROUPS}
+        for net, _ in results:
+            for key, change in net.items():
+                expected[key] += change
+        actual = {(doc["branch_id"], doc["blood_group"]): doc["amount"] for doc in inventory.find()}
+        if actual != expected:
+            ok = False
+            print(f"drift at {branch_count} branches: " + ", ".join(
+                f"{key} expected {units} found {actual.get(key)}" for key, units in expected.items()
+                if actual.get(key) != units))
+        latencies = sorted(latency for _, batch in results for latency in batch)
+        p50, p95, p99 = (latencies[int(len(latencies) * q)] * 1000 for q in (0.5, 0.95, 0.99))
+        print(f"{branch_count:>9}{len(latencies) / elapsed:>12,.0f}{p50:>10.3f}{p95:>10.3f}{p99:>10.3f}")
+    return ok
+
+
+def start_api(service, port=0):
+    """Serve the HTTP API from a background thread and return its base URL."""
+    from aiohttp import web
+    from api import create_app
+
+    started = threading.Event()
+    address = {}
+
+    def run():
+        loop = asyncio.new_event_loop()
+        runner = web.AppRunner(create_app(service), access_log=None)
+        loop.run_until_complete(runner.setup())
+        site = web.TCPSite(runner, "127.0.0.1", port)
+        loop.run_until_complete(site.start())
+        address["url"] = f"http://127.0.0.1:{runner.addresses[0][1]}"
+        started.set()
+        loop.run_forever()
+
+    threading.Thread(target=run, name="api-server", daemon=True).start()
+    started.wait()
+    return address["url"]
+
+
+def api_requests(i):
+    """The request mix a kiosk fleet sends: (name, method, path, json body)."""
+    group = BLOOD_GROUPS[i % 8]
+    donation = {"name": f"api-donor{i}", "age": 30, "gender": "female", "blood_group": group, "units": 1}
+    mix = [
+        ("inventory", "GET", "/inventory", None),
+        ("add donation", "POST", "/donations", donation),
+        ("deposit", "POST", "/transactions", {"blood_group": group, "type": "deposit", "amount": 1}),
+        ("list donors", "GET", "/donors?limit=50", None),
+        ("batch of 50", "POST", "/donations/batch", {"donations": [donation] * 50}),
+    ]
+    return mix[i % len(mix)]
+
+
+async def load_test(url, concurrency, total):
+    import aiohttp
+
+    latencies = {}
+    failures = {}
+    counter = iter(range(total))
+
+    async def client(session):
+        for i in counter:
+            name, method, path, body = api_requests(i)
+            start = time.perf_counter()
+            async with session.request(method, url + path, json=body) as response:
+                await response.read()
+                if response.status >= 400:
+                    failures[name] = failures.get(name, 0) + 1
+            latencies.setdefault(name, []).append(time.perf_counter() - start)
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        start = time.perf_counter()
+        await asyncio.gather(*[client(session) for _ in range(concurrency)])
+        elapsed = time.perf_counter() - start
+
+    print(f"{total} requests from {concurrency} clients in {elapsed:.2f}s ({total / elapsed:,.0f} req/s)")
+    print(f"{'endpoint':<14}{'requests':>9}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, values in latencies.items():
+        values.sort()
+        p50, p95, p99 = (values[min(int(len(values) * q), len(values) - 1)] * 1000 for q in (0.5, 0.95, 0.99))
+        print(f"{name:<14}{len(values):>9}{failures.get(name, 0):>8}{p50:>10.2f}{p95:>10.2f}{p99:>10.2f}")
+    return not failures
+
+
+def seed(db, count):
+    """Fill users, donors and donations with count documents each and build the app's indexes."""
+    for name, make in [
+        ("users", lambda i: {"name": f"user{i}", "password": "secret", "dob": "1990-01-01"}),
+        ("donors", lambda i: {"name": f"donor{i}", "name_key": f"donor{i}", "age": 18 + i % 47,
+                              "gender": "female", "blood_group": BLOOD_GROUPS[i % 8]}),
+        ("donations", lambda i: {"name": f"donor{i}", "name_key": f"donor{i}", "age": 18 + i % 47,
+                                 "gender": "female", "blood_group": BLOOD_GROUPS[i % 8], "units": 1,
+                                 "date": f"2024-{1 + i % 12:02d}-{1 + i % 28:02d}"}),
+    ]:
+        for start in range(0, count, SEED_BATCH_SIZE):
+            db[name].insert_many([make(i) for i in range(start, min(start + SEED_BATCH_SIZE, count))])
+    db['blood_inventory'].insert_many([{"blood_group": group, "amount": count} for group in BLOOD_GROUPS])
+    bootstrap_schema(db, report=lambda message: None)
+
+
+def time_operation(fn, repeat):
+    """Call fn(i) repeat times and return (ops per second, p50 ms, p95 ms)."""
+    latencies = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        fn(i)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    total = sum(latencies)
+    return repeat / total, latencies[len(latencies) // 2] * 1000, latencies[int(len(latencies) * 0.95)] * 1000
+
+
+def service_operations(service, count):
+    """The operations App performs, keyed by name, each taking an iteration number."""
+    def snapshot(i):
+        service.cache.invalidate()
+        service.inventory_snapshot()
+
+    def dashboard(i):
+        service.cache.invalidate()
+        service.dashboard_stats()
+
+    return {
+        "login": lambda i: service.login(f"user{(i * 7919) % count}", "secret"),
+        "signup": lambda i: service.signup(f"bench-user{i}", "secret", "1990-01-01"),
+        "add donor": lambda i: service.add_donor(f"bench-donor{i}", "30", "male", BLOOD_GROUPS[i % 8]),
+        "record donation": lambda i: service.record_donation(f"bench-donor{i}", "30", "male", BLOOD_GROUPS[i % 8], "1"),
+        # A deposit then a collect on each group, so stock never runs out however many calls are timed
+        "transaction": lambda i: service.process_transaction(
+            BLOOD_GROUPS[i // 2 % 8], "collect" if i % 2 else "deposit", 1),
+        "inventory snapshot": snapshot,
+        "dashboard stats": dashboard,
+        "network stock": lambda i: service.network_inventory(),
+    }
+
+
+def seed_sqlite(storage, count):
+    """Fill an SQLiteStorage with the same users, donors, donations and inventory as seed()."""
+    def work(conn):
+        conn.executemany("INSERT INTO users (name, password, dob, branch_id) VALUES (?, ?, ?, ?)",
+                         ((f"user{i}", "secret", "1990-01-01", DEFAULT_BRANCH) for i in range(count)))
+        conn.executemany(
+            "INSERT INTO donors (id, name, name_key, age, gender, blood_group) VALUES (?, ?, ?, ?, ?, ?)",
+            ((f"{i:024x}", f"donor{i}", f"donor{i}", 18 + i % 47, "female", BLOOD_GROUPS[i % 8]) for i in range(count)))
+        conn.executemany(
+            "INSERT INTO donations (id, name, name_key, age, gender, blood_group, units, date, branch_id)"
+            " VALUES (?, ?, ?, ?, ?, ?, 1, ?, ?)",
+            ((f"{i:024x}", f"donor{i}", f"donor{i}", 18 + i % 47, "female", BLOOD_GROUPS[i % 8],
+              f"2024-{1 + i % 12:02d}-{1 + i % 28:02d}", DEFAULT_BRANCH) for i in range(count)))
+        conn.executemany("INSERT INTO blood_inventory (branch_id, blood_group, amount) VALUES (?, ?, ?)",
+                         ((DEFAULT_BRANCH, group, count) for group in BLOOD_GROUPS))
+    storage.transaction(work)
+    storage.connection().execute("ANALYZE")
+
+
+def storage_operations(storage, count):
+    """The storage operations behind login, the donor and donation forms and the inventory grid."""
+    def grid(i):
+        # Time the read itself, not BloodBankService's inventory cache
+        if isinstance(storage, BloodBankService):
+            storage.cache.invalidate()
+        storage.inventory_snapshot()
+
+    return {
+        "login lookup": lambda i: storage.login(f"user{(i * 7919) % count}", "secret"),
+        "insert donor": lambda i: storage.add_donor(f"bench-donor{i}", "30", "male", BLOOD_GROUPS[i % 8]),
+        # Each donation links to the donor inserted above under the same name, age and group
+        "record donation": lambda i: storage.record_donation(f"bench-donor{i}", "30", "male", BLOOD_GROUPS[i % 8], "1"),
+        "inventory grid": grid,
+    }
+
+
+def benchmark_storage(db_factory, scales, repeat):
+    """Time the same operations on the MongoDB and SQLite backends at every scale and print a table."""
+    print(f"{'scale':>10}  {'backend':<8}{'operation':<18}{'ops/s':>10}{'p50 ms':>10}{'p95 ms':>10}")
+    for count in scales:
+        db = db_factory()
+        seed(db, count)
+        sqlite = SQLiteStorage(os.path.join(tempfile.mkdtemp(), "blood_bank.db"))
+        seed_sqlite(sqlite, count)
+        for backend, storage in [("mongo", BloodBankService.from_database(db)), ("sqlite", sqlite)]:
+            for name, fn in storage_operations(storage, count).items():
+                rate, p50, p95 = time_operation(fn, repeat)
+                print(f"{count:>10}  {backend:<8}{name:<18}{rate:>10,.0f}{p50:>10.3f}{p95:>10.3f}")
+        sqlite.close()
+
+
+def benchmark_matching(db, donors, repeat):
+    """Seed donors and time find_matches for every recipient group."""
+    for start in range(0, donors, SEED_BATCH_SIZE):
+        db['donors'].insert_many([
+            {"name": f"donor{i}", "name_key": name_key(f"donor{i}"), "age": 18 + i % 47,
+             "gender": "male", "blood_group": BLOOD_GROUPS[i % 8]}
+            for i in range(start, min(start + SEED_BATCH_SIZE, donors))
+        ])
+    db['blood_inventory'].insert_many([{"blood_group": group, "amount": 10} for group in BLOOD_GROUPS])
+    bootstrap_schema(db, report=lambda message: None)
+    service = BloodBankService.from_database(db)
+
+    print(f"{donors} donors")
+    print(f"{'recipient':<10}{'ops/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'donors':>8}")
+    for group in BLOOD_GROUPS:
+        found = len(service.find_matches(group)["donors"])
+        rate, p50, p95 = time_operation(lambda i: service.find_matches(group), repeat)
+        print(f"{group:<10}{rate:>10,.0f}{p50:>10.3f}{p95:>10.3f}{found:>8}")
+
+
+def benchmark_eligibility(db, donors, repeat):
+    """Seed donors with spread-out last donations, then time single-donor checks and the eligible-today count.
+
+    Returns False if the count disagrees with the rules applied to the seeded data.
+    """
+    day = "2025-06-30"
+    cutoff = eligibility_cutoff(day)
+    expected = 0
+    for start in range(0, donors, SEED_BATCH_SIZE):
+        batch = []
+        for i in range(start, min(start + SEED_BATCH_SIZE, donors)):
+            donor = {"name": f"donor{i}", "name_key": f"donor{i}", "age": 16 + i % 55,
+                     "gender": "female", "blood_group": BLOOD_GROUPS[i % 8]}
+            if i % 5:
+                donor["last_donated"] = f"2025-{1 + i % 6:02d}-{1 + i % 28:02d}"
+            expected += (MIN_DONOR_AGE <= donor["age"] <= MAX_DONOR_AGE
+                         and donor.get("last_donated", "") <= cutoff)
+            batch.append(donor)
+        db['donors'].insert_many(batch)
+    bootstrap_schema(db, report=lambda message: None)
+    service = BloodBankService.from_database(db)
+    ids = [doc["_id"] for doc in db['donors'].find({}, {"_id": 1}).limit(repeat)]
+
+    print(f"{donors} donors")
+    rate, p50, p95 = time_operation(lambda i: service.donor_eligibility(ids[i % len(ids)], day), repeat)
+    print(f"single donor check: {rate:,.0f} ops/s  p50 {p50:.3f} ms  p95 {p95:.3f} ms")
+    start = time.perf_counter()
+    counted = sum(service.eligible_counts(day).values())
+    print(f"eligible on {day}: {counted} donors counted in {time.perf_counter() - start:.2f}s")
+    start = time.perf_counter()
+    streamed = sum(1 for _ in service.eligible_donors(day))
+    print(f"recall list: {streamed} donors streamed in {time.perf_counter() - start:.2f}s")
+    return counted == streamed == expected
+
+
+def benchmark_ledger(db, threads, ops, snapshots):
+    """Run service transactions from many threads in rounds, snapshotting the ledger between them, then reconcile.
+
+    Returns False if a snapshot was not taken, or the stock rebuilt from the latest snapshot
+    drifts from the live counters or from a replay of the whole ledger since it was opened.
+    """
+    bootstrap_schema(db, report=lambda message: None)
+    service = BloodBankService.from_database(db)
+    opening = service.snapshots.find_one({"opening": True})
+    for group in BLOOD_GROUPS:
+        service.process_transaction(group, "deposit", 100)
+    rounds = snapshots + 1
+
+    def clerk(seed):
+        rng = random.Random(seed)
+        for i in range(ops // rounds):
+            group = rng.choice(BLOOD_GROUPS)
+            try:
+                service.process_transaction(group, rng.choice(["collect", "deposit"]), rng.randint(1, 5))
+            except InventoryError:
+                pass
+
+    elapsed = 0.0
+    for round_no in range(rounds):
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(clerk, range(round_no * threads, (round_no + 1) * threads)))
+        elapsed += time.perf_counter() - start
+        if round_no < snapshots:
+            # Nothing is in flight between rounds, so the cut can be the present instead of LEDGER_SETTLE_SECONDS back
+            take_snapshot(service.ledger, service.snapshots, datetime.now() + timedelta(seconds=LEDGER_SETTLE_SECONDS))
+    total = threads * (ops // rounds) * rounds
+    taken = db["inventory_snapshots"].count_documents({"opening": {"$exists": False}})
+    print(f"{total} transactions in {elapsed:.2f}s ({total / elapsed:,.0f}/s) with {taken} snapshots")
+
+    start = time.perf_counter()
+    drift = service.reconcile_inventory()
+    print(f"reconcile from latest snapshot: {(time.perf_counter() - start) * 1000:.1f} ms")
+    start = time.perf_counter()
+    changes, count = ledger_changes(service.ledger, opening["position"])
+    replayed = add_totals(snapshot_totals(opening), changes)
+    print(f"replay of the full ledger: {(time.perf_counter() - start) * 1000:.1f} ms ({count} entries)")
+    rebuilt, latest = rebuild_inventory(service.ledger, service.snapshots)
+    for (branch, group), (live, from_snapshot) in sorted(drift.items()):
+        print(f"{branch} {group}: live {live}, ledger {from_snapshot}")
+    if taken != snapshots or latest.get("opening"):
+        print(f"expected {snapshots} snapshots after the opening one")
+        return False
+    if {key: units for key, units in rebuilt.items() if units} != {key: units for key, units in replayed.items() if units}:
+        print("stock rebuilt from the latest snapshot differs from a full replay")
+        return False
+    return not drift
+
+
+def benchmark_reports(db, uri, donations, months, workers):
+    """Seed donations over the last months, then time a cold report build, a cached rerun and a one-change rerun."""
+    from reports import generate_report, parse_period
+
+    today = datetime.now()
+    first = today.replace(day=1)
+    for _ in range(months - 1):
+        first = (first - timedelta(days=1)).replace(day=1)
+    span = (today - first).days + 1
+    for start in range(0, donations, SEED_BATCH_SIZE):
+        db['donations'].insert_many([
+            {"name": f"donor{i}", "name_key": f"donor{i}", "age": 30, "gender": "male",
+             "blood_group": BLOOD_GROUPS[i % 8], "units": 1, "branch_id": f"site{i % 7}",
+             "date": (first + timedelta(days=i % span)).strftime("%Y-%m-%d")}
+            for i in range(start, min(start + SEED_BATCH_SIZE, donations))
+        ])
+    bootstrap_schema(db, report=lambda message: None)
+    period = parse_period(f"{first:%Y-%m}:{today:%Y-%m}")
+    if not uri:
+        # Pool workers reach the data through their own client, which mongomock cannot share
+        workers = 1
+    for label in ("cold", "cached"):
+        start = time.perf_counter()
+        _, recomputed = generate_report(db, period, workers=workers, uri=uri, db_name=db.name)
+        print(f"{label:<8} {recomputed:>4} partitions recomputed in {time.perf_counter() - start:.2f}s")
+    BloodBankService.from_database(db).record_donation("bench", "30", "male", "O+", "1", force=True)
+    start = time.perf_counter()
+    _, recomputed = generate_report(db, period, workers=workers, uri=uri, db_name=db.name)
+    print(f"{'changed':<8} {recomputed:>4} partitions recomputed in {time.perf_counter() - start:.2f}s")
+    return recomputed == 1
+
+
+def benchmark_journal(db, threads, entries):
+    """Append deposits to an offline journal from many threads, then replay it twice.
+
+    Reports the append rate under group fsync and checks the second replay adds nothing.
+    """
+    path = os.path.join(tempfile.mkdtemp(), "journal.jsonl")
+    service = BloodBankService.from_database(db, journal=WriteJournal(path))
+    service.offline = True
+
+    def clerk(seed):
+        for i in range(entries):
+            service.process_transaction(BLOOD_GROUPS[(seed + i) % 8], "deposit", 1)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(clerk, range(threads)))
+    elapsed = time.perf_counter() - start
+    total = threads * entries
+    print(f"{total} journaled deposits on {threads} threads in {elapsed:.2f}s ({total / elapsed:,.0f} appends/s)")
+
+    # Replay the same entries twice, as after a crash between applying and finishing
+    entries_taken = service.journal.take()
+    start = time.perf_counter()
+    service.apply_journal_batch(entries_taken)
+    service.replay_journal()
+    elapsed = time.perf_counter() - start
+    stock = sum(doc["amount"] for doc in db['blood_inventory'].find())
+    guards = sum(len(doc.get("applied", [])) for doc in db['blood_inventory'].find())
+    print(f"replayed {total} entries twice in {elapsed:.2f}s, {stock} units in stock, {guards} replay guards left")
+    return stock == total and guards == 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--uri", help="MongoDB URI; mongomock is used when omitted")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    stress = commands.add_parser("stress", help="concurrent inventory transactions")
+    stress.add_argument("--threads", type=int, default=8)
+    stress.add_argument("--ops", type=int, default=1000, help="transactions per thread")
+    stress.add_argument("--initial", type=int, default=100, help="starting stock")
+
+    storage = commands.add_parser("storage", help="MongoDB and SQLite backends on the same operations")
+    storage.add_argument("--scales", type=int, nargs="+", default=[1000, 100000])
+    storage.add_argument("--repeat", type=int, default=500, help="calls per operation")
+
+    match = commands.add_parser("match", help="compatible donor matching latency")
+    match.add_argument("--donors", type=int, default=1000000)
+    match.add_argument("--repeat", type=int, default=200, help="lookups per recipient group")
+
+    eligibility = commands.add_parser("eligibility", help="donor deferral checks and eligible-today counts")
+    eligibility.add_argument("--donors", type=int, default=1000000)
+    eligibility.add_argument("--repeat", type=int, default=1000, help="single-donor checks to time")
+
+    ledger = commands.add_parser("ledger", help="inventory ledger under concurrency and snapshot reconcile time")
+    ledger.add_argument("--threads", type=int, default=8)
+    ledger.add_argument("--ops", type=int, default=500, help="transactions per thread")
+    ledger.add_argument("--snapshots", type=int, default=4, help="snapshots taken during the run")
+
+    reports = commands.add_parser("reports", help="monthly report build time, cold and from cached partitions")
+    reports.add_argument("--donations", type=int, default=100000)
+    reports.add_argument("--months", type=int, default=12)
+    reports.add_argument("--workers", type=int, default=os.cpu_count() or 2,
+                         help="report processes (1 without --uri)")
+
+    journal = commands.add_parser("journal", help="offline journal append rate and idempotent replay")
+    journal.add_argument("--threads", type=int, default=8)
+    journal.add_argument("--entries", type=int, default=1000, help="deposits per thread")
+
+    branch_stress = commands.add_parser("branches", help="write contention with writers spread over branches")
+    branch_stress.add_argument("--threads", type=int, default=16)
+    branch_stress.add_argument("--ops", type=int, default=500, help="transactions per thread")
+    branch_stress.add_argument("--branches", type=int, nargs="+", default=[1, 4, 16])
+
+    api = commands.add_parser("api", help="HTTP API throughput and latency")
+    api.add_argument("--url", help="running server to test; by default one is started on a seeded database")
+    api.add_argument("--concurrency", type=int, default=32)
+    api.add_argument("--requests", type=int, default=2000)
+    api.add_argument("--seed", type=int, default=1000, help="documents to seed when starting a server")
+
+    args = parser.parse_args(argv)
+    if args.command == "storage":
+        benchmark_storage(lambda: get_database(args.uri), args.scales, args.repeat)
+        return 0
+    if args.command == "branches":
+        if not stress_branches(lambda: get_database(args.uri), args.threads, args.ops, args.branches):
+            print("FAILED: branch inventory drifted under concurrency")
+            return 1
+        return 0
+
+    db = get_database(args.uri)
+    if args.command == "api":
+        url = args.url
+        if not url:
+            seed(db, args.seed)
+            url = start_api(BloodBankService.from_database(db))
+        return 0 if asyncio.run(load_test(url, args.concurrency, args.requests)) else 1
+    if args.command == "journal" and not benchmark_journal(db, args.threads, args.entries):
+        print("FAILED: replay counted units more than once")
+        return 1
+    if args.command == "eligibility" and not benchmark_eligibility(db, args.donors, args.repeat):
+        print("FAILED: eligible donor count disagrees with the deferral rules")
+        return 1
+    if args.command == "ledger" and not benchmark_ledger(db, args.threads, args.ops, args.snapshots):
+        print("FAILED: inventory drifted from the ledger")
+        return 1
+    if args.command == "reports" and not benchmark_reports(db, args.uri, args.donations, args.months, args.workers):
+        print("FAILED: one new donation should recompute exactly one partition")
+        return 1
+    if args.command == "match":
+        benchmark_matching(db, args.donors, args.repeat)
+    if args.command == "stress":
+        ok = stress_inventory(db, args.threads, args.ops, args.initial)
+        if not ok:
+            print("FAILED: inventory drifted under concurrency")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
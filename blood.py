@@ -1,691 +1,2047 @@
-from tkinter import messagebox, ttk
-from customtkinter import *
-from tkcalendar import Calendar
-from pymongo import MongoClient
-from datetime import datetime
-import tkinter as tk
-
-# Database setup
-try:
-    client = MongoClient("mongodb://localhost:27017/")
-    db = client['blood_bank']
-    users_collection = db['users']
-    donors_collection = db['donors']
-    donations_collection = db['donations']
-    inventory_collection = db['blood_inventory']
-except Exception as e:
-    print(f"Could not connect to MongoDB: {e}")
-    # Optionally, display a messagebox and exit gracefully.
-
-class App:
-    def __init__(self, root):
-        self.root = root
-        self.root.title("Blood Bank Management System")
-        self.root.after(0, lambda: root.state('zoomed'))
-
-        # Initialize current user
-        self.current_user = None
-
-        # Load login screen by default
-        self.show_login_screen()
-
-    def clear_frame(self):
-        """Clear all widgets in the root window."""
-        for widget in self.root.winfo_children():
-            widget.destroy()
-
-    def create_labeled_entry(self, master, label_text, is_password=False):
-        """Create a labeled entry with left-aligned label and reduced width entry."""
-        container = CTkFrame(master, fg_color="transparent")
-        container.pack(fill="x", padx=50, pady=5)
-
-        label = CTkLabel(container, text=label_text, anchor="w", text_color="#E5E7E9")
-        label.pack(side="left", padx=(0, 10))
-
-        entry_kwargs = {
-            "width": 200,
-            "show": "*",
-            "fg_color": "#2C3E50",
-            "border_color": "#34495E",
-            "text_color": "#ECF0F1"
-        } if is_password else {
-            "width": 200,
-            "fg_color": "#2C3E50",
-            "border_color": "#34495E",
-            "text_color": "#ECF0F1"
-        }
-        entry = CTkEntry(container, **entry_kwargs)
-        entry.pack(side="right")
-
-        return entry
-
-    def show_login_screen(self):
-        self.clear_frame()
-        frame = CTkFrame(master=self.root, width=400, height=500, fg_color="#2C3E50")
-        frame.place(relx=0.5, rely=0.5, anchor="center")
-
-        CTkLabel(master=frame, text="Login", font=("Arial", 24), text_color="#ECF0F1").pack(pady=20)
-
-        username_entry = self.create_labeled_entry(frame, "Username")
-        password_entry = self.create_labeled_entry(frame, "Password", is_password=True)
-
-        def login_action():
-            username = username_entry.get()
-            password = password_entry.get()
-
-            if not username or not password:
-                messagebox.showerror("Input Error", "All fields are required.")
-                return
-
-            user = users_collection.find_one({"name": username, "password": password})
-
-            if user:
-                self.current_user = username
-                messagebox.showinfo("Success", f"Welcome, {username}!")
-                self.show_dashboard()
-            else:
-                messagebox.showerror("Login Error", "Invalid credentials.")
-
-        CTkButton(
-            master=frame,
-            text="Login",
-            command=login_action,
-            fg_color="#E74C3C",
-            hover_color="#C0392B"
-        ).pack(pady=20)
-
-        CTkLabel(master=frame, text="Don't have an account? Sign up.", text_color="#BDC3C7").pack()
-
-        CTkButton(
-            master=frame,
-            text="Sign Up",
-            command=self.show_signup_screen,
-            fg_color="#3498DB",
-            hover_color="#2980B9"
-        ).pack(pady=10)
-
-    def show_signup_screen(self):
-        self.clear_frame()
-        frame = CTkFrame(master=self.root, width=400, height=600)
-        frame.place(relx=0.5, rely=0.5, anchor="center")
-
-        CTkLabel(master=frame, text="Sign Up", font=("Arial", 24)).pack(pady=20)
-
-        username_entry = self.create_labeled_entry(frame, "Username")
-        password_entry = self.create_labeled_entry(frame, "Password", is_password=True)
-
-        dob_label = CTkLabel(master=frame, text="Date of Birth")
-        dob_label.pack(pady=5)
-
-        dob_entry = CTkEntry(master=frame, width=200, state="readonly")
-        dob_entry.pack(pady=5)
-
-        cal = Calendar(frame, selectmode="day", date_pattern="y-mm-dd")
-        cal.pack(pady=10)
-
-        def select_date():
-            dob_entry.configure(state="normal")
-            dob_entry.delete(0, "end")
-            dob_entry.insert(0, cal.get_date())
-            dob_entry.configure(state="readonly")
-
-        CTkButton(master=frame, text="Select Date", command=select_date).pack(pady=10)
-
-        def signup_action():
-            username = username_entry.get()
-            password = password_entry.get()
-            dob = dob_entry.get()
-
-            if not username or not password or not dob:
-                messagebox.showerror("Input Error", "All fields are required.")
-                return
-
-            # Prevent duplicate usernames
-            if users_collection.find_one({"name": username}):
-                messagebox.showerror("Duplicate", "Username already exists.")
-                return
-
-            document = {"name": username, "password": password, "dob": dob}
-            users_collection.insert_one(document)
-
-            messagebox.showinfo("Success", "Account created successfully!")
-            self.show_login_screen()
-
-        CTkButton(master=frame, text="Sign Up", command=signup_action).pack(pady=10)
-        CTkButton(master=frame, text="Back to Login", command=self.show_login_screen).pack(pady=10)
-
-    def show_dashboard(self):
-        self.clear_frame()
-        content_frame = CTkFrame(self.root, fg_color="#1C2833")
-        content_frame.pack(expand=True, fill="both", padx=10, pady=10)
-        self.show_home(content_frame)
-
-    def show_home(self, frame):
-        for widget in frame.winfo_children():
-            widget.destroy()
-
-        main_container = CTkFrame(frame, fg_color="transparent")
-        main_container.pack(expand=True, fill="both", padx=20, pady=20)
-
-        welcome_frame = CTkFrame(main_container, fg_color="#2C3E50", corner_radius=15)
-        welcome_frame.pack(fill="x", pady=10)
-
-        CTkLabel(
-            welcome_frame,
-            text="Welcome to Blood Bank Management System",
-            font=("Arial", 24, "bold"),
-            text_color="#ECF0F1"
-        ).pack(pady=20)
-
-        if self.current_user:
-            CTkLabel(
-                welcome_frame,
-                text=f"Logged in as: {self.current_user}",
-                font=("Arial", 16),
-                text_color="#BDC3C7"
-            ).pack(pady=10)
-
-        stats_frame = CTkFrame(main_container, fg_color="#34495E", corner_radius=15)
-        stats_frame.pack(fill="x", pady=10)
-
-        total_donors = donors_collection.count_documents({})
-        total_donations = donations_collection.count_documents({})
-
-        stats = [
-            ("Total Donors", total_donors),
-            ("Total Blood Donations", total_donations)
-        ]
-
-        for label, value in stats:
-            stat_container = CTkFrame(stats_frame, fg_color="transparent")
-            stat_container.pack(pady=10, padx=20, fill="x")
-
-            CTkLabel(stat_container, text=label, font=("Arial", 16), text_color="#ECF0F1").pack(side="left")
-            CTkLabel(stat_container, text=str(value), font=("Arial", 16, "bold"), text_color="#E74C3C").pack(side="right")
-
-        nav_frame = CTkFrame(main_container, fg_color="transparent")
-        nav_frame.pack(fill="x", pady=10)
-
-        nav_buttons = [
-            ("Donor", "#3498DB", lambda: self.show_donor_section(frame)),
-            ("Blood Donations", "#2ECC71", lambda: self.show_blood_donations_section(frame)),
-            ("Blood Bank", "#E74C3C", lambda: self.show_blood_bank_window(frame))
-        ]
-
-        for text, color, command in nav_buttons:
-            CTkButton(
-                nav_frame,
-                text=text,
-                command=command,
-                width=150,
-                height=50,
-                fg_color=color,
-                hover_color="#2C3E50" if color == "#3498DB" else "#27AE60" if color == "#2ECC71" else "#C0392B",
-                font=("Arial", 16)
-            ).pack(side="left", expand=True, padx=5, pady=10)
-
-        logout_button = CTkButton(
-            main_container,
-            text="Logout",
-            command=self.show_login_screen,
-            fg_color="#E74C3C",
-            hover_color="#C0392B",
-            font=("Arial", 16),
-            width=200,
-            height=50
-        )
-        logout_button.pack(pady=20)
-
-    def create_table(self, parent, columns, data):
-        table_frame = CTkFrame(parent, fg_color="transparent")
-        table_frame.pack(fill="both", expand=True, padx=10, pady=10)
-
-        style = ttk.Style()
-        style.theme_use('default')
-        style.configure(
-            "Custom.Treeview",
-            background="#2C3E50",
-            foreground="#ECF0F1",
-            fieldbackground="#2C3E50"
-        )
-        style.map(
-            "Custom.Treeview",
-            background=[('selected', '#E74C3C')]
-        )
-
-        scrollbar = ttk.Scrollbar(table_frame)
-        scrollbar.pack(side="right", fill="y")
-
-        tree = ttk.Treeview(
-            table_frame,
-            columns=columns,
-            show="headings",
-            height=10,
-            style="Custom.Treeview",
-            yscrollcommand=scrollbar.set
-        )
-        tree.pack(fill="both", expand=True)
-        scrollbar.config(command=tree.yview)
-
-        for col in columns:
-            tree.heading(col, text=col, anchor="center")
-            tree.column(col, anchor="center", width=120)
-
-        for row in data:
-            tree.insert("", "end", values=row)
-
-        return tree
-
-    def show_donor_section(self, frame):
-        for widget in frame.winfo_children():
-            widget.destroy()
-
-        entry_frame = CTkFrame(frame, fg_color="#2C3E50", corner_radius=10)
-        entry_frame.pack(fill="x", padx=10, pady=10)
-
-        CTkLabel(entry_frame, text="Add Donor", font=("Arial", 16), text_color="#ECF0F1").pack(pady=10)
-
-        entries = {}
-
-        name_container = CTkFrame(entry_frame, fg_color="transparent")
-        name_container.pack(fill="x", padx=50, pady=5)
-        CTkLabel(name_container, text="Name", text_color="#E5E7E9").pack(side="left", padx=(0, 10))
-        name_entry = CTkEntry(
-            name_container,
-            width=200,
-            fg_color="#34495E",
-            border_color="#2C3E50",
-            text_color="#ECF0F1"
-        )
-        name_entry.pack(side="right")
-        entries['name'] = name_entry
-
-        age_container = CTkFrame(entry_frame, fg_color="transparent")
-        age_container.pack(fill="x", padx=50, pady=5)
-        CTkLabel(age_container, text="Age", text_color="#E5E7E9").pack(side="left", padx=(0, 10))
-        age_entry = CTkEntry(
-            age_container,
-            width=200,
-            fg_color="#34495E",
-            border_color="#2C3E50",
-            text_color="#ECF0F1"
-        )
-        age_entry.pack(side="right")
-        entries['age'] = age_entry
-
-        gender_frame = CTkFrame(entry_frame, fg_color="transparent")
-        gender_frame.pack(fill="x", padx=50, pady=5)
-        CTkLabel(gender_frame, text="Gender", text_color="#E5E7E9").pack(side="left", padx=(0, 10))
-
-        gender_var = tk.StringVar(value="prefer_not_to_say")
-        gender_radio_frame = CTkFrame(gender_frame, fg_color="transparent")
-        gender_radio_frame.pack(side="right")
-
-        male_radio = CTkRadioButton(gender_radio_frame, text="Male", variable=gender_var, value="male")
-        female_radio = CTkRadioButton(gender_radio_frame, text="Female", variable=gender_var, value="female")
-        prefer_not_radio = CTkRadioButton(gender_radio_frame, text="Prefer Not to Say", variable=gender_var, value="prefer_not_to_say")
-
-        male_radio.pack(side="left", padx=5)
-        female_radio.pack(side="left", padx=5)
-        prefer_not_radio.pack(side="left", padx=5)
-
-        blood_groups = ['A+', 'A-', 'B+', 'B-', 'AB+', 'AB-', 'O+', 'O-']
-        blood_group_container = CTkFrame(entry_frame, fg_color="transparent")
-        blood_group_container.pack(fill="x", padx=50, pady=5)
-        CTkLabel(blood_group_container, text="Blood Group", text_color="#E5E7E9").pack(side="left", padx=(0, 10))
-
-        blood_group_var = tk.StringVar(value=blood_groups[0])
-        blood_group_dropdown = CTkOptionMenu(
-            blood_group_container,
-            values=blood_groups,
-            variable=blood_group_var,
-            fg_color="#34495E",
-            text_color="#ECF0F1"
-        )
-        blood_group_dropdown.pack(side="right")
-
-        def add_donor():
-            name = name_entry.get()
-            age = age_entry.get()
-            gender = gender_var.get()
-            blood_group = blood_group_var.get()
-            # Validate input
-            if not name or not age or not gender or not blood_group:
-                messagebox.showerror("Error", "All fields are required")
-                return
-            try:
-                age_int = int(age)
-            except ValueError:
-                messagebox.showerror("Error", "Age must be a number")
-                return
-            donor_data = {
-                'name': name,
-                'age': age_int,
-                'gender': gender,
-                'blood_group': blood_group
-            }
-            donors_collection.insert_one(donor_data)
-            messagebox.showinfo("Success", "Donor added successfully!")
-            self.show_donor_section(frame)
-
-        CTkButton(
-            entry_frame,
-            text="Add Donor",
-            command=add_donor,
-            fg_color="#E74C3C",
-            hover_color="#C0392B"
-        ).pack(pady=10)
-
-        CTkLabel(frame, text="Donor List", font=("Arial", 16), text_color="#ECF0F1").pack(pady=10)
-        columns = ["Name", "Age", "Gender", "Blood Group"]
-        donor_data = list(donors_collection.find({}, {"_id": 0}))
-        donor_rows = [[d.get(col.lower().replace(" ", "_"), "") for col in columns] for d in donor_data]
-        self.create_table(frame, columns, donor_rows)
-        back_frame = CTkFrame(frame, fg_color="transparent")
-        back_frame.pack(fill="x", padx=10, pady=5, anchor="w")
-        back_button = CTkButton(
-            back_frame,
-            text="← Back to Home",
-            command=lambda: self.show_home(frame),
-            fg_color="#34495E",
-            hover_color="#2C3E50",
-            font=("Arial", 12)
-        )
-        back_button.pack(side="left", padx=10)
-
-    def show_blood_donations_section(self, frame):
-        for widget in frame.winfo_children():
-            widget.destroy()
-
-        entry_frame = CTkFrame(frame, fg_color="#2C3E50", corner_radius=10)
-        entry_frame.pack(fill="x", padx=10, pady=10)
-
-        CTkLabel(entry_frame, text="Add Blood Donation", font=("Arial", 16), text_color="#ECF0F1").pack(pady=10)
-
-        blood_groups = ['A+', 'A-', 'B+', 'B-', 'AB+', 'AB-', 'O+', 'O-']
-
-        name_container = CTkFrame(entry_frame, fg_color="transparent")
-        name_container.pack(fill="x", padx=50, pady=5)
-        CTkLabel(name_container, text="Name", text_color="#E5E7E9").pack(side="left", padx=(0, 10))
-        name_entry = CTkEntry(
-            name_container,
-            width=200,
-            fg_color="#34495E",
-            border_color="#2C3E50",
-            text_color="#ECF0F1"
-        )
-        name_entry.pack(side="right")
-
-        age_container = CTkFrame(entry_frame, fg_color="transparent")
-        age_container.pack(fill="x", padx=50, pady=5)
-        CTkLabel(age_container, text="Age", text_color="#E5E7E9").pack(side="left", padx=(0, 10))
-        age_entry = CTkEntry(
-            age_container,
-            width=200,
-            fg_color="#34495E",
-            border_color="#2C3E50",
-            text_color="#ECF0F1"
-        )
-        age_entry.pack(side="right")
-
-        units_container = CTkFrame(entry_frame, fg_color="transparent")
-        units_container.pack(fill="x", padx=50, pady=5)
-        CTkLabel(units_container, text="Units", text_color="#E5E7E9").pack(side="left", padx=(0, 10))
-        units_entry = CTkEntry(
-            units_container,
-            width=200,
-            fg_color="#34495E",
-            border_color="#2C3E50",
-            text_color="#ECF0F1"
-        )
-        units_entry.pack(side="right")
-
-        gender_frame = CTkFrame(entry_frame, fg_color="transparent")
-        gender_frame.pack(fill="x", padx=50, pady=5)
-        CTkLabel(gender_frame, text="Gender", text_color="#E5E7E9").pack(side="left", padx=(0, 10))
-
-        gender_var = tk.StringVar(value="prefer_not_to_say")
-        gender_radio_frame = CTkFrame(gender_frame, fg_color="transparent")
-        gender_radio_frame.pack(side="right")
-
-        male_radio = CTkRadioButton(gender_radio_frame, text="Male", variable=gender_var, value="male")
-        female_radio = CTkRadioButton(gender_radio_frame, text="Female", variable=gender_var, value="female")
-        prefer_not_radio = CTkRadioButton(gender_radio_frame, text="Prefer Not to Say", variable=gender_var, value="prefer_not_to_say")
-
-        male_radio.pack(side="left", padx=5)
-        female_radio.pack(side="left", padx=5)
-        prefer_not_radio.pack(side="left", padx=5)
-
-        blood_group_container = CTkFrame(entry_frame, fg_color="transparent")
-        blood_group_container.pack(fill="x", padx=50, pady=5)
-        CTkLabel(blood_group_container, text="Blood Group", text_color="#E5E7E9").pack(side="left", padx=(0, 10))
-
-        blood_group_var = tk.StringVar(value=blood_groups[0])
-        blood_group_dropdown = CTkOptionMenu(
-            blood_group_container,
-            values=blood_groups,
-            variable=blood_group_var,
-            fg_color="#34495E",
-            text_color="#ECF0F1"
-        )
-        blood_group_dropdown.pack(side="right")
-
-        def add_donation():
-            name = name_entry.get()
-            age = age_entry.get()
-            gender = gender_var.get()
-            blood_group = blood_group_var.get()
-            units_str = units_entry.get()
-            if not name or not age or not gender or not blood_group or not units_str:
-                messagebox.showerror("Error", "All fields are required")
-                return
-            try:
-                age_int = int(age)
-                units = int(units_str)
-            except ValueError:
-                messagebox.showerror("Error", "Age and Units must be numbers")
-                return
-            donation_data = {
-                'name': name,
-                'age': age_int,
-                'gender': gender,
-                'blood_group': blood_group,
-                'units': units,
-                'date': datetime.now().strftime("%Y-%m-%d")
-            }
-            try:
-                donations_collection.insert_one(donation_data)
-                inventory_collection.find_one_and_update(
-                    {"blood_group": donation_data['blood_group']},
-                    {"$inc": {"amount": units}},
-                    upsert=True,
-                    return_document=True
-                )
-                messagebox.showinfo("Success", "Blood Donation recorded successfully!")
-                self.show_blood_donations_section(frame)
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to record donation: {str(e)}")
-
-        CTkButton(
-            entry_frame,
-            text="Record Donation",
-            command=add_donation,
-            fg_color="#2ECC71",
-            hover_color="#27AE60"
-        ).pack(pady=10)
-
-        CTkLabel(frame, text="Blood Donations", font=("Arial", 16), text_color="#ECF0F1").pack(pady=10)
-        columns = ["Name", "Age", "Gender", "Blood Group", "Units", "Date"]
-        donation_data = list(donations_collection.find({}, {"_id": 0}))
-        donation_rows = [[d.get(col.lower().replace(" ", "_"), "") for col in columns] for d in donation_data]
-        self.create_table(frame, columns, donation_rows)
-        back_frame = CTkFrame(frame, fg_color="transparent")
-        back_frame.pack(fill="x", padx=10, pady=5, anchor="w")
-        back_button = CTkButton(
-            back_frame,
-            text="← Back to Home",
-            command=lambda: self.show_home(frame),
-            fg_color="#34495E",
-            hover_color="#2C3E50",
-            font=("Arial", 12)
-        )
-        back_button.pack(side="left", padx=10)
-
-    def show_blood_bank_window(self, frame):
-        for widget in frame.winfo_children():
-            widget.destroy()
-
-        inventory_frame = CTkFrame(frame, fg_color="#2C3E50", corner_radius=10)
-        inventory_frame.pack(fill="x", padx=10, pady=10)
-
-        blood_groups = ['A+', 'A-', 'B+', 'B-', 'AB+', 'AB-', 'O+', 'O-']
-
-        CTkLabel(
-            inventory_frame,
-            text="Blood Bank Inventory",
-            font=("Arial", 24, "bold"),
-            text_color="#ECF0F1"
-        ).pack(pady=20)
-
-        grid_frame = CTkFrame(inventory_frame, fg_color="transparent")
-        grid_frame.pack(expand=True, fill="both", padx=20, pady=10)
-
-        def create_transaction_window(blood_group):
-            transaction_window = CTkToplevel(self.root)
-            transaction_window.title("Blood Transaction")
-            transaction_window.geometry("400x600")
-            transaction_window.configure(fg_color="#1C2833")
-            transaction_window.transient(self.root)
-            transaction_window.grab_set()
-
-            CTkLabel(transaction_window, text="Transaction Type", font=("Arial", 16), text_color="#ECF0F1").pack(pady=10)
-            transaction_var = tk.StringVar(value="collect")
-            collect_radio = CTkRadioButton(transaction_window, text="Collect", variable=transaction_var, value="collect")
-            deposit_radio = CTkRadioButton(transaction_window, text="Deposit", variable=transaction_var, value="deposit")
-            collect_radio.pack(pady=5)
-            deposit_radio.pack(pady=5)
-
-            blood_group_frame = CTkFrame(transaction_window, fg_color="transparent")
-            blood_group_frame.pack(fill="x", padx=50, pady=5)
-            CTkLabel(blood_group_frame, text="Blood Group", text_color="#E5E7E9").pack(side="left", padx=(0, 10))
-            blood_group_var = tk.StringVar(value=blood_group)
-            blood_group_dropdown = CTkOptionMenu(
-                blood_group_frame,
-                values=blood_groups,
-                variable=blood_group_var,
-                fg_color="#34495E",
-                button_color="#2C3E50",
-                text_color="#ECF0F1"
-            )
-            blood_group_dropdown.pack(side="right")
-
-            name_frame = CTkFrame(transaction_window, fg_color="transparent")
-            name_frame.pack(fill="x", padx=50, pady=5)
-            CTkLabel(name_frame, text="Name", text_color="#E5E7E9").pack(side="left", padx=(0, 10))
-            name_entry = CTkEntry(
-                name_frame,
-                width=200,
-                fg_color="#34495E",
-                border_color="#2C3E50",
-                text_color="#ECF0F1"
-            )
-            name_entry.pack(side="right")
-
-            amount_frame = CTkFrame(transaction_window, fg_color="transparent")
-            amount_frame.pack(fill="x", padx=50, pady=5)
-            CTkLabel(amount_frame, text="Amount (Units)", text_color="#E5E7E9").pack(side="left", padx=(0, 10))
-            amount_entry = CTkEntry(
-                amount_frame,
-                width=200,
-                fg_color="#34495E",
-                border_color="#2C3E50",
-                text_color="#ECF0F1"
-            )
-            amount_entry.pack(side="right")
-
-            def process_transaction():
-                transaction_type = transaction_var.get()
-                blood_group_sel = blood_group_var.get()
-                name = name_entry.get()
-                amount = amount_entry.get()
-                if not name or not amount:
-                    messagebox.showerror("Error", "All fields are required")
-                    return
-                try:
-                    amount = int(amount)
-                except ValueError:
-                    messagebox.showerror("Error", "Amount must be a number")
-                    return
-                current_inventory = inventory_collection.find_one({"blood_group": blood_group_sel})
-                if current_inventory is None:
-                    messagebox.showerror("Error", f"No inventory found for {blood_group_sel} blood group")
-                    return
-                current_amount = current_inventory.get('amount', 0)
-                if transaction_type == "collect":
-                    if amount > current_amount:
-                        messagebox.showerror("Error", f"Insufficient {blood_group_sel} blood units")
-                        return
-                    new_amount = current_amount - amount
-                else:
-                    new_amount = current_amount + amount
-                inventory_collection.update_one(
-                    {"blood_group": blood_group_sel},
-                    {"$set": {"amount": new_amount}}
-                )
-                messagebox.showinfo("Success", f"{transaction_type.capitalize()} transaction processed for {blood_group_sel}!")
-                transaction_window.destroy()
-                self.show_blood_bank_window(frame)
-
-            CTkButton(
-                transaction_window,
-                text="Process Transaction",
-                command=process_transaction,
-                fg_color="#2ECC71",
-                hover_color="#27AE60"
-            ).pack(pady=20)
-            CTkButton(
-                transaction_window,
-                text="Cancel",
-                command=lambda: transaction_window.destroy(),
-                fg_color="#E74C3C",
-                hover_color="#C0392B"
-            ).pack(pady=20)
-
-        for i, blood_group in enumerate(blood_groups):
-            inventory_count = inventory_collection.find_one({"blood_group": blood_group})
-            count = inventory_count['amount'] if inventory_count else 0
-
-            group_frame = CTkFrame(grid_frame, fg_color="#34495E")
-            group_frame.grid(row=i//4, column=i%4, padx=5, pady=5, sticky="nsew")
-
-            CTkLabel(group_frame, text=blood_group, font=("Arial", 16), text_color="#ECF0F1").pack(pady=5)
-            amount_label = CTkLabel(group_frame, text=f"{count} Units", font=("Arial", 14), text_color="#E74C3C")
-            amount_label.pack(pady=5)
-            CTkButton(
-                group_frame,
-                text="Collect/Borrow",
-                command=lambda bg=blood_group: create_transaction_window(bg),
-                fg_color="#E74C3C",
-                hover_color="#C0392B"
-            ).pack(pady=5)
-
-        for i in range(2):
-            grid_frame.grid_rowconfigure(i, weight=1)
-        for i in range(4):
-            grid_frame.grid_columnconfigure(i, weight=1)
-        back_frame = CTkFrame(frame, fg_color="transparent")
-        back_frame.pack(fill="x", padx=10, pady=5, anchor="w")
-        back_button = CTkButton(
-            back_frame,
-            text="← Back to Home",
-            command=lambda: self.show_home(frame),
-            fg_color="#34495E",
-            hover_color="#2C3E50",
-            font=("Arial", 12)
-        )
-        back_button.pack(padx=10)
-
-if __name__ == "__main__":
-    root = CTk()
-    app = App(root)
-    root.mainloop()
+import time
+
+# (step, time.perf_counter()) pairs reported by --profile-startup
+STARTUP_MARKS = [("start", time.perf_counter())]
+
+from tkinter import filedialog, messagebox, simpledialog, ttk
+from customtkinter import *
+STARTUP_MARKS.append(("import customtkinter", time.perf_counter()))
+from collections import deque
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+import tkinter as tk
+import argparse
+import atexit
+import csv
+import os
+import queue
+import threading
+
+from services import (
+    BLOOD_GROUPS,
+    DEFAULT_BRANCH,
+    EXPORT_FIELDS,
+    IMPORT_BATCH_SIZE,
+    IMPORT_FIELDS,
+    METRICS_ENABLED,
+    METRICS_FILE,
+    STORAGE_BACKEND,
+    BloodBankService,
+    DeferralError,
+    InstrumentedDatabase,
+    InsufficientStockError,
+    InventoryError,
+    Metrics,
+    PyMongoError,
+    StockAlerts,
+    WriteJournal,
+    backfill_rollups,
+    bootstrap_schema,
+    check_query_plans,
+    connect,
+    export_collection,
+    import_file,
+    keyset_filter,
+    link_donations,
+    rollback_donation_links,
+    search_filter,
+    validate_donation,
+    validate_donor,
+)
+# api, reports and storage are imported where --serve, the reports and other backends use them, so the
+# GUI does not load them at startup and spawned report workers do not load them again
+STARTUP_MARKS.append(("import services, pymongo", time.perf_counter()))
+
+# Database setup: the client connects on first use, so this never waits for the server
+metrics = Metrics() if METRICS_ENABLED else None
+try:
+    client = connect()
+    db = client['blood_bank']
+    if metrics:
+        db = InstrumentedDatabase(db, metrics)
+    # The offline journal is opened by the GUI and --serve only; see start_journal()
+    service = BloodBankService.from_database(db, alerts=StockAlerts())
+except Exception as e:
+    print(f"Could not connect to MongoDB: {e}")
+    # Optionally, display a messagebox and exit gracefully.
+STARTUP_MARKS.append(("create client", time.perf_counter()))
+
+def start_journal():
+    """Open the offline write journal (and its fsync thread) for a long-running session."""
+    service.journal = WriteJournal()
+
+
+# Tables load this many rows per query and keep at most MAX_LOADED_PAGES pages in the widget
+PAGE_SIZE = 200
+MAX_LOADED_PAGES = 5
+
+# Number of database queries allowed to run at the same time
+QUERY_WORKERS = int(os.environ.get("BLOOD_BANK_QUERY_WORKERS", "4"))
+# How often (ms) the Tk thread picks up finished queries
+RESULT_POLL_MS = 20
+# Pause in typing (ms) before a search query is sent
+SEARCH_DEBOUNCE_MS = 300
+# Wait (ms) before pinging an unreachable server again
+RECONNECT_MS = 5000
+OFFLINE_MESSAGE = ("The database is unreachable. The record was saved on this computer "
+                   "and will be uploaded automatically when the connection returns.")
+# Refresh interval (ms) of the diagnostics panel (Ctrl+Shift+D when BLOOD_BANK_METRICS=1)
+DIAGNOSTICS_REFRESH_MS = 1000
+
+
+def mark_startup(step):
+    STARTUP_MARKS.append((step, time.perf_counter()))
+
+
+def print_startup_profile():
+    start = STARTUP_MARKS[0][1]
+    previous = start
+    for step, at in sorted(STARTUP_MARKS[1:], key=lambda mark: mark[1]):
+        print(f"{step:<28}{(at - previous) * 1000:>9.1f} ms{(at - start) * 1000:>10.1f} ms total")
+        previous = at
+
+
+class DataWorker:
+    """Run database calls on a thread pool and deliver their results on the Tk thread."""
+
+    def __init__(self, root, max_workers=QUERY_WORKERS):
+        self.root = root
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="db")
+        self.results = queue.Queue()
+        self.calls = queue.Queue()
+        self.pending = set()
+        # Bumped on navigation so results for screens that are gone get dropped
+        self.generation = 0
+        self.root.after(RESULT_POLL_MS, self.drain)
+
+    def submit(self, fn, on_success, on_error=None, keep=False):
+        """Run fn in the pool; with keep the result is delivered even after navigation."""
+        generation = None if keep else self.generation
+        future = self.executor.submit(fn)
+        self.pending.add(future)
+        future.add_done_callback(lambda f: self.results.put((generation, f, on_success, on_error)))
+        return future
+
+    def call_soon(self, fn, *args, keep=False):
+        """Run fn on the Tk thread; safe to call from a worker thread (e.g. for progress updates).
+
+        With keep the call still runs after navigation.
+        """
+        self.calls.put((None if keep else self.generation, fn, args))
+
+    def cancel_pending(self):
+        """Cancel queries that have not started yet and ignore the results of running ones."""
+        self.generation += 1
+        for future in self.pending:
+            future.cancel()
+        self.pending.clear()
+
+    def drain(self):
+        try:
+            while True:
+                try:
+                    generation, future, on_success, on_error = self.results.get_nowait()
+                except queue.Empty:
+                    break
+                self.pending.discard(future)
+                if generation not in (None, self.generation) or future.cancelled():
+                    continue
+                error = future.exception()
+                if error is None:
+                    on_success(future.result())
+                elif on_error:
+                    on_error(error)
+                else:
+                    messagebox.showerror("Database Error", str(error))
+            while True:
+                try:
+                    generation, fn, args = self.calls.get_nowait()
+                except queue.Empty:
+                    break
+                if generation in (None, self.generation):
+                    fn(*args)
+        finally:
+            self.root.after(RESULT_POLL_MS, self.drain)
+
+    def shutdown(self):
+        self.cancel_pending()
+        self.executor.shutdown(wait=False)
+
+
+class VirtualTable:
+    """Treeview backed by keyset-paginated queries instead of a full in-memory list.
+
+    Rows come from collection, or from pages(anchor, forward, limit) on storage backends without
+    MongoDB collections (Storage.list_page(); _id order only, no search).
+    """
+
+    def __init__(self, tree, scrollbar, worker, collection, fields, query=None, sort=None, metrics=None, pages=None):
+        self.tree = tree
+        self.worker = worker
+        self.scrollbar = scrollbar
+        self.collection = collection
+        self.pages_source = pages
+        self.fields = fields
+        self.query = query or {}
+        self.set_sort(sort)
+
+        # Each page is [first_key, last_key, item_ids] in display order
+        self.pages = deque()
+        self.at_start = True
+        self.at_end = False
+        self.loading = False
+        # Bumped by reload() so pages requested for an old query are discarded
+        self.generation = 0
+
+        if metrics and collection is not None:
+            # Time the tree.insert work per page, separately from the query that fetched it
+            self.show_next = metrics.timed(f"render.{collection.name}.show_next", self.show_next, count=len)
+            self.show_previous = metrics.timed(f"render.{collection.name}.show_previous", self.show_previous, count=len)
+
+        tree.configure(yscrollcommand=self.on_scroll)
+        self.load_next()
+
+    def set_sort(self, sort):
+        self.sort = sort or [("_id", 1)]
+        # Only the displayed columns plus the sort keys travel over the wire
+        self.projection = {field: 1 for field in self.fields}
+        self.projection.update({field: 1 for field, _ in self.sort})
+
+    def fetch(self, anchor, forward):
+        if self.pages_source is not None:
+            return self.pages_source(anchor, forward, PAGE_SIZE)
+        query = self.query
+        if anchor is not None:
+            keyset = keyset_filter(self.sort, anchor, forward)
+            query = {"$and": [self.query, keyset]} if self.query else keyset
+        sort = self.sort if forward else [(field, -direction) for field, direction in self.sort]
+        docs = list(self.collection.find(query, self.projection).sort(sort).limit(PAGE_SIZE))
+        if not forward:
+            docs.reverse()
+        return docs
+
+    def sort_key(self, doc):
+        return {field: doc.get(field) for field, _ in self.sort}
+
+    def row_values(self, doc):
+        return [doc.get(field, "") for field in self.fields]
+
+    def top_item(self):
+        return self.tree.identify_row(1) or None
+
+    def restore_top(self, item):
+        """Scroll so that item is the first visible row again after rows were added or removed above it."""
+        if item and self.tree.exists(item):
+            self.tree.yview_moveto(0)
+            self.tree.yview_scroll(self.tree.index(item), "units")
+
+    def load_next(self):
+        self.loading = True
+        anchor = self.pages[-1][1] if self.pages else None
+        placeholder = self.tree.insert("", "end", values=["Loading..."])
+        self.start_fetch(anchor, True, placeholder, self.show_next)
+
+    def load_previous(self):
+        if not self.pages:
+            return
+        self.loading = True
+        placeholder = self.tree.insert("", 0, values=["Loading..."])
+        self.start_fetch(self.pages[0][0], False, placeholder, self.show_previous)
+
+    def start_fetch(self, anchor, forward, placeholder, show):
+        generation = self.generation
+
+        def done(docs):
+            if generation != self.generation or not self.tree.winfo_exists():
+                return
+            self.loading = False
+            self.tree.delete(placeholder)
+            show(docs)
+
+        def failed(error):
+            if generation != self.generation or not self.tree.winfo_exists():
+                return
+            self.loading = False
+            self.tree.item(placeholder, values=[f"Failed to load: {error}"])
+
+        self.worker.submit(lambda: self.fetch(anchor, forward), done, failed)
+
+    def show_next(self, docs):
+        if len(docs) < PAGE_SIZE:
+            self.at_end = True
+        if not docs:
+            return
+        items = [self.tree.insert("", "end", values=self.row_values(d)) for d in docs]
+        self.pages.append([self.sort_key(docs[0]), self.sort_key(docs[-1]), items])
+
+        if len(self.pages) > MAX_LOADED_PAGES:
+            top = self.top_item()
+            self.tree.delete(*self.pages.popleft()[2])
+            self.at_start = False
+            self.restore_top(top)
+
+    def show_previous(self, docs):
+        if len(docs) < PAGE_SIZE:
+            self.at_start = True
+        if not docs:
+            return
+        top = self.top_item()
+        items = [self.tree.insert("", i, values=self.row_values(d)) for i, d in enumerate(docs)]
+        self.pages.appendleft([self.sort_key(docs[0]), self.sort_key(docs[-1]), items])
+
+        if len(self.pages) > MAX_LOADED_PAGES:
+            self.tree.delete(*self.pages.pop()[2])
+            self.at_end = False
+        self.restore_top(top)
+
+    def append_row(self, doc):
+        """Show a newly inserted document that sorts last, without re-querying.
+
+        When the loaded window does not reach the end yet, or a search is active, the row
+        arrives with the page that holds it.
+        """
+        if not self.at_end or self.loading or self.query:
+            return
+        item = self.tree.insert("", "end", values=self.row_values(doc))
+        if self.pages:
+            self.pages[-1][1] = self.sort_key(doc)
+            self.pages[-1][2].append(item)
+        else:
+            self.pages.append([self.sort_key(doc), self.sort_key(doc), [item]])
+
+    def reload(self, query=None, sort=None):
+        """Drop every loaded row and start again from the first page, optionally with a new filter."""
+        if query is not None:
+            self.query = query
+            self.set_sort(sort)
+        self.generation += 1
+        self.tree.delete(*self.tree.get_children())
+        self.pages.clear()
+        self.at_start = True
+        self.at_end = False
+        self.load_next()
+
+    def on_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        if self.loading:
+            return
+        if float(last) > 0.9 and not self.at_end:
+            self.load_next()
+        elif float(first) < 0.1 and not self.at_start:
+            self.load_previous()
+
+
+class App:
+    def __init__(self, root, service, metrics=None):
+        self.root = root
+        self.service = service
+        self.metrics = metrics
+        # Search, import/export, analytics, transfers, network stock and alerts need MongoDB;
+        # on other Storage backends (open_storage()) those sections are hidden
+        self.mongo = isinstance(service, BloodBankService)
+        self.root.title("Blood Bank Management System")
+        self.root.after(0, lambda: root.state('zoomed'))
+
+        # Initialize current user
+        self.current_user = None
+
+        # All database calls go through the worker so the mainloop never blocks
+        self.worker = DataWorker(root)
+
+        # Dashboard sections are built once and re-packed when revisited
+        self.sections = {}
+        self.tables = {}
+        self.amount_labels = {}
+        self.refresh_home_stats = None
+        self.stats_dirty = False
+
+        # Low-stock alerts arrive from whichever thread saw the stock change
+        self.alert_banner = None
+        self.dashboard_frame = None
+        self.alerts = service.cache.alerts if self.mongo else None
+        if self.alerts is not None:
+            self.alerts.listeners.append(lambda alert: self.worker.call_soon(self.on_stock_alert, alert, keep=True))
+
+        # Shown on the login screen while the background connection is pending or failing
+        self.db_status = ("Connecting to database...", "#BDC3C7")
+        self.status_label = None
+
+        self.configure_table_style()
+
+        if metrics:
+            # Every screen build is timed as "render.<method>"; without metrics nothing is wrapped
+            for name in dir(self):
+                if name.startswith("show_"):
+                    setattr(self, name, metrics.timed(f"render.{name}", getattr(self, name)))
+            root.bind("<Control-Shift-D>", lambda event: self.show_diagnostics_window())
+
+        # Load login screen by default
+        self.show_login_screen()
+
+    def clear_frame(self):
+        """Clear all widgets in the root window."""
+        self.worker.cancel_pending()
+        self.sections = {}
+        self.tables = {}
+        self.amount_labels = {}
+        self.refresh_home_stats = None
+        self.status_label = None
+        self.alert_banner = None
+        for widget in self.root.winfo_children():
+            widget.destroy()
+
+    def connect_database(self, on_ready=None, on_failed=None):
+        """Ping the server off the Tk thread, retrying every RECONNECT_MS until it answers."""
+        def connected(_):
+            self.set_db_status("Connected", "#2ECC71")
+            if on_ready:
+                on_ready()
+
+        def failed(error):
+            self.set_db_status("Database unreachable, retrying...", "#E74C3C")
+            if on_failed:
+                on_failed(error)
+            self.root.after(RECONNECT_MS, lambda: self.connect_database(on_ready, on_failed))
+
+        # On MongoDB, ready() also gives legacy stock a branch and a batch, which the first inventory load and collect need
+        self.worker.submit(self.service.ready, connected, failed, keep=True)
+
+    def set_db_status(self, text, color):
+        self.db_status = (text, color)
+        if self.status_label is not None and self.status_label.winfo_exists():
+            self.status_label.configure(text=text, text_color=color)
+
+    def configure_table_style(self):
+        style = ttk.Style()
+        style.theme_use('default')
+        style.configure(
+            "Custom.Treeview",
+            background="#2C3E50",
+            foreground="#ECF0F1",
+            fieldbackground="#2C3E50"
+        )
+        style.map(
+            "Custom.Treeview",
+            background=[('selected', '#E74C3C')]
+        )
+
+    def create_labeled_entry(self, master, label_text, is_password=False):
+        """Create a labeled entry with left-aligned label and reduced width entry."""
+        container = CTkFrame(master, fg_color="transparent")
+        container.pack(fill="x", padx=50, pady=5)
+
+        label = CTkLabel(container, text=label_text, anchor="w", text_color="#E5E7E9")
+        label.pack(side="left", padx=(0, 10))
+
+        entry_kwargs = {
+            "width": 200,
+            "show": "*",
+            "fg_color": "#2C3E50",
+            "border_color": "#34495E",
+            "text_color": "#ECF0F1"
+        } if is_password else {
+            "width": 200,
+            "fg_color": "#2C3E50",
+            "border_color": "#34495E",
+            "text_color": "#ECF0F1"
+        }
+        entry = CTkEntry(container, **entry_kwargs)
+        entry.pack(side="right")
+
+        return entry
+
+    def show_login_screen(self):
+        self.clear_frame()
+        frame = CTkFrame(master=self.root, width=400, height=500, fg_color="#2C3E50")
+        frame.place(relx=0.5, rely=0.5, anchor="center")
+
+        CTkLabel(master=frame, text="Login", font=("Arial", 24), text_color="#ECF0F1").pack(pady=20)
+
+        username_entry = self.create_labeled_entry(frame, "Username")
+        password_entry = self.create_labeled_entry(frame, "Password", is_password=True)
+
+        def login_action():
+            username = username_entry.get()
+            password = password_entry.get()
+
+            if not username or not password:
+                messagebox.showerror("Input Error", "All fields are required.")
+                return
+
+            def logged_in(branch_id):
+                login_button.configure(state="normal", text="Login")
+                if branch_id:
+                    self.current_user = username
+                    # Stock screens act on the user's branch from here on
+                    self.service = self.service.for_branch(branch_id)
+                    if self.mongo:
+                        self.service.cache.watch()
+                    messagebox.showinfo("Success", f"Welcome, {username}!")
+                    self.show_dashboard()
+                else:
+                    messagebox.showerror("Login Error", "Invalid credentials.")
+
+            def failed(error):
+                login_button.configure(state="normal", text="Login")
+                messagebox.showerror("Login Error", f"Could not reach the database: {error}")
+
+            login_button.configure(state="disabled", text="Logging in...")
+            def login():
+                # A login that beats the startup ping still lets the stock migrations finish first
+                self.service.ready()
+                return self.service.login(username, password)
+
+            self.worker.submit(login, logged_in, failed)
+
+        login_button = CTkButton(
+            master=frame,
+            text="Login",
+            command=login_action,
+            fg_color="#E74C3C",
+            hover_color="#C0392B"
+        )
+        login_button.pack(pady=20)
+
+        CTkLabel(master=frame, text="Don't have an account? Sign up.", text_color="#BDC3C7").pack()
+
+        CTkButton(
+            master=frame,
+            text="Sign Up",
+            command=self.show_signup_screen,
+            fg_color="#3498DB",
+            hover_color="#2980B9"
+        ).pack(pady=10)
+
+        text, color = self.db_status
+        self.status_label = CTkLabel(master=frame, text=text, text_color=color, font=("Arial", 11))
+        self.status_label.pack(pady=(0, 10))
+
+    def show_signup_screen(self):
+        # Only this screen uses the calendar, so its import stays off the startup path
+        from tkcalendar import Calendar
+
+        self.clear_frame()
+        frame = CTkFrame(master=self.root, width=400, height=600)
+        frame.place(relx=0.5, rely=0.5, anchor="center")
+
+        CTkLabel(master=frame, text="Sign Up", font=("Arial", 24)).pack(pady=20)
+
+        username_entry = self.create_labeled_entry(frame, "Username")
+        password_entry = self.create_labeled_entry(frame, "Password", is_password=True)
+        branch_entry = self.create_labeled_entry(frame, "Branch")
+        branch_entry.insert(0, DEFAULT_BRANCH)
+
+        dob_label = CTkLabel(master=frame, text="Date of Birth")
+        dob_label.pack(pady=5)
+
+        dob_entry = CTkEntry(master=frame, width=200, state="readonly")
+        dob_entry.pack(pady=5)
+
+        cal = Calendar(frame, selectmode="day", date_pattern="y-mm-dd")
+        cal.pack(pady=10)
+
+        def select_date():
+            dob_entry.configure(state="normal")
+            dob_entry.delete(0, "end")
+            dob_entry.insert(0, cal.get_date())
+            dob_entry.configure(state="readonly")
+
+        CTkButton(master=frame, text="Select Date", command=select_date).pack(pady=10)
+
+        def signup_action():
+            username = username_entry.get()
+            password = password_entry.get()
+            dob = dob_entry.get()
+
+            if not username or not password or not dob:
+                messagebox.showerror("Input Error", "All fields are required.")
+                return
+
+            def created(ok):
+                signup_button.configure(state="normal")
+                if not ok:
+                    messagebox.showerror("Duplicate", "Username already exists.")
+                    return
+                messagebox.showinfo("Success", "Account created successfully!")
+                self.show_login_screen()
+
+            def failed(error):
+                signup_button.configure(state="normal")
+                messagebox.showerror("Error", f"Failed to create account: {error}")
+
+            signup_button.configure(state="disabled")
+            branch_id = branch_entry.get()
+            self.worker.submit(lambda: self.service.signup(username, password, dob, branch_id), created, failed)
+
+        signup_button = CTkButton(master=frame, text="Sign Up", command=signup_action)
+        signup_button.pack(pady=10)
+        CTkButton(master=frame, text="Back to Login", command=self.show_login_screen).pack(pady=10)
+
+    def show_dashboard(self):
+        self.clear_frame()
+        self.alert_banner = CTkLabel(self.root, text="", font=("Arial", 14, "bold"), fg_color="#922B21",
+                                     text_color="#ECF0F1", corner_radius=8)
+        content_frame = CTkFrame(self.root, fg_color="#1C2833")
+        content_frame.pack(expand=True, fill="both", padx=10, pady=10)
+        self.dashboard_frame = content_frame
+        self.refresh_alert_banner()
+        self.show_home(content_frame)
+
+    def show_section(self, frame, name):
+        """Show a dashboard section, returning (section, True) if it was already built and only re-packed."""
+        for section in self.sections.values():
+            section.pack_forget()
+        built = name in self.sections
+        if not built:
+            self.sections[name] = CTkFrame(frame, fg_color="transparent")
+        section = self.sections[name]
+        section.pack(expand=True, fill="both")
+        return section, built
+
+    def show_home(self, frame):
+        section, built = self.show_section(frame, "home")
+        if built:
+            if self.stats_dirty and self.refresh_home_stats:
+                self.refresh_home_stats()
+            return
+
+        main_container = CTkFrame(section, fg_color="transparent")
+        main_container.pack(expand=True, fill="both", padx=20, pady=20)
+
+        welcome_frame = CTkFrame(main_container, fg_color="#2C3E50", corner_radius=15)
+        welcome_frame.pack(fill="x", pady=10)
+
+        CTkLabel(
+            welcome_frame,
+            text="Welcome to Blood Bank Management System",
+            font=("Arial", 24, "bold"),
+            text_color="#ECF0F1"
+        ).pack(pady=20)
+
+        if self.current_user:
+            CTkLabel(
+                welcome_frame,
+                text=f"Logged in as: {self.current_user}",
+                font=("Arial", 16),
+                text_color="#BDC3C7"
+            ).pack(pady=10)
+
+        if self.mongo:
+            self.create_home_stats(main_container)
+
+        nav_frame = CTkFrame(main_container, fg_color="transparent")
+        nav_frame.pack(fill="x", pady=10)
+
+        nav_buttons = [
+            ("Donor", "#3498DB", "#2C3E50", lambda: self.show_donor_section(frame)),
+            ("Blood Donations", "#2ECC71", "#27AE60", lambda: self.show_blood_donations_section(frame)),
+            ("Blood Bank", "#E74C3C", "#C0392B", lambda: self.show_blood_bank_window(frame)),
+        ]
+        if self.mongo:
+            nav_buttons.append(("Analytics", "#9B59B6", "#8E44AD", lambda: self.show_analytics_section(frame)))
+
+        for text, color, hover_color, command in nav_buttons:
+            CTkButton(
+                nav_frame,
+                text=text,
+                command=command,
+                width=150,
+                height=50,
+                fg_color=color,
+                hover_color=hover_color,
+                font=("Arial", 16)
+            ).pack(side="left", expand=True, padx=5, pady=10)
+
+        logout_button = CTkButton(
+            main_container,
+            text="Logout",
+            command=self.show_login_screen,
+            fg_color="#E74C3C",
+            hover_color="#C0392B",
+            font=("Arial", 16),
+            width=200,
+            height=50
+        )
+        logout_button.pack(pady=20)
+
+    def create_home_stats(self, parent):
+        """Add the dashboard counters (MongoDB only) and set refresh_home_stats to reload them."""
+        stats_frame = CTkFrame(parent, fg_color="#34495E", corner_radius=15)
+        stats_frame.pack(fill="x", pady=10)
+
+        stats = [
+            ("Total Donors", "donors"),
+            ("Total Blood Donations", "donations"),
+            ("Units in Stock", "units_in_stock"),
+            ("Units Collected Today", "units_today"),
+            ("Units Collected This Week", "units_week")
+        ]
+
+        value_labels = {}
+        for label, key in stats:
+            stat_container = CTkFrame(stats_frame, fg_color="transparent")
+            stat_container.pack(pady=10, padx=20, fill="x")
+
+            CTkLabel(stat_container, text=label, font=("Arial", 16), text_color="#ECF0F1").pack(side="left")
+            value_label = CTkLabel(stat_container, text="...", font=("Arial", 16, "bold"), text_color="#E74C3C")
+            value_label.pack(side="right")
+            value_labels[key] = value_label
+
+        def format_stat(value):
+            if not isinstance(value, dict):
+                return str(value)
+            by_group = ", ".join(f"{group}: {value[group]}" for group in BLOOD_GROUPS if value.get(group))
+            return f"{sum(value.values())} ({by_group})" if by_group else "0"
+
+        def show_stats(values):
+            for key, value_label in value_labels.items():
+                value_label.configure(text=format_stat(values[key]))
+
+        def stats_failed(error):
+            for value_label in value_labels.values():
+                value_label.configure(text="unavailable")
+
+        def refresh():
+            self.stats_dirty = False
+            self.worker.submit(self.service.dashboard_stats, show_stats, stats_failed)
+
+        self.refresh_home_stats = refresh
+        refresh()
+
+    def create_import_button(self, parent, kind, on_finished):
+        """Add a button that streams a CSV/JSONL file of donors or donations into the database."""
+        status_label = CTkLabel(parent, text="", text_color="#BDC3C7")
+
+        def show_progress(counts):
+            if status_label.winfo_exists():
+                status_label.configure(
+                    text=f"Read {counts['read']}, imported {counts['imported']}, rejected {counts['rejected']}"
+                )
+
+        def start_import():
+            path = filedialog.askopenfilename(
+                title=f"Import {kind}",
+                filetypes=[("CSV or JSON lines", "*.csv *.jsonl *.ndjson"), ("All files", "*.*")]
+            )
+            if not path:
+                return
+            rejects_path = f"{path}.rejects.jsonl"
+
+            def finished(counts):
+                self.service.cache.invalidate()
+                self.stats_dirty = True
+                self.refresh_inventory_labels()
+                import_button.configure(state="normal")
+                message = f"Imported {counts['imported']} of {counts['read']} rows."
+                if counts["rejected"]:
+                    message += f"\n{counts['rejected']} rejected rows were written to {rejects_path}"
+                messagebox.showinfo("Import Complete", message)
+                on_finished()
+
+            def failed(error):
+                import_button.configure(state="normal")
+                messagebox.showerror("Import Error", f"Import failed: {error}")
+
+            import_button.configure(state="disabled")
+            status_label.configure(text="Importing...")
+            self.worker.submit(
+                lambda: import_file(
+                    db, path, kind, rejects_path=rejects_path, branch_id=self.service.branch_id,
+                    progress=lambda counts: self.worker.call_soon(show_progress, counts)
+                ),
+                finished,
+                failed
+            )
+
+        import_button = CTkButton(
+            parent,
+            text="Import from File...",
+            command=start_import,
+            fg_color="#34495E",
+            hover_color="#2C3E50"
+        )
+        import_button.pack(pady=(0, 5))
+        status_label.pack(pady=(0, 5))
+
+    def create_export_button(self, parent, kind):
+        """Add a button that streams a collection to a CSV or Parquet file."""
+        def start_export():
+            path = filedialog.asksaveasfilename(
+                title=f"Export {kind}",
+                defaultextension=".csv",
+                filetypes=[("CSV", "*.csv"), ("Parquet", "*.parquet")]
+            )
+            if not path:
+                return
+
+            def finished(result):
+                export_button.configure(state="normal")
+                rows, rate = result
+                messagebox.showinfo("Export Complete", f"Exported {rows} rows to {path} ({rate:,.0f} rows/s)")
+
+            def failed(error):
+                export_button.configure(state="normal")
+                messagebox.showerror("Export Error", f"Export failed: {error}")
+
+            export_button.configure(state="disabled")
+            self.worker.submit(lambda: export_collection(db, kind, path), finished, failed)
+
+        export_button = CTkButton(
+            parent,
+            text="Export to File...",
+            command=start_export,
+            fg_color="#34495E",
+            hover_color="#2C3E50"
+        )
+        export_button.pack(pady=(0, 10))
+
+    def create_search_bar(self, parent, table_name, with_dates=False):
+        """Add name/blood group/gender/age (and date) filters that re-query the table as the user types."""
+        bar = CTkFrame(parent, fg_color="#2C3E50", corner_radius=10)
+        bar.pack(fill="x", padx=10, pady=(0, 5))
+
+        def small_entry(placeholder, width=90):
+            entry = CTkEntry(
+                bar,
+                width=width,
+                placeholder_text=placeholder,
+                fg_color="#34495E",
+                border_color="#2C3E50",
+                text_color="#ECF0F1"
+            )
+            entry.pack(side="left", padx=5, pady=8)
+            entry.bind("<KeyRelease>", lambda event: schedule_search())
+            return entry
+
+        CTkLabel(bar, text="Search", text_color="#E5E7E9").pack(side="left", padx=(10, 5))
+        name_entry = small_entry("Name starts with...", width=180)
+
+        blood_group_var = tk.StringVar(value="Any group")
+        CTkOptionMenu(
+            bar,
+            values=["Any group"] + BLOOD_GROUPS,
+            variable=blood_group_var,
+            width=110,
+            fg_color="#34495E",
+            text_color="#ECF0F1",
+            command=lambda value: schedule_search()
+        ).pack(side="left", padx=5)
+
+        gender_var = tk.StringVar(value="Any gender")
+        CTkOptionMenu(
+            bar,
+            values=["Any gender", "male", "female", "prefer_not_to_say"],
+            variable=gender_var,
+            width=130,
+            fg_color="#34495E",
+            text_color="#ECF0F1",
+            command=lambda value: schedule_search()
+        ).pack(side="left", padx=5)
+
+        age_min_entry = small_entry("Min age", width=70)
+        age_max_entry = small_entry("Max age", width=70)
+        date_from_entry = small_entry("From YYYY-MM-DD", width=130) if with_dates else None
+        date_to_entry = small_entry("To YYYY-MM-DD", width=130) if with_dates else None
+
+        status_label = CTkLabel(bar, text="", text_color="#E74C3C")
+        status_label.pack(side="left", padx=5)
+
+        pending = [None]
+
+        def schedule_search():
+            if pending[0] is not None:
+                self.root.after_cancel(pending[0])
+            pending[0] = self.root.after(SEARCH_DEBOUNCE_MS, run_search)
+
+        def run_search():
+            pending[0] = None
+            try:
+                query, sort = search_filter(
+                    name_prefix=name_entry.get(),
+                    blood_group=None if blood_group_var.get() == "Any group" else blood_group_var.get(),
+                    gender=None if gender_var.get() == "Any gender" else gender_var.get(),
+                    age_min=age_min_entry.get(),
+                    age_max=age_max_entry.get(),
+                    date_from=date_from_entry.get() if date_from_entry else None,
+                    date_to=date_to_entry.get() if date_to_entry else None
+                )
+            except ValueError as e:
+                status_label.configure(text=str(e))
+                return
+            status_label.configure(text="")
+            table = self.tables[table_name]
+            if query != table.query or sort != table.sort:
+                table.reload(query, sort)
+
+    def create_table(self, parent, columns, kind, query=None, sort=None):
+        """Create a virtualized table showing "donors" or "donations" page by page."""
+        table_frame = CTkFrame(parent, fg_color="transparent")
+        table_frame.pack(fill="both", expand=True, padx=10, pady=10)
+
+        scrollbar = ttk.Scrollbar(table_frame)
+        scrollbar.pack(side="right", fill="y")
+
+        tree = ttk.Treeview(
+            table_frame,
+            columns=columns,
+            show="headings",
+            height=10,
+            style="Custom.Treeview"
+        )
+        tree.pack(fill="both", expand=True)
+        scrollbar.config(command=tree.yview)
+
+        for col in columns:
+            tree.heading(col, text=col, anchor="center")
+            tree.column(col, anchor="center", width=120)
+
+        fields = [col.lower().replace(" ", "_") for col in columns]
+        if not self.mongo:
+            pages = lambda anchor, forward, limit: self.service.list_page(kind, anchor, forward, limit)
+            return VirtualTable(tree, scrollbar, self.worker, None, fields, pages=pages)
+        return VirtualTable(tree, scrollbar, self.worker, getattr(self.service, kind), fields, query=query, sort=sort,
+                            metrics=self.metrics)
+
+    def show_donor_section(self, frame):
+        section, built = self.show_section(frame, "donor")
+        if built:
+            return
+
+        entry_frame = CTkFrame(section, fg_color="#2C3E50", corner_radius=10)
+        entry_frame.pack(fill="x", padx=10, pady=10)
+
+        CTkLabel(entry_frame, text="Add Donor", font=("Arial", 16), text_color="#ECF0F1").pack(pady=10)
+
+        entries = {}
+
+        name_container = CTkFrame(entry_frame, fg_color="transparent")
+        name_container.pack(fill="x", padx=50, pady=5)
+        CTkLabel(name_container, text="Name", text_color="#E5E7E9").pack(side="left", padx=(0, 10))
+        name_entry = CTkEntry(
+            name_container,
+            width=200,
+            fg_color="#34495E",
+            border_color="#2C3E50",
+            text_color="#ECF0F1"
+        )
+        name_entry.pack(side="right")
+        entries['name'] = name_entry
+
+        age_container = CTkFrame(entry_frame, fg_color="transparent")
+        age_container.pack(fill="x", padx=50, pady=5)
+        CTkLabel(age_container, text="Age", text_color="#E5E7E9").pack(side="left", padx=(0, 10))
+        age_entry = CTkEntry(
+            age_container,
+            width=200,
+            fg_color="#34495E",
+            border_color="#2C3E50",
+            text_color="#ECF0F1"
+        )
+        age_entry.pack(side="right")
+        entries['age'] = age_entry
+
+        gender_frame = CTkFrame(entry_frame, fg_color="transparent")
+        gender_frame.pack(fill="x", padx=50, pady=5)
+        CTkLabel(gender_frame, text="Gender", text_color="#E5E7E9").pack(side="left", padx=(0, 10))
+
+        gender_var = tk.StringVar(value="prefer_not_to_say")
+        gender_radio_frame = CTkFrame(gender_frame, fg_color="transparent")
+        gender_radio_frame.pack(side="right")
+
+        male_radio = CTkRadioButton(gender_radio_frame, text="Male", variable=gender_var, value="male")
+        female_radio = CTkRadioButton(gender_radio_frame, text="Female", variable=gender_var, value="female")
+        prefer_not_radio = CTkRadioButton(gender_radio_frame, text="Prefer Not to Say", variable=gender_var, value="prefer_not_to_say")
+
+        male_radio.pack(side="left", padx=5)
+        female_radio.pack(side="left", padx=5)
+        prefer_not_radio.pack(side="left", padx=5)
+
+        blood_groups = BLOOD_GROUPS
+        blood_group_container = CTkFrame(entry_frame, fg_color="transparent")
+        blood_group_container.pack(fill="x", padx=50, pady=5)
+        CTkLabel(blood_group_container, text="Blood Group", text_color="#E5E7E9").pack(side="left", padx=(0, 10))
+
+        blood_group_var = tk.StringVar(value=blood_groups[0])
+        blood_group_dropdown = CTkOptionMenu(
+            blood_group_container,
+            values=blood_groups,
+            variable=blood_group_var,
+            fg_color="#34495E",
+            text_color="#ECF0F1"
+        )
+        blood_group_dropdown.pack(side="right")
+
+        def add_donor():
+            name = name_entry.get()
+            age = age_entry.get()
+            gender = gender_var.get()
+            blood_group = blood_group_var.get()
+            # Validate input
+            try:
+                validate_donor(name, age, gender, blood_group)
+            except ValueError as e:
+                messagebox.showerror("Error", str(e))
+                return
+
+            def added(donor):
+                add_button.configure(state="normal")
+                name_entry.delete(0, "end")
+                age_entry.delete(0, "end")
+                if donor.get("journaled"):
+                    messagebox.showinfo("Saved Offline", OFFLINE_MESSAGE)
+                    return
+                self.tables["donor"].append_row(donor)
+                self.stats_dirty = True
+                messagebox.showinfo("Success", "Donor added successfully!")
+
+            def failed(error):
+                add_button.configure(state="normal")
+                if isinstance(error, DeferralError):
+                    if messagebox.askyesno("Not Eligible", f"{error}\n\nAdd the donor anyway?"):
+                        submit(force=True)
+                    return
+                messagebox.showerror("Error", f"Failed to add donor: {error}")
+
+            def submit(force=False):
+                add_button.configure(state="disabled")
+                self.worker.submit(lambda: self.service.add_donor(name, age, gender, blood_group, force=force),
+                                   added, failed)
+
+            submit()
+
+        add_button = CTkButton(
+            entry_frame,
+            text="Add Donor",
+            command=add_donor,
+            fg_color="#E74C3C",
+            hover_color="#C0392B"
+        )
+        add_button.pack(pady=10)
+        if self.mongo:
+            self.create_import_button(entry_frame, "donors", lambda: self.tables["donor"].reload())
+
+        CTkLabel(section, text="Donor List", font=("Arial", 16), text_color="#ECF0F1").pack(pady=10)
+        if self.mongo:
+            self.create_search_bar(section, "donor")
+        columns = ["Name", "Age", "Gender", "Blood Group"]
+        self.tables["donor"] = self.create_table(section, columns, "donors")
+        back_frame = CTkFrame(section, fg_color="transparent")
+        back_frame.pack(fill="x", padx=10, pady=5, anchor="w")
+        back_button = CTkButton(
+            back_frame,
+            text="← Back to Home",
+            command=lambda: self.show_home(frame),
+            fg_color="#34495E",
+            hover_color="#2C3E50",
+            font=("Arial", 12)
+        )
+        back_button.pack(side="left", padx=10)
+
+    def show_blood_donations_section(self, frame):
+        section, built = self.show_section(frame, "donations")
+        if built:
+            return
+
+        entry_frame = CTkFrame(section, fg_color="#2C3E50", corner_radius=10)
+        entry_frame.pack(fill="x", padx=10, pady=10)
+
+        CTkLabel(entry_frame, text="Add Blood Donation", font=("Arial", 16), text_color="#ECF0F1").pack(pady=10)
+
+        blood_groups = BLOOD_GROUPS
+
+        name_container = CTkFrame(entry_frame, fg_color="transparent")
+        name_container.pack(fill="x", padx=50, pady=5)
+        CTkLabel(name_container, text="Name", text_color="#E5E7E9").pack(side="left", padx=(0, 10))
+        name_entry = CTkEntry(
+            name_container,
+            width=200,
+            fg_color="#34495E",
+            border_color="#2C3E50",
+            text_color="#ECF0F1"
+        )
+        name_entry.pack(side="right")
+
+        age_container = CTkFrame(entry_frame, fg_color="transparent")
+        age_container.pack(fill="x", padx=50, pady=5)
+        CTkLabel(age_container, text="Age", text_color="#E5E7E9").pack(side="left", padx=(0, 10))
+        age_entry = CTkEntry(
+            age_container,
+            width=200,
+            fg_color="#34495E",
+            border_color="#2C3E50",
+            text_color="#ECF0F1"
+        )
+        age_entry.pack(side="right")
+
+        units_container = CTkFrame(entry_frame, fg_color="transparent")
+        units_container.pack(fill="x", padx=50, pady=5)
+        CTkLabel(units_container, text="Units", text_color="#E5E7E9").pack(side="left", padx=(0, 10))
+        units_entry = CTkEntry(
+            units_container,
+            width=200,
+            fg_color="#34495E",
+            border_color="#2C3E50",
+            text_color="#ECF0F1"
+        )
+        units_entry.pack(side="right")
+
+        gender_frame = CTkFrame(entry_frame, fg_color="transparent")
+        gender_frame.pack(fill="x", padx=50, pady=5)
+        CTkLabel(gender_frame, text="Gender", text_color="#E5E7E9").pack(side="left", padx=(0, 10))
+
+        gender_var = tk.StringVar(value="prefer_not_to_say")
+        gender_radio_frame = CTkFrame(gender_frame, fg_color="transparent")
+        gender_radio_frame.pack(side="right")
+
+        male_radio = CTkRadioButton(gender_radio_frame, text="Male", variable=gender_var, value="male")
+        female_radio = CTkRadioButton(gender_radio_frame, text="Female", variable=gender_var, value="female")
+        prefer_not_radio = CTkRadioButton(gender_radio_frame, text="Prefer Not to Say", variable=gender_var, value="prefer_not_to_say")
+
+        male_radio.pack(side="left", padx=5)
+        female_radio.pack(side="left", padx=5)
+        prefer_not_radio.pack(side="left", padx=5)
+
+        blood_group_container = CTkFrame(entry_frame, fg_color="transparent")
+        blood_group_container.pack(fill="x", padx=50, pady=5)
+        CTkLabel(blood_group_container, text="Blood Group", text_color="#E5E7E9").pack(side="left", padx=(0, 10))
+
+        blood_group_var = tk.StringVar(value=blood_groups[0])
+        blood_group_dropdown = CTkOptionMenu(
+            blood_group_container,
+            values=blood_groups,
+            variable=blood_group_var,
+            fg_color="#34495E",
+            text_color="#ECF0F1"
+        )
+        blood_group_dropdown.pack(side="right")
+
+        # Donor picker: names typed into the form are looked up on the donors name_key index
+        picker = tk.Listbox(entry_frame, height=6, bg="#34495E", fg="#ECF0F1", selectbackground="#3498DB",
+                            highlightthickness=0, borderwidth=0, activestyle="none")
+        donor_label = CTkLabel(entry_frame, text="", text_color="#2ECC71")
+        donor_label.pack(after=name_container, padx=50, anchor="e")
+        suggestions = []
+        picked = [None]
+        pending = [None]
+
+        def hide_picker():
+            picker.pack_forget()
+            suggestions.clear()
+
+        def show_suggestions(prefix, donors):
+            if name_entry.get() != prefix or picked[0] is not None:
+                return
+            picker.delete(0, "end")
+            suggestions[:] = donors
+            if not donors:
+                picker.pack_forget()
+                return
+            for donor in donors:
+                picker.insert("end", f"{donor['name']}  ·  {donor.get('age')}  ·  {donor.get('blood_group')}")
+            picker.pack(after=name_container, fill="x", padx=50)
+
+        def suggest():
+            pending[0] = None
+            prefix = name_entry.get()
+            if not prefix.strip():
+                hide_picker()
+                return
+            self.worker.submit(lambda: self.service.suggest_donors(prefix),
+                               lambda donors: show_suggestions(prefix, donors), lambda error: hide_picker())
+
+        def name_changed(event):
+            if event.keysym == "Down" and suggestions:
+                picker.focus_set()
+                picker.selection_set(0)
+                return
+            if event.keysym == "Escape":
+                hide_picker()
+                return
+            if event.keysym in ("Up", "Return", "Tab") or not event.char and event.keysym != "BackSpace":
+                return
+            picked[0] = None
+            donor_label.configure(text="")
+            if pending[0] is not None:
+                self.root.after_cancel(pending[0])
+            pending[0] = self.root.after(SEARCH_DEBOUNCE_MS, suggest)
+
+        def pick_donor(event=None):
+            selection = picker.curselection()
+            if not selection:
+                return
+            donor = suggestions[selection[0]]
+            picked[0] = donor["_id"]
+            name_entry.delete(0, "end")
+            name_entry.insert(0, donor["name"])
+            age_entry.delete(0, "end")
+            age_entry.insert(0, str(donor.get("age", "")))
+            gender_var.set(donor.get("gender") or "prefer_not_to_say")
+            blood_group_var.set(donor.get("blood_group") or blood_groups[0])
+            donor_label.configure(text=f"Linked to donor {donor['name']} ({donor.get('blood_group')})")
+            hide_picker()
+            units_entry.focus_set()
+
+        if self.mongo:
+            # Donations on other backends link by name, age and blood group only
+            name_entry.bind("<KeyRelease>", name_changed)
+            picker.bind("<ButtonRelease-1>", pick_donor)
+            picker.bind("<Return>", pick_donor)
+
+        def add_donation():
+            name = name_entry.get()
+            age = age_entry.get()
+            gender = gender_var.get()
+            blood_group = blood_group_var.get()
+            units_str = units_entry.get()
+            try:
+                validate_donation(name, age, gender, blood_group, units_str)
+            except ValueError as e:
+                messagebox.showerror("Error", str(e))
+                return
+
+            donor_id = picked[0]
+
+            def record(force=False):
+                return self.service.record_donation(name, age, gender, blood_group, units_str,
+                                                    donor_id=donor_id, force=force)
+
+            def recorded(donation):
+                record_button.configure(state="normal")
+                for entry in (name_entry, age_entry, units_entry):
+                    entry.delete(0, "end")
+                picked[0] = None
+                donor_label.configure(text="")
+                if donation.get("journaled"):
+                    messagebox.showinfo("Saved Offline", OFFLINE_MESSAGE)
+                    return
+                self.tables["donations"].append_row(donation)
+                self.refresh_inventory_label(donation['blood_group'])
+                self.stats_dirty = True
+                messagebox.showinfo("Success", "Blood Donation recorded successfully!")
+
+            def failed(error):
+                record_button.configure(state="normal")
+                if isinstance(error, DeferralError):
+                    if messagebox.askyesno("Not Eligible", f"{error}\n\nRecord the donation anyway?"):
+                        record_button.configure(state="disabled")
+                        self.worker.submit(lambda: record(force=True), recorded, failed)
+                    return
+                messagebox.showerror("Error", f"Failed to record donation: {str(error)}")
+
+            record_button.configure(state="disabled")
+            self.worker.submit(record, recorded, failed)
+
+        record_button = CTkButton(
+            entry_frame,
+            text="Record Donation",
+            command=add_donation,
+            fg_color="#2ECC71",
+            hover_color="#27AE60"
+        )
+        record_button.pack(pady=10)
+        if self.mongo:
+            self.create_import_button(entry_frame, "donations", lambda: self.tables["donations"].reload())
+            self.create_export_button(entry_frame, "donations")
+
+        CTkLabel(section, text="Blood Donations", font=("Arial", 16), text_color="#ECF0F1").pack(pady=10)
+        if self.mongo:
+            self.create_search_bar(section, "donations", with_dates=True)
+        columns = ["Name", "Age", "Gender", "Blood Group", "Units", "Date"]
+        self.tables["donations"] = self.create_table(section, columns, "donations")
+        back_frame = CTkFrame(section, fg_color="transparent")
+        back_frame.pack(fill="x", padx=10, pady=5, anchor="w")
+        back_button = CTkButton(
+            back_frame,
+            text="← Back to Home",
+            command=lambda: self.show_home(frame),
+            fg_color="#34495E",
+            hover_color="#2C3E50",
+            font=("Arial", 12)
+        )
+        back_button.pack(side="left", padx=10)
+
+    def low_groups(self):
+        """{blood_group: alert} for this branch's groups that are currently low."""
+        if self.alerts is None:
+            return {}
+        return {alert["blood_group"]: alert for alert in self.alerts.low(self.service.branch_id)}
+
+    def show_amount(self, blood_group, count):
+        """Show a group's stock in the grid, flagged when it is below its minimum."""
+        label = self.amount_labels.get(blood_group)
+        if label is None:
+            return
+        if blood_group in self.low_groups():
+            label.configure(text=f"{count} Units - LOW", text_color="#F1C40F")
+        else:
+            label.configure(text=f"{count} Units", text_color="#E74C3C")
+        self.refresh_alert_banner()
+
+    def refresh_alert_banner(self):
+        """Show this branch's low groups above the dashboard, or hide the banner when there are none."""
+        if self.alert_banner is None:
+            return
+        low = self.low_groups()
+        if not low:
+            self.alert_banner.pack_forget()
+            return
+        self.alert_banner.configure(text="Low stock: " + "   ".join(
+            f"{group} {alert['amount']}/{alert['minimum']} units" for group, alert in low.items()))
+        if not self.alert_banner.winfo_manager():
+            self.alert_banner.pack(fill="x", padx=10, pady=(10, 0), before=self.dashboard_frame)
+
+    def on_stock_alert(self, alert):
+        if alert["branch_id"] != self.service.branch_id:
+            return
+        if alert["blood_group"] in self.amount_labels:
+            self.show_amount(alert["blood_group"], alert["amount"])
+        else:
+            self.refresh_alert_banner()
+        if alert["state"] == "low":
+            self.root.bell()
+
+    def stock_amount(self, blood_group):
+        """A group's units at this branch: from the cache on MongoDB, otherwise one read. Call it off the Tk thread."""
+        if self.mongo:
+            return self.service.cache.get(blood_group)
+        return self.service.inventory_snapshot()[blood_group]
+
+    def refresh_inventory_label(self, blood_group):
+        """Update the one grid label for blood_group from the cache, if the grid has been built."""
+        label = self.amount_labels.get(blood_group)
+        if label is not None:
+            self.worker.submit(
+                lambda: self.stock_amount(blood_group),
+                lambda count: self.show_amount(blood_group, count),
+                lambda error: label.configure(text="Unavailable")
+            )
+
+    def refresh_inventory_labels(self):
+        """Update every grid label from one cache snapshot (no query while the cache is fresh)."""
+        if not self.amount_labels:
+            return
+
+        def show_amounts(amounts):
+            for bg in self.amount_labels:
+                self.show_amount(bg, amounts.get(bg, 0))
+
+        def amounts_failed(error):
+            for label in self.amount_labels.values():
+                label.configure(text="Unavailable")
+
+        self.worker.submit(self.service.inventory_snapshot, show_amounts, amounts_failed)
+
+    def show_matches_window(self, parent, blood_group, message, matches, on_choose_group):
+        """List compatible substitute stock and donors after a collect could not be filled."""
+        window = CTkToplevel(parent)
+        window.title(f"Compatible matches for {blood_group}")
+        window.geometry("520x560")
+        window.configure(fg_color="#1C2833")
+        window.transient(parent)
+        window.grab_set()
+
+        def close():
+            window.destroy()
+            if parent.winfo_exists():
+                parent.grab_set()
+
+        window.protocol("WM_DELETE_WINDOW", close)
+
+        CTkLabel(window, text=message, font=("Arial", 14), text_color="#E74C3C").pack(pady=10)
+
+        CTkLabel(window, text="Compatible stock (double-click to use)", text_color="#ECF0F1").pack(pady=(5, 0))
+        stock_tree = ttk.Treeview(window, columns=["Blood Group", "Units"], show="headings", height=5,
+                                  style="Custom.Treeview")
+        for col in ["Blood Group", "Units"]:
+            stock_tree.heading(col, text=col, anchor="center")
+            stock_tree.column(col, anchor="center", width=120)
+        for group, units in matches["substitutes"]:
+            stock_tree.insert("", "end", iid=group, values=[group, units])
+        if not matches["substitutes"]:
+            stock_tree.insert("", "end", values=["None in stock", ""])
+        stock_tree.pack(fill="x", padx=10, pady=5)
+
+        def choose(event):
+            selected = stock_tree.focus()
+            if selected in BLOOD_GROUPS:
+                close()
+                on_choose_group(selected)
+
+        stock_tree.bind("<Double-1>", choose)
+
+        CTkLabel(window, text="Compatible donors who may give today", text_color="#ECF0F1").pack(pady=(10, 0))
+        columns = ["Name", "Age", "Gender", "Blood Group", "Last Donated"]
+        donor_tree = ttk.Treeview(window, columns=columns, show="headings", height=10, style="Custom.Treeview")
+        for col in columns:
+            donor_tree.heading(col, text=col, anchor="center")
+            donor_tree.column(col, anchor="center", width=110)
+        for donor in matches["donors"]:
+            donor_tree.insert("", "end", values=[donor.get(col.lower().replace(" ", "_"), "") for col in columns])
+        donor_tree.pack(fill="both", expand=True, padx=10, pady=5)
+
+        CTkButton(
+            window,
+            text="Close",
+            command=close,
+            fg_color="#E74C3C",
+            hover_color="#C0392B"
+        ).pack(pady=10)
+
+    def show_diagnostics_window(self):
+        """Per-operation latency percentiles, document counts and payload sizes, refreshed live."""
+        window = CTkToplevel(self.root)
+        window.title("Diagnostics")
+        window.geometry("900x500")
+        window.configure(fg_color="#1C2833")
+
+        columns = ["Operation", "Calls", "p50 ms", "p95 ms", "p99 ms", "Max ms", "Docs", "KB"]
+        tree = ttk.Treeview(window, columns=columns, show="headings", style="Custom.Treeview")
+        for col in columns:
+            tree.heading(col, text=col, anchor="center")
+            tree.column(col, anchor="center", width=80)
+        tree.column("Operation", anchor="w", width=280)
+        tree.pack(fill="both", expand=True, padx=10, pady=10)
+
+        def refresh():
+            if not window.winfo_exists():
+                return
+            tree.delete(*tree.get_children())
+            for row in self.metrics.summary():
+                tree.insert("", "end", values=[
+                    row["operation"], row["count"], f"{row['p50_ms']:.2f}", f"{row['p95_ms']:.2f}",
+                    f"{row['p99_ms']:.2f}", f"{row['max_ms']:.2f}", row["docs"], f"{row['bytes'] / 1024:.1f}"
+                ])
+            window.after(DIAGNOSTICS_REFRESH_MS, refresh)
+
+        def export():
+            path = filedialog.asksaveasfilename(
+                parent=window,
+                defaultextension=".prom",
+                filetypes=[("Prometheus text", "*.prom"), ("JSON lines", "*.jsonl")]
+            )
+            if path:
+                self.metrics.export(path)
+
+        button_frame = CTkFrame(window, fg_color="transparent")
+        button_frame.pack(pady=(0, 10))
+        CTkButton(button_frame, text="Export...", command=export).pack(side="left", padx=5)
+        CTkButton(
+            button_frame,
+            text="Reset",
+            command=self.metrics.reset,
+            fg_color="#E74C3C",
+            hover_color="#C0392B"
+        ).pack(side="left", padx=5)
+
+        refresh()
+
+    def show_blood_bank_window(self, frame):
+        section, built = self.show_section(frame, "blood_bank")
+        if built:
+            self.refresh_inventory_labels()
+            return
+
+        inventory_frame = CTkFrame(section, fg_color="#2C3E50", corner_radius=10)
+        inventory_frame.pack(fill="x", padx=10, pady=10)
+
+        blood_groups = BLOOD_GROUPS
+
+        CTkLabel(
+            inventory_frame,
+            text=f"Blood Bank Inventory - {self.service.branch_id}",
+            font=("Arial", 24, "bold"),
+            text_color="#ECF0F1"
+        ).pack(pady=20)
+
+        grid_frame = CTkFrame(inventory_frame, fg_color="transparent")
+        grid_frame.pack(expand=True, fill="both", padx=20, pady=10)
+
+        def create_transaction_window(blood_group):
+            transaction_window = CTkToplevel(self.root)
+            transaction_window.title("Blood Transaction")
+            transaction_window.geometry("400x600")
+            transaction_window.configure(fg_color="#1C2833")
+            transaction_window.transient(self.root)
+            transaction_window.grab_set()
+
+            CTkLabel(transaction_window, text="Transaction Type", font=("Arial", 16), text_color="#ECF0F1").pack(pady=10)
+            transaction_var = tk.StringVar(value="collect")
+            collect_radio = CTkRadioButton(transaction_window, text="Collect", variable=transaction_var, value="collect")
+            deposit_radio = CTkRadioButton(transaction_window, text="Deposit", variable=transaction_var, value="deposit")
+            transfer_radio = CTkRadioButton(transaction_window, text="Transfer", variable=transaction_var, value="transfer")
+            collect_radio.pack(pady=5)
+            deposit_radio.pack(pady=5)
+            if self.mongo:
+                transfer_radio.pack(pady=5)
+
+            blood_group_frame = CTkFrame(transaction_window, fg_color="transparent")
+            blood_group_frame.pack(fill="x", padx=50, pady=5)
+            CTkLabel(blood_group_frame, text="Blood Group", text_color="#E5E7E9").pack(side="left", padx=(0, 10))
+            blood_group_var = tk.StringVar(value=blood_group)
+            blood_group_dropdown = CTkOptionMenu(
+                blood_group_frame,
+                values=blood_groups,
+                variable=blood_group_var,
+                fg_color="#34495E",
+                button_color="#2C3E50",
+                text_color="#ECF0F1",
+                command=lambda bg: show_available(bg)
+            )
+            blood_group_dropdown.pack(side="right")
+
+            available_label = CTkLabel(transaction_window, text="", text_color="#BDC3C7")
+            available_label.pack(pady=5)
+
+            def show_available(bg):
+                available_label.configure(text="Checking stock...")
+
+                def shown(count):
+                    if transaction_window.winfo_exists() and blood_group_var.get() == bg:
+                        available_label.configure(text=f"Available: {count} Units")
+
+                self.worker.submit(lambda: self.stock_amount(bg), shown, lambda error: None)
+
+            show_available(blood_group)
+
+            def use_group(bg):
+                blood_group_var.set(bg)
+                show_available(bg)
+
+            name_frame = CTkFrame(transaction_window, fg_color="transparent")
+            name_frame.pack(fill="x", padx=50, pady=5)
+            CTkLabel(name_frame, text="Name", text_color="#E5E7E9").pack(side="left", padx=(0, 10))
+            name_entry = CTkEntry(
+                name_frame,
+                width=200,
+                fg_color="#34495E",
+                border_color="#2C3E50",
+                text_color="#ECF0F1"
+            )
+            name_entry.pack(side="right")
+
+            amount_frame = CTkFrame(transaction_window, fg_color="transparent")
+            amount_frame.pack(fill="x", padx=50, pady=5)
+            CTkLabel(amount_frame, text="Amount (Units)", text_color="#E5E7E9").pack(side="left", padx=(0, 10))
+            amount_entry = CTkEntry(
+                amount_frame,
+                width=200,
+                fg_color="#34495E",
+                border_color="#2C3E50",
+                text_color="#ECF0F1"
+            )
+            amount_entry.pack(side="right")
+
+            to_branch_frame = CTkFrame(transaction_window, fg_color="transparent")
+            if self.mongo:
+                to_branch_frame.pack(fill="x", padx=50, pady=5)
+            CTkLabel(to_branch_frame, text="To Branch (transfers)", text_color="#E5E7E9").pack(side="left", padx=(0, 10))
+            to_branch_entry = CTkEntry(
+                to_branch_frame,
+                width=200,
+                fg_color="#34495E",
+                border_color="#2C3E50",
+                text_color="#ECF0F1"
+            )
+            to_branch_entry.pack(side="right")
+
+            def process_transaction():
+                transaction_type = transaction_var.get()
+                blood_group_sel = blood_group_var.get()
+                name = name_entry.get()
+                amount = amount_entry.get()
+                to_branch = to_branch_entry.get().strip()
+                if not name or not amount or (transaction_type == "transfer" and not to_branch):
+                    messagebox.showerror("Error", "All fields are required")
+                    return
+                try:
+                    amount = int(amount)
+                except ValueError:
+                    messagebox.showerror("Error", "Amount must be a number")
+                    return
+
+                def apply_transaction():
+                    """Return (error message, None, matches) or (None, (inventory document, allocations), None)."""
+                    try:
+                        if transaction_type == "transfer":
+                            return None, self.service.transfer(to_branch, blood_group_sel, amount), None
+                        return None, self.service.process_transaction(blood_group_sel, transaction_type, amount), None
+                    except InsufficientStockError as e:
+                        return str(e), None, self.service.find_matches(blood_group_sel) if self.mongo else None
+                    except InventoryError as e:
+                        return str(e), None, None
+
+                def processed(result):
+                    error, doc, matches = result
+                    if not transaction_window.winfo_exists():
+                        return
+                    process_button.configure(state="normal")
+                    if matches is not None:
+                        self.show_matches_window(transaction_window, blood_group_sel, error, matches, use_group)
+                        return
+                    if error:
+                        messagebox.showerror("Error", error)
+                        return
+                    doc, allocations = doc
+                    if doc.get("journaled"):
+                        messagebox.showinfo("Saved Offline", OFFLINE_MESSAGE)
+                        transaction_window.destroy()
+                        return
+                    self.show_amount(blood_group_sel, doc['amount'])
+                    self.stats_dirty = True
+                    message = f"{transaction_type.capitalize()} transaction processed for {blood_group_sel}!"
+                    if allocations:
+                        message += "\n\nIssue from:\n" + "\n".join(
+                            f"{units} units expiring {expires_at:%Y-%m-%d}" for _, units, expires_at in allocations)
+                    messagebox.showinfo("Success", message)
+                    transaction_window.destroy()
+
+                def failed(error):
+                    if transaction_window.winfo_exists():
+                        process_button.configure(state="normal")
+                    messagebox.showerror("Error", f"Transaction failed: {error}")
+
+                process_button.configure(state="disabled")
+                self.worker.submit(apply_transaction, processed, failed)
+
+            process_button = CTkButton(
+                transaction_window,
+                text="Process Transaction",
+                command=process_transaction,
+                fg_color="#2ECC71",
+                hover_color="#27AE60"
+            )
+            process_button.pack(pady=20)
+            CTkButton(
+                transaction_window,
+                text="Cancel",
+                command=lambda: transaction_window.destroy(),
+                fg_color="#E74C3C",
+                hover_color="#C0392B"
+            ).pack(pady=20)
+
+        for i, blood_group in enumerate(blood_groups):
+            group_frame = CTkFrame(grid_frame, fg_color="#34495E")
+            group_frame.grid(row=i//4, column=i%4, padx=5, pady=5, sticky="nsew")
+
+            CTkLabel(group_frame, text=blood_group, font=("Arial", 16), text_color="#ECF0F1").pack(pady=5)
+            amount_label = CTkLabel(group_frame, text="Loading...", font=("Arial", 14), text_color="#E74C3C")
+            amount_label.pack(pady=5)
+            self.amount_labels[blood_group] = amount_label
+            CTkButton(
+                group_frame,
+                text="Collect/Borrow",
+                command=lambda bg=blood_group: create_transaction_window(bg),
+                fg_color="#E74C3C",
+                hover_color="#C0392B"
+            ).pack(pady=5)
+
+        self.refresh_inventory_labels()
+
+        for i in range(2):
+            grid_frame.grid_rowconfigure(i, weight=1)
+        for i in range(4):
+            grid_frame.grid_columnconfigure(i, weight=1)
+
+        if self.mongo:
+            CTkButton(
+                inventory_frame,
+                text="Network Stock",
+                command=self.show_network_window,
+                fg_color="#3498DB",
+                hover_color="#2980B9"
+            ).pack(pady=(0, 15))
+
+        back_frame = CTkFrame(section, fg_color="transparent")
+        back_frame.pack(fill="x", padx=10, pady=5, anchor="w")
+        back_button = CTkButton(
+            back_frame,
+            text="← Back to Home",
+            command=lambda: self.show_home(frame),
+            fg_color="#34495E",
+            hover_color="#2C3E50",
+            font=("Arial", 12)
+        )
+        back_button.pack(padx=10)
+
+    def show_network_window(self):
+        """Units per group at every branch, with network totals, from one aggregation."""
+        window = CTkToplevel(self.root)
+        window.title("Network Stock")
+        window.geometry("900x400")
+        window.configure(fg_color="#1C2833")
+        window.transient(self.root)
+
+        columns = ["Branch"] + BLOOD_GROUPS + ["Total"]
+        tree = ttk.Treeview(window, columns=columns, show="headings", style="Custom.Treeview")
+        for col in columns:
+            tree.heading(col, text=col, anchor="center")
+            tree.column(col, anchor="center", width=80)
+        tree.column("Branch", width=140)
+        tree.pack(fill="both", expand=True, padx=10, pady=10)
+        tree.insert("", "end", values=["Loading..."])
+
+        def show_stock(network):
+            if not window.winfo_exists():
+                return
+            tree.delete(*tree.get_children())
+            for branch_id, amounts in sorted(network["branches"].items()):
+                row = [amounts.get(group, 0) for group in BLOOD_GROUPS]
+                tree.insert("", "end", values=[branch_id] + row + [sum(row)])
+            totals = [network["totals"][group] for group in BLOOD_GROUPS]
+            tree.insert("", "end", values=["All branches"] + totals + [sum(totals)])
+
+        def failed(error):
+            if window.winfo_exists():
+                tree.delete(*tree.get_children())
+                tree.insert("", "end", values=[f"Failed to load: {error}"])
+
+        self.worker.submit(self.service.network_inventory, show_stock, failed)
+
+        CTkButton(
+            window,
+            text="Close",
+            command=window.destroy,
+            fg_color="#E74C3C",
+            hover_color="#C0392B"
+        ).pack(pady=10)
+
+    def show_analytics_section(self, frame):
+        section, built = self.show_section(frame, "analytics")
+        if built:
+            return
+
+        header_frame = CTkFrame(section, fg_color="#2C3E50", corner_radius=10)
+        header_frame.pack(fill="x", padx=10, pady=10)
+
+        CTkLabel(
+            header_frame,
+            text="Donation Analytics",
+            font=("Arial", 24, "bold"),
+            text_color="#ECF0F1"
+        ).pack(pady=20)
+
+        # Granularity shown in the menu -> (rollup granularity, number of periods)
+        views = {
+            "Daily (last 30 days)": ("day", 30),
+            "Weekly (last 12 weeks)": ("week", 12),
+            "Monthly (last 12 months)": ("month", 12)
+        }
+        view_var = tk.StringVar(value=next(iter(views)))
+        controls = CTkFrame(header_frame, fg_color="transparent")
+        controls.pack(pady=(0, 10))
+        CTkOptionMenu(
+            controls,
+            values=list(views),
+            variable=view_var,
+            width=220,
+            fg_color="#34495E",
+            text_color="#ECF0F1",
+            command=lambda value: refresh()
+        ).pack(side="left", padx=5)
+        CTkButton(
+            controls,
+            text="Refresh",
+            command=lambda: refresh(),
+            fg_color="#9B59B6",
+            hover_color="#8E44AD"
+        ).pack(side="left", padx=5)
+        report_button = CTkButton(
+            controls,
+            text="Monthly Report...",
+            command=lambda: start_report(),
+            fg_color="#34495E",
+            hover_color="#2C3E50"
+        )
+        report_button.pack(side="left", padx=5)
+        status_label = CTkLabel(header_frame, text="", text_color="#BDC3C7")
+        status_label.pack(pady=(0, 10))
+
+        def start_report():
+            month = datetime.now().strftime("%Y-%m")
+            spec = simpledialog.askstring("Monthly Report", "Months (YYYY-MM or YYYY-MM:YYYY-MM)",
+                                          initialvalue=f"{month}:{month}", parent=self.root)
+            if not spec:
+                return
+            from reports import generate_report, parse_period, write_report
+            try:
+                months = parse_period(spec)
+            except ValueError as e:
+                messagebox.showerror("Error", str(e))
+                return
+            path = filedialog.asksaveasfilename(
+                title="Save report",
+                defaultextension=".html",
+                filetypes=[("HTML", "*.html"), ("CSV", "*.csv")]
+            )
+            if not path:
+                return
+
+            def show_progress(done, total):
+                if status_label.winfo_exists():
+                    status_label.configure(text=f"Building report: {done}/{total} partitions")
+
+            def build():
+                report, recomputed = generate_report(
+                    db, months, progress=lambda done, total: self.worker.call_soon(show_progress, done, total))
+                return write_report(report, path), recomputed
+
+            def finished(result):
+                report_button.configure(state="normal")
+                files, recomputed = result
+                status_label.configure(text="")
+                messagebox.showinfo("Report Complete", f"Wrote {', '.join(files)} ({recomputed} partitions recomputed)")
+
+            def report_failed(error):
+                report_button.configure(state="normal")
+                status_label.configure(text="")
+                messagebox.showerror("Report Error", f"Report failed: {error}")
+
+            report_button.configure(state="disabled")
+            self.worker.submit(build, finished, report_failed)
+
+        columns = ["Period"] + BLOOD_GROUPS + ["Total"]
+        table_frame = CTkFrame(section, fg_color="transparent")
+        table_frame.pack(fill="both", expand=True, padx=10, pady=10)
+        scrollbar = ttk.Scrollbar(table_frame)
+        scrollbar.pack(side="right", fill="y")
+        tree = ttk.Treeview(
+            table_frame,
+            columns=columns,
+            show="headings",
+            height=15,
+            style="Custom.Treeview",
+            yscrollcommand=scrollbar.set
+        )
+        tree.pack(fill="both", expand=True)
+        scrollbar.config(command=tree.yview)
+        for col in columns:
+            tree.heading(col, text=col, anchor="center")
+            tree.column(col, anchor="center", width=90)
+
+        def show_rows(rows):
+            tree.delete(*tree.get_children())
+            for period, units in reversed(rows):
+                values = [units.get(group, 0) for group in BLOOD_GROUPS]
+                tree.insert("", "end", values=[period] + values + [sum(values)])
+            status_label.configure(text="" if rows else "No donations in this period")
+
+        def failed(error):
+            status_label.configure(text=f"Failed to load analytics: {error}")
+
+        def refresh():
+            granularity, periods = views[view_var.get()]
+            status_label.configure(text="Loading...")
+            self.worker.submit(lambda: self.service.donation_analytics(granularity, periods), show_rows, failed)
+
+        refresh()
+
+        back_frame = CTkFrame(section, fg_color="transparent")
+        back_frame.pack(fill="x", padx=10, pady=5, anchor="w")
+        CTkButton(
+            back_frame,
+            text="← Back to Home",
+            command=lambda: self.show_home(frame),
+            fg_color="#34495E",
+            hover_color="#2C3E50",
+            font=("Arial", 12)
+        ).pack(side="left", padx=10)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Blood Bank Management System")
+    parser.add_argument("--reconcile-stats", action="store_true",
+                        help="check the dashboard counters against real counts and fix drift, then exit")
+    parser.add_argument("--backfill-rollups", action="store_true",
+                        help="rebuild the donation analytics rollups from all donations, then exit")
+    parser.add_argument("--report", metavar="PERIOD",
+                        help="write the monthly report for YYYY-MM or YYYY-MM:YYYY-MM to --file (.html or .csv), then exit")
+    parser.add_argument("--workers", type=int,
+                        help="processes building --report partitions (default: BLOOD_BANK_REPORT_WORKERS or the CPU count)")
+    parser.add_argument("--snapshot-ledger", action="store_true",
+                        help="fold the inventory ledger into a new snapshot, then exit")
+    parser.add_argument("--reconcile-inventory", action="store_true",
+                        help="rebuild stock from the latest ledger snapshot and report drift from the live counters, then exit")
+    parser.add_argument("--fix", action="store_true", help="with --reconcile-inventory, set drifted counters to the rebuilt amounts")
+    parser.add_argument("--link-donations", action="store_true",
+                        help="link existing donations to their donors by name, age and blood group, then exit")
+    parser.add_argument("--rollback-donation-links", action="store_true",
+                        help="undo --link-donations using its migration log, then exit")
+    parser.add_argument("--eligible", action="store_true",
+                        help="count donors allowed to give on --day per blood group (and write them to --file), then exit")
+    parser.add_argument("--day", help="date for --eligible, YYYY-MM-DD (default: today)")
+    parser.add_argument("--serve", action="store_true", help="run the HTTP API instead of the GUI")
+    parser.add_argument("--host", help="address the HTTP API listens on (default: BLOOD_BANK_API_HOST or 127.0.0.1)")
+    parser.add_argument("--port", type=int, help="port the HTTP API listens on (default: BLOOD_BANK_API_PORT or 8080)")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="print how long each startup step took once the database answers, then exit")
+    parser.add_argument("--expire-batches", action="store_true",
+                        help="retire expired blood batches and deduct them from stock, then exit")
+    parser.add_argument("--bootstrap", action="store_true",
+                        help="create and verify the database indexes, then exit")
+    parser.add_argument("--check-indexes", action="store_true",
+                        help="explain the app's queries and flag any collection scans, then exit")
+    parser.add_argument("--import", dest="import_kind", choices=sorted(IMPORT_FIELDS),
+                        help="stream donors or donations from --file into the database, then exit")
+    parser.add_argument("--export", dest="export_kind", choices=sorted(EXPORT_FIELDS),
+                        help="stream a collection to --file as CSV or Parquet, then exit")
+    parser.add_argument("--file", help="input file for --import or output file for --export")
+    parser.add_argument("--format", choices=["csv", "parquet"],
+                        help="export format (default: from the file extension)")
+    parser.add_argument("--from", dest="date_from", help="export donations on or after YYYY-MM-DD")
+    parser.add_argument("--to", dest="date_to", help="export donations on or before YYYY-MM-DD")
+    parser.add_argument("--blood-group", choices=BLOOD_GROUPS, help="export or count only this blood group")
+    parser.add_argument("--rejects", help="where to write rejected rows (default: <file>.rejects.jsonl)")
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    parser.add_argument("--branch", default=DEFAULT_BRANCH, help="branch whose stock imported donations add to")
+    args = parser.parse_args(argv)
+    if (args.import_kind or args.export_kind or args.report) and not args.file:
+        parser.error("--import, --export and --report require --file")
+    maintenance = [args.reconcile_stats, args.backfill_rollups, args.report, args.snapshot_ledger,
+                   args.reconcile_inventory, args.link_donations, args.rollback_donation_links, args.eligible,
+                   args.expire_batches, args.bootstrap, args.check_indexes, args.import_kind, args.export_kind]
+    if STORAGE_BACKEND != "mongo" and any(maintenance):
+        # The desktop app and --serve run on any backend; these commands work on MongoDB collections
+        parser.error(f"BLOOD_BANK_STORAGE={STORAGE_BACKEND} supports the desktop app and --serve only; "
+                     "the other commands need MongoDB")
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if metrics and METRICS_FILE:
+        metrics.start_export_job(METRICS_FILE)
+        atexit.register(metrics.export, METRICS_FILE)
+    if args.bootstrap or args.check_indexes:
+        problems = bootstrap_schema(db) if args.bootstrap else []
+        if args.check_indexes:
+            problems += check_query_plans(db)
+        raise SystemExit(1 if problems else 0)
+    if args.backfill_rollups:
+        print(f"{backfill_rollups(db)} rollup buckets written")
+        raise SystemExit(0)
+    if args.report:
+        from reports import REPORT_WORKERS, generate_report, parse_period, write_report
+        started = time.perf_counter()
+        report, recomputed = generate_report(
+            db, parse_period(args.report), workers=args.workers or REPORT_WORKERS,
+            progress=lambda done, total: print(f"\rpartitions {done}/{total}", end="")
+        )
+        print(f"\nwrote {', '.join(write_report(report, args.file))} "
+              f"({recomputed} partitions recomputed in {time.perf_counter() - started:.2f}s)")
+        raise SystemExit(0)
+    if args.snapshot_ledger:
+        snapshot = service.take_snapshot()
+        if snapshot is None:
+            print("The ledger has not been opened yet; run --bootstrap first")
+            raise SystemExit(1)
+        print(f"Snapshot at {snapshot['position']:%Y-%m-%d %H:%M:%S}: {len(snapshot['totals'])} stock levels, "
+              f"{snapshot['entries']} new ledger entries")
+        raise SystemExit(0)
+    if args.reconcile_inventory:
+        drift = service.reconcile_inventory(fix=args.fix)
+        for (branch_id, group), (live, rebuilt) in sorted(drift.items()):
+            print(f"{branch_id} {group}: live {live}, ledger {rebuilt}{' (fixed)' if args.fix else ''}")
+        if not drift:
+            print("Inventory matches the ledger")
+        raise SystemExit(1 if drift and not args.fix else 0)
+    if args.link_donations:
+        linked, unmatched = link_donations(db, batch_size=args.batch_size)
+        print(f"{linked} donations linked, {unmatched} left without a donor")
+        raise SystemExit(0)
+    if args.rollback_donation_links:
+        print(f"{rollback_donation_links(db)} donation links removed")
+        raise SystemExit(0)
+    if args.eligible:
+        groups = [args.blood_group] if args.blood_group else None
+        started = time.perf_counter()
+        for group, count in service.eligible_counts(args.day, groups).items():
+            print(f"{group}: {count} eligible")
+        if args.file:
+            with open(args.file, "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(["donor_id", "name", "age", "gender", "blood_group", "last_donated"])
+                for donor in service.eligible_donors(args.day, groups):
+                    writer.writerow([donor["_id"], donor["name"], donor["age"], donor["gender"],
+                                     donor["blood_group"], donor.get("last_donated", "")])
+        print(f"done in {time.perf_counter() - started:.2f}s")
+        raise SystemExit(0)
+    if args.expire_batches:
+        for (branch_id, group), units in sorted(service.expire_batches().items()):
+            print(f"{branch_id} {group}: {units} units expired")
+        raise SystemExit(0)
+    if args.reconcile_stats:
+        for field, (stored, actual) in service.reconcile_stats().items():
+            print(f"{field}: stored {stored}, actual {actual}")
+        raise SystemExit(0)
+    if args.import_kind:
+        counts = import_file(
+            db, args.file, args.import_kind, batch_size=args.batch_size, rejects_path=args.rejects,
+            branch_id=args.branch,
+            progress=lambda c: print(f"\rread {c['read']}  imported {c['imported']}  rejected {c['rejected']}", end="")
+        )
+        print()
+        raise SystemExit(1 if counts["rejected"] else 0)
+    if args.export_kind:
+        rows, rate = export_collection(
+            db, args.export_kind, args.file, fmt=args.format,
+            start=args.date_from, end=args.date_to, blood_group=args.blood_group,
+            progress=lambda n, r: print(f"\rexported {n} rows ({r:,.0f} rows/s)", end="")
+        )
+        print(f"\rexported {rows} rows to {args.file} ({rate:,.0f} rows/s)")
+        raise SystemExit(0)
+    if STORAGE_BACKEND != "mongo":
+        # No MongoDB: no journal, schema bootstrap or background jobs either
+        from storage import open_storage
+        service = open_storage()
+    if args.serve:
+        from api import API_HOST, API_PORT, serve
+        host, port = args.host or API_HOST, args.port or API_PORT
+    if args.serve and not isinstance(service, BloodBankService):
+        serve(service, host, port)
+        raise SystemExit(0)
+    if args.serve:
+        start_journal()
+        try:
+            service.ready()
+        except PyMongoError as e:
+            print(f"Could not reach MongoDB: {e}; stock requests fail until it is up")
+        threading.Thread(target=bootstrap_schema, args=(db,), name="schema-bootstrap", daemon=True).start()
+        service.start_reconcile_job()
+        service.start_expiry_job()
+        service.start_snapshot_job()
+        service.start_replay_job()
+        serve(service, host, port)
+        raise SystemExit(0)
+
+    root = CTk()
+    if isinstance(service, BloodBankService):
+        start_journal()
+        # Uploads anything journaled while offline, including entries left from an earlier session
+        service.start_replay_job()
+    app = App(root, service, metrics)
+    mark_startup("build login window")
+    root.after(0, lambda: mark_startup("first frame"))
+
+    def finish_profile(step):
+        mark_startup(step)
+        print_startup_profile()
+        root.quit()
+
+    def connected():
+        if isinstance(service, BloodBankService):
+            threading.Thread(target=bootstrap_schema, args=(db,), name="schema-bootstrap", daemon=True).start()
+            service.cache.watch()
+            service.start_reconcile_job()
+            service.start_expiry_job()
+            service.start_snapshot_job()
+        if args.profile_startup:
+            finish_profile("database reachable")
+
+    def unreachable(error):
+        if args.profile_startup:
+            print(f"Could not reach MongoDB: {error}")
+            finish_profile("database unreachable")
+
+    app.connect_database(connected, unreachable)
+    root.mainloop()
+    app.worker.shutdown()
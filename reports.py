@@ -0,0 +1,290 @@
+"""Monthly operational reports: donations per group, top sites, stock levels and turnover.
+
+The period is split into (month, blood group) partitions that are aggregated in parallel in a
+process pool, each worker with its own MongoDB client, and the partial results are merged into
+one report rendered as HTML or CSV:
+
+    python blood.py --report 2025-01:2025-06 --file report.html
+
+Partition results are cached in report_partitions together with a fingerprint of their
+source data (donation and ledger entry counts, unit totals and newest ids), so re-running a
+report only recomputes the partitions whose data changed, usually just the current month.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+import csv
+import html
+import multiprocessing
+import os
+
+from services import BLOOD_GROUPS, DEFAULT_BRANCH, MONGO_URI, connect, ledger_time
+
+REPORT_WORKERS = int(os.environ.get("BLOOD_BANK_REPORT_WORKERS", str(os.cpu_count() or 2)))
+# Branches listed per month under top sites
+REPORT_TOP_SITES = 5
+# Ledger kinds that bring units into stock
+RECEIVED_KINDS = ("donation", "deposit", "import")
+
+
+def parse_period(spec):
+    """Months covered by "YYYY-MM" or "YYYY-MM:YYYY-MM", oldest first."""
+    first, _, last = (spec or "").partition(":")
+    try:
+        start = datetime.strptime(first.strip(), "%Y-%m")
+        end = datetime.strptime((last or first).strip(), "%Y-%m")
+    except ValueError:
+        raise ValueError(f"Period must be YYYY-MM or YYYY-MM:YYYY-MM: {spec}")
+    if end < start:
+        raise ValueError(f"Period ends before it starts: {spec}")
+    months = []
+    year, month = start.year, start.month
+    while (year, month) <= (end.year, end.month):
+        months.append(f"{year:04d}-{month:02d}")
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+
+def month_bounds(month):
+    """(start, end) datetimes of a YYYY-MM month; end is the first instant of the next month."""
+    start = datetime.strptime(month, "%Y-%m")
+    end = datetime(start.year + 1, 1, 1) if start.month == 12 else datetime(start.year, start.month + 1, 1)
+    return start, end
+
+
+def donation_dates(month):
+    """Filter on donation dates (YYYY-MM-DD strings) within month."""
+    return {"$gte": f"{month}-01", "$lte": f"{month}-31"}
+
+
+def partition_id(month, blood_group):
+    return f"{month}:{blood_group}"
+
+
+def period_fingerprints(db, months):
+    """{(month, blood group): summary of the partition's source data that changes whenever the data does}.
+
+    For donations and ledger entries alike: [count, unit total, highest _id], from one $group per
+    source over the whole period. Edited units move the total and a delete plus an insert moves
+    the highest _id even when the count stays put.
+    """
+    start, end = month_bounds(months[0])[0], month_bounds(months[-1])[1]
+    fingerprints = {(month, group): [0, 0, None, 0, 0, None] for month in months for group in BLOOD_GROUPS}
+    for offset, name, query, month, units in [
+        (0, "donations", {"date": {"$gte": f"{months[0]}-01", "$lte": f"{months[-1]}-31"}},
+         {"$substr": ["$date", 0, 7]}, "$units"),
+        (3, "inventory_ledger", {"ts": {"$gte": start, "$lt": end}},
+         {"$dateToString": {"format": "%Y-%m", "date": "$ts"}}, "$change"),
+    ]:
+        for row in db[name].aggregate([
+            {"$match": query},
+            {"$group": {"_id": {"month": month, "group": "$blood_group"},
+                        "count": {"$sum": 1}, "units": {"$sum": units}, "last": {"$max": "$_id"}}},
+        ]):
+            fingerprint = fingerprints.get((row["_id"]["month"], row["_id"]["group"]))
+            if fingerprint is not None:
+                fingerprint[offset:offset + 3] = [row["count"], row["units"], row["last"]]
+    return fingerprints
+
+
+def stock_at(db, blood_group, moment):
+    """Units of blood_group held across all branches at moment, from the ledger; None before it was opened."""
+    snapshot = db["inventory_snapshots"].find_one({"position": {"$lte": moment}}, sort=[("position", -1)])
+    if snapshot is None:
+        return None
+    units = sum(row["units"] for row in snapshot["totals"] if row["blood_group"] == blood_group)
+    for row in db["inventory_ledger"].aggregate([
+        {"$match": {"blood_group": blood_group, "ts": {"$gt": snapshot["position"], "$lt": moment}}},
+        {"$group": {"_id": None, "units": {"$sum": "$change"}}},
+    ]):
+        units += row["units"]
+    return units
+
+
+def compute_partition(db, month, blood_group, now=None):
+    """Aggregate one (month, blood group) partition: donations by site, ledger flows and stock levels."""
+    start, end = month_bounds(month)
+    # Ledger times keep whole milliseconds, so the current month runs to the end of the current one
+    end = min(end, ledger_time(now) + timedelta(milliseconds=1))
+    sites = {}
+    donations = units = 0
+    for row in db["donations"].aggregate([
+        {"$match": {"blood_group": blood_group, "date": donation_dates(month)}},
+        {"$group": {"_id": "$branch_id", "donations": {"$sum": 1}, "units": {"$sum": "$units"}}},
+    ]):
+        branch = row["_id"] or DEFAULT_BRANCH
+        sites[branch] = sites.get(branch, 0) + row["units"]
+        donations += row["donations"]
+        units += row["units"]
+    flows = {row["_id"]: row["units"] for row in db["inventory_ledger"].aggregate([
+        {"$match": {"blood_group": blood_group, "ts": {"$gte": start, "$lt": end}}},
+        {"$group": {"_id": "$kind", "units": {"$sum": "$change"}}},
+    ])}
+    return {
+        "month": month,
+        "blood_group": blood_group,
+        "donations": donations,
+        "units": units,
+        # Pairs rather than a dict: branch ids are free text and may not be valid field names
+        "sites": sorted(sites.items()),
+        "flows": flows,
+        "opening": stock_at(db, blood_group, start) if start <= end else None,
+        "closing": stock_at(db, blood_group, end),
+    }
+
+
+# Each pool process opens its own client; MongoClient must not be shared across a fork
+worker_db = None
+
+
+def init_worker(uri, db_name):
+    global worker_db
+    worker_db = connect(uri)[db_name]
+
+
+def run_partition(month, blood_group):
+    return compute_partition(worker_db, month, blood_group)
+
+
+def generate_report(db, months, workers=REPORT_WORKERS, uri=MONGO_URI, db_name="blood_bank", progress=None):
+    """Build the report for months, recomputing only partitions whose fingerprint changed.
+
+    Stale partitions are aggregated in a pool of up to workers processes (inline when workers
+    is 1 or fewer, or only one partition is stale) that connect to uri/db_name.
+    progress(done, total) is called as partitions finish. Returns (report, partitions recomputed).
+    """
+    cache = db["report_partitions"]
+    keys = [(month, group) for month in months for group in BLOOD_GROUPS]
+    fingerprints = period_fingerprints(db, months)
+    cached = {doc["_id"]: doc for doc in cache.find({"_id": {"$in": [partition_id(*key) for key in keys]}})}
+    partitions, stale = {}, []
+    for key in keys:
+        doc = cached.get(partition_id(*key))
+        if doc is not None and doc["fingerprint"] == fingerprints[key]:
+            partitions[key] = doc["result"]
+        else:
+            stale.append(key)
+    done = len(partitions)
+    if progress:
+        progress(done, len(keys))
+
+    def store(key, result):
+        nonlocal done
+        partitions[key] = result
+        cache.replace_one({"_id": partition_id(*key)}, {
+            "fingerprint": fingerprints[key], "result": result, "computed_at": datetime.now()}, upsert=True)
+        done += 1
+        if progress:
+            progress(done, len(keys))
+
+    if workers > 1 and len(stale) > 1:
+        # spawn, not fork: the GUI and the driver run threads a forked child would inherit mid-flight
+        with ProcessPoolExecutor(max_workers=min(workers, len(stale)), mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=init_worker, initargs=(uri, db_name)) as pool:
+            for key, result in zip(stale, pool.map(run_partition, *zip(*stale))):
+                store(key, result)
+    else:
+        for key in stale:
+            store(key, compute_partition(db, *key))
+    return merge_partitions(months, partitions), len(stale)
+
+
+def merge_partitions(months, partitions):
+    """Combine partition results into per-(month, group) rows, top sites and monthly totals."""
+    rows, sites, totals = [], {}, {}
+    for month in months:
+        month_sites = {}
+        total = {"donations": 0, "units": 0, "received": 0, "issued": 0, "expired": 0, "closing": 0}
+        for group in BLOOD_GROUPS:
+            part = partitions[(month, group)]
+            flows = part["flows"]
+            opening, closing = part["opening"], part["closing"]
+            issued = -flows.get("collect", 0)
+            average = (opening + closing) / 2 if opening is not None and closing is not None else None
+            row = {
+                "month": month,
+                "blood_group": group,
+                "donations": part["donations"],
+                "units_donated": part["units"],
+                "received": sum(flows.get(kind, 0) for kind in RECEIVED_KINDS),
+                "issued": issued,
+                "expired": -flows.get("expiry", 0),
+                "transferred": flows.get("transfer_in", 0) + flows.get("transfer_out", 0),
+                "opening_stock": opening,
+                "closing_stock": closing,
+                "turnover": round(issued / average, 2) if average else None,
+            }
+            rows.append(row)
+            for branch, units in part["sites"]:
+                month_sites[branch] = month_sites.get(branch, 0) + units
+            total["donations"] += row["donations"]
+            total["units"] += row["units_donated"]
+            total["received"] += row["received"]
+            total["issued"] += issued
+            total["expired"] += row["expired"]
+            total["closing"] = None if closing is None or total["closing"] is None else total["closing"] + closing
+        sites[month] = sorted(month_sites.items(), key=lambda item: (-item[1], item[0]))[:REPORT_TOP_SITES]
+        totals[month] = total
+    return {"months": months, "generated_at": datetime.now(), "rows": rows, "sites": sites, "totals": totals}
+
+
+REPORT_COLUMNS = ["month", "blood_group", "donations", "units_donated", "received", "issued", "expired",
+                  "transferred", "opening_stock", "closing_stock", "turnover"]
+
+
+def render_csv(report, path):
+    """Write the per-(month, group) rows to path and the top sites next to it; returns the files written."""
+    sites_path = os.path.splitext(path)[0] + "-sites.csv"
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, REPORT_COLUMNS)
+        writer.writeheader()
+        writer.writerows(report["rows"])
+    with open(sites_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["month", "rank", "branch_id", "units_donated"])
+        for month, ranked in report["sites"].items():
+            for rank, (branch, units) in enumerate(ranked, 1):
+                writer.writerow([month, rank, branch, units])
+    return [path, sites_path]
+
+
+def render_html(report, path):
+    """Write the report as one self-contained HTML page; returns the files written."""
+    def cell(value):
+        return "<td>-</td>" if value is None else f"<td>{html.escape(str(value))}</td>"
+
+    parts = [
+        "<!DOCTYPE html><html><head><meta charset='utf-8'><title>Blood Bank Report</title><style>",
+        "body{font-family:Arial,sans-serif;margin:2em;color:#1C2833}table{border-collapse:collapse;margin-bottom:1.5em}",
+        "th,td{border:1px solid #BDC3C7;padding:4px 10px;text-align:right}th{background:#2C3E50;color:#ECF0F1}",
+        "td:first-child,th:first-child{text-align:left}",
+        "</style></head><body>",
+        f"<h1>Blood Bank Report: {html.escape(report['months'][0])} to {html.escape(report['months'][-1])}</h1>",
+        f"<p>Generated {report['generated_at']:%Y-%m-%d %H:%M}</p>",
+    ]
+    for month in report["months"]:
+        total = report["totals"][month]
+        parts.append(f"<h2>{html.escape(month)}</h2>")
+        parts.append(f"<p>{total['donations']} donations, {total['units']} units donated, {total['issued']} issued, "
+                     f"{total['expired']} expired; closing stock {'-' if total['closing'] is None else total['closing']}</p>")
+        parts.append("<table><tr>" + "".join(f"<th>{html.escape(c.replace('_', ' '))}</th>" for c in REPORT_COLUMNS[1:])
+                     + "</tr>")
+        for row in report["rows"]:
+            if row["month"] == month:
+                parts.append("<tr>" + "".join(cell(row[c]) for c in REPORT_COLUMNS[1:]) + "</tr>")
+        parts.append("</table>")
+        if report["sites"][month]:
+            parts.append("<table><tr><th>Top sites</th><th>units donated</th></tr>")
+            parts.extend(f"<tr>{cell(branch)}{cell(units)}</tr>" for branch, units in report["sites"][month])
+            parts.append("</table>")
+    parts.append("</body></html>")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(parts))
+    return [path]
+
+
+def write_report(report, path, fmt=None):
+    """Render report as HTML or CSV, chosen by fmt or the file extension; returns the files written."""
+    fmt = fmt or ("csv" if path.lower().endswith(".csv") else "html")
+    if fmt not in ("csv", "html"):
+        raise ValueError(f"Unknown report format: {fmt}")
+    return render_csv(report, path) if fmt == "csv" else render_html(report, path)
@@ -0,0 +1,2402 @@
+"""Blood bank operations independent of the Tk interface.
+
+Everything here works on plain pymongo (or mongomock) collections so it can be
+called from scripts, benchmarks and the GUI alike.
+"""
+from bson import ObjectId, encode, json_util
+from bson.errors import InvalidId
+from pymongo import MongoClient, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, ConnectionFailure, DuplicateKeyError, OperationFailure, PyMongoError
+from datetime import datetime, timedelta
+import copy
+import csv
+import inspect
+import json
+import math
+import os
+import threading
+import time
+
+BLOOD_GROUPS = ['A+', 'A-', 'B+', 'B-', 'AB+', 'AB-', 'O+', 'O-']
+GENDERS = ['male', 'female', 'prefer_not_to_say']
+# Collection site used when a user, import or legacy document has none
+DEFAULT_BRANCH = os.environ.get("BLOOD_BANK_BRANCH", "main")
+
+# Where users, donors, donations and stock live: "mongo" or "sqlite" (see storage.py)
+STORAGE_BACKEND = os.environ.get("BLOOD_BANK_STORAGE", "mongo")
+MONGO_URI = os.environ.get("BLOOD_BANK_MONGO_URI", "mongodb://localhost:27017/")
+MONGO_MAX_POOL_SIZE = int(os.environ.get("BLOOD_BANK_MONGO_MAX_POOL_SIZE", "20"))
+# A down server fails queries after this long instead of the driver's default 30 s
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get("BLOOD_BANK_MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.environ.get("BLOOD_BANK_MONGO_CONNECT_TIMEOUT_MS", "5000"))
+# 0 leaves socket reads without a timeout (long index builds and exports)
+MONGO_SOCKET_TIMEOUT_MS = int(os.environ.get("BLOOD_BANK_MONGO_SOCKET_TIMEOUT_MS", "0"))
+
+
+def connect(uri=MONGO_URI):
+    """Create a client without touching the network; the first operation opens the connection."""
+    return MongoClient(
+        uri,
+        connect=False,
+        maxPoolSize=MONGO_MAX_POOL_SIZE,
+        serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+        socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS or None,
+    )
+
+
+# Instrumentation is off unless BLOOD_BANK_METRICS=1; when off nothing is wrapped
+METRICS_ENABLED = os.environ.get("BLOOD_BANK_METRICS", "0") == "1"
+# Where to export metrics: *.prom gets Prometheus text format, anything else JSON lines
+METRICS_FILE = os.environ.get("BLOOD_BANK_METRICS_FILE", "")
+METRICS_EXPORT_INTERVAL = float(os.environ.get("BLOOD_BANK_METRICS_INTERVAL", "15"))
+# Histogram bucket upper bounds in seconds
+METRICS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Collection methods that return a cursor; they are timed over iteration, not the call
+CURSOR_METHODS = {"find", "aggregate"}
+CURSOR_CHAIN_METHODS = {"sort", "limit", "skip", "batch_size", "hint", "max_time_ms", "collation"}
+
+
+def payload_size(doc):
+    try:
+        return len(encode(doc))
+    except Exception:
+        return 0
+
+
+class Metrics:
+    """Thread-safe latency histograms with document and byte counts per operation name."""
+
+    def __init__(self, buckets=METRICS_BUCKETS):
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        # name -> {"buckets": counts (last one is +Inf), "count", "sum", "max", "docs", "bytes"}
+        self.operations = {}
+
+    def record(self, name, seconds, docs=0, size=0):
+        with self.lock:
+            op = self.operations.get(name)
+            if op is None:
+                op = self.operations[name] = {"buckets": [0] * (len(self.buckets) + 1), "count": 0,
+                                              "sum": 0.0, "max": 0.0, "docs": 0, "bytes": 0}
+            index = next((i for i, bound in enumerate(self.buckets) if seconds <= bound), len(self.buckets))
+            op["buckets"][index] += 1
+            op["count"] += 1
+            op["sum"] += seconds
+            op["max"] = max(op["max"], seconds)
+            op["docs"] += docs
+            op["bytes"] += size
+
+    def timed(self, name, fn, count=None):
+        """Wrap fn so each call is recorded under name; count(*args) gives its document count."""
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.record(name, time.perf_counter() - start, count(*args) if count else 0)
+        return wrapper
+
+    def reset(self):
+        with self.lock:
+            self.operations = {}
+
+    def percentile(self, op, q):
+        """Estimate the q-th quantile in seconds by interpolating inside its histogram bucket."""
+        rank = q * op["count"]
+        seen = 0
+        for i, n in enumerate(op["buckets"]):
+            if n and seen + n >= rank:
+                lower = self.buckets[i - 1] if i else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else op["max"]
+                return min(lower + (upper - lower) * (rank - seen) / n, op["max"])
+            seen += n
+        return op["max"]
+
+    def summary(self):
+        """One row per operation, slowest p95 first, with latencies in milliseconds."""
+        with self.lock:
+            operations = {name: dict(op, buckets=list(op["buckets"])) for name, op in self.operations.items()}
+        rows = [{
+            "operation": name,
+            "count": op["count"],
+            "p50_ms": round(self.percentile(op, 0.50) * 1000, 3),
+            "p95_ms": round(self.percentile(op, 0.95) * 1000, 3),
+            "p99_ms": round(self.percentile(op, 0.99) * 1000, 3),
+            "max_ms": round(op["max"] * 1000, 3),
+            "docs": op["docs"],
+            "bytes": op["bytes"],
+        } for name, op in operations.items()]
+        rows.sort(key=lambda row: row["p95_ms"], reverse=True)
+        return rows
+
+    def write_jsonl(self, path):
+        """Append the current summary, one JSON object per operation, stamped with the time."""
+        now = datetime.now().isoformat(timespec="seconds")
+        with open(path, "a", encoding="utf-8") as f:
+            for row in self.summary():
+                f.write(json.dumps(dict(row, time=now)) + "\n")
+
+    def write_prometheus(self, path):
+        """Replace path with the histograms in Prometheus text format (for a textfile collector)."""
+        with self.lock:
+            operations = sorted((name, dict(op, buckets=list(op["buckets"]))) for name, op in self.operations.items())
+        lines = ["# HELP blood_bank_operation_seconds Latency of database operations and screen renders.",
+                 "# TYPE blood_bank_operation_seconds histogram"]
+        for name, op in operations:
+            cumulative = 0
+            for bound, n in zip(list(self.buckets) + ["+Inf"], op["buckets"]):
+                cumulative += n
+                lines.append(f'blood_bank_operation_seconds_bucket{{operation="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'blood_bank_operation_seconds_sum{{operation="{name}"}} {op["sum"]}')
+            lines.append(f'blood_bank_operation_seconds_count{{operation="{name}"}} {op["count"]}')
+        for metric, field, help_text in [("documents", "docs", "Documents returned or written."),
+                                         ("payload_bytes", "bytes", "BSON bytes returned or written.")]:
+            lines.append(f"# HELP blood_bank_{metric}_total {help_text}")
+            lines.append(f"# TYPE blood_bank_{metric}_total counter")
+            for name, op in operations:
+                lines.append(f'blood_bank_{metric}_total{{operation="{name}"}} {op[field]}')
+        # Write then rename so a scrape never sees a half-written file
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp, path)
+
+    def export(self, path):
+        if path.endswith(".prom"):
+            self.write_prometheus(path)
+        else:
+            self.write_jsonl(path)
+
+    def start_export_job(self, path, interval=METRICS_EXPORT_INTERVAL):
+        """Export to path every interval seconds on a daemon thread."""
+        stop = threading.Event()
+
+        def run():
+            while not stop.wait(interval):
+                try:
+                    self.export(path)
+                except OSError:
+                    pass
+
+        threading.Thread(target=run, name="metrics-export", daemon=True).start()
+        return stop
+
+
+class InstrumentedCursor:
+    """Cursor wrapper that records the time spent fetching, the documents read and their size."""
+
+    def __init__(self, cursor, metrics, name):
+        self.cursor = cursor
+        self.metrics = metrics
+        self.name = name
+
+    def __getattr__(self, attr):
+        value = getattr(self.cursor, attr)
+        if attr in CURSOR_CHAIN_METHODS:
+            def chain(*args, **kwargs):
+                value(*args, **kwargs)
+                return self
+            return chain
+        return value
+
+    def __next__(self):
+        # For callers taking single documents, such as next(collection.aggregate(...))
+        start = time.perf_counter()
+        try:
+            doc = next(self.cursor)
+        except StopIteration:
+            self.metrics.record(self.name, time.perf_counter() - start)
+            raise
+        self.metrics.record(self.name, time.perf_counter() - start, 1, payload_size(doc))
+        return doc
+
+    def __iter__(self):
+        # Only time spent inside the driver counts, not the caller's work between documents
+        elapsed = 0.0
+        docs = size = 0
+        it = iter(self.cursor)
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    doc = next(it)
+                except StopIteration:
+                    return
+                finally:
+                    elapsed += time.perf_counter() - start
+                docs += 1
+                size += payload_size(doc)
+                yield doc
+        finally:
+            self.metrics.record(self.name, elapsed, docs, size)
+
+
+class InstrumentedCollection:
+    """Collection wrapper that records every operation as "<collection>.<method>"."""
+
+    def __init__(self, collection, metrics):
+        self.collection = collection
+        self.metrics = metrics
+
+    def __getattr__(self, attr):
+        value = getattr(self.collection, attr)
+        if not inspect.ismethod(value) or attr.startswith("_") or attr == "watch":
+            return value
+        name = f"{self.collection.name}.{attr}"
+        if attr in CURSOR_METHODS:
+            return lambda *args, **kwargs: InstrumentedCursor(value(*args, **kwargs), self.metrics, name)
+
+        def call(*args, **kwargs):
+            start = time.perf_counter()
+            result = value(*args, **kwargs)
+            elapsed = time.perf_counter() - start
+            if isinstance(result, dict):
+                self.metrics.record(name, elapsed, 1, payload_size(result))
+            elif attr == "insert_one":
+                self.metrics.record(name, elapsed, 1, payload_size(args[0]) if args else 0)
+            elif attr == "insert_many":
+                docs = args[0] if args and isinstance(args[0], list) else []
+                self.metrics.record(name, elapsed, len(result.inserted_ids), sum(payload_size(d) for d in docs))
+            elif attr == "bulk_write":
+                self.metrics.record(name, elapsed, len(args[0]) if args and isinstance(args[0], list) else 0)
+            else:
+                self.metrics.record(name, elapsed)
+            return result
+        return call
+
+
+class InstrumentedDatabase:
+    """Database wrapper whose collections are instrumented."""
+
+    def __init__(self, db, metrics):
+        self.db = db
+        self.metrics = metrics
+
+    def __getitem__(self, name):
+        return InstrumentedCollection(self.db[name], self.metrics)
+
+    def __getattr__(self, attr):
+        return getattr(self.db, attr)
+
+
+def name_key(name):
+    """Case-folded name stored alongside the display name so prefix search can use an index."""
+    return name.strip().lower()
+
+
+def validate_donor(name, age, gender, blood_group):
+    """Build a donor document from form or import values, raising ValueError with a user-facing message."""
+    if not name or not age or not gender or not blood_group:
+        raise ValueError("All fields are required")
+    try:
+        age_int = int(age)
+    except ValueError:
+        raise ValueError("Age must be a number")
+    gender = gender.strip().lower().replace(" ", "_")
+    if gender not in GENDERS:
+        raise ValueError(f"Unknown gender: {gender}")
+    if blood_group not in BLOOD_GROUPS:
+        raise ValueError(f"Unknown blood group: {blood_group}")
+    return {
+        'name': name,
+        'name_key': name_key(name),
+        'age': age_int,
+        'gender': gender,
+        'blood_group': blood_group
+    }
+
+
+def validate_donation(name, age, gender, blood_group, units, date=None):
+    """Build a donation document from form or import values, raising ValueError with a user-facing message."""
+    if not units:
+        raise ValueError("All fields are required")
+    donation = validate_donor(name, age, gender, blood_group)
+    try:
+        donation['units'] = int(units)
+    except ValueError:
+        raise ValueError("Age and Units must be numbers")
+    if donation['units'] <= 0:
+        raise ValueError("Units must be greater than zero")
+    if date:
+        try:
+            datetime.strptime(date, "%Y-%m-%d")
+        except ValueError:
+            raise ValueError(f"Date must be YYYY-MM-DD: {date}")
+    donation['date'] = date or datetime.now().strftime("%Y-%m-%d")
+    return donation
+
+
+# Deferral rules: donor age limits and the minimum gap between two donations
+MIN_DONOR_AGE = int(os.environ.get("BLOOD_BANK_MIN_DONOR_AGE", "18"))
+MAX_DONOR_AGE = int(os.environ.get("BLOOD_BANK_MAX_DONOR_AGE", "65"))
+DONATION_INTERVAL_DAYS = int(os.environ.get("BLOOD_BANK_DONATION_INTERVAL_DAYS", "56"))
+
+
+class DeferralError(ValueError):
+    """Raised when a donor may not give blood; next_date is when they may again, if ever."""
+
+    def __init__(self, message, next_date=None):
+        super().__init__(message)
+        self.next_date = next_date
+
+
+def eligibility_cutoff(day=None):
+    """Latest last_donated date (YYYY-MM-DD) that still allows a donation on day, default today."""
+    try:
+        day = datetime.strptime(day, "%Y-%m-%d") if day else datetime.now()
+    except ValueError:
+        raise ValueError(f"Date must be YYYY-MM-DD: {day}")
+    return (day - timedelta(days=DONATION_INTERVAL_DAYS)).strftime("%Y-%m-%d")
+
+
+def check_eligibility(age, last_donated=None, day=None):
+    """Raise DeferralError if a donor of this age who last gave on last_donated may not give on day.
+
+    A last_donated after day means day is a back-dated record, which is not checked against it.
+    """
+    if age < MIN_DONOR_AGE:
+        raise DeferralError(f"Donors must be at least {MIN_DONOR_AGE} years old")
+    if age > MAX_DONOR_AGE:
+        raise DeferralError(f"Donors must be at most {MAX_DONOR_AGE} years old")
+    day = day or datetime.now().strftime("%Y-%m-%d")
+    if last_donated and eligibility_cutoff(day) < last_donated <= day:
+        next_date = (datetime.strptime(last_donated, "%Y-%m-%d")
+                     + timedelta(days=DONATION_INTERVAL_DAYS)).strftime("%Y-%m-%d")
+        raise DeferralError(f"Last donated on {last_donated}; eligible again on {next_date}", next_date)
+
+
+def eligible_filter(day=None, blood_groups=None):
+    """Query for donors allowed to give on day, served by the donors (blood_group, last_donated, age) index.
+
+    Donors who never gave have no last_donated, which sorts below every date.
+    """
+    return {
+        "blood_group": {"$in": list(blood_groups or BLOOD_GROUPS)},
+        "last_donated": {"$not": {"$gt": eligibility_cutoff(day)}},
+        "age": {"$gte": MIN_DONOR_AGE, "$lte": MAX_DONOR_AGE},
+    }
+
+
+def last_donated_updates(donations):
+    """Updates moving each linked donor's last_donated up to their latest donation in donations."""
+    latest = {}
+    for donation in donations:
+        donor_id = donation.get("donor_id")
+        if donor_id is not None and donation["date"] > latest.get(donor_id, ""):
+            latest[donor_id] = donation["date"]
+    return [UpdateOne({"_id": donor_id}, {"$max": {"last_donated": date}}) for donor_id, date in latest.items()]
+
+# Units per group below which stock is low, e.g. BLOOD_BANK_MIN_STOCK="O-=20,O+=30"; unlisted groups get the default
+MIN_STOCK_DEFAULT = int(os.environ.get("BLOOD_BANK_MIN_STOCK_DEFAULT", "10"))
+# A low-stock alert clears only once stock is this fraction above the minimum, so it doesn't flap
+ALERT_HYSTERESIS = float(os.environ.get("BLOOD_BANK_ALERT_HYSTERESIS", "0.2"))
+ALERT_LOG_PATH = os.environ.get("BLOOD_BANK_ALERT_LOG", os.path.join(os.path.expanduser("~"), ".blood_bank_alerts.jsonl"))
+
+
+def parse_min_stock(spec, default=MIN_STOCK_DEFAULT):
+    """{blood_group: minimum units} from "GROUP=N,GROUP=N"; groups not listed get default."""
+    levels = {group: default for group in BLOOD_GROUPS}
+    for item in filter(None, (part.strip() for part in (spec or "").split(","))):
+        group, _, value = item.partition("=")
+        group = group.strip()
+        if group not in BLOOD_GROUPS:
+            raise ValueError(f"Unknown blood group in minimum stock levels: {group}")
+        try:
+            levels[group] = int(value)
+        except ValueError:
+            raise ValueError(f"Minimum stock for {group} must be a number")
+    return levels
+
+
+MIN_STOCK = parse_min_stock(os.environ.get("BLOOD_BANK_MIN_STOCK"))
+
+
+class StockAlerts:
+    """Low-stock state per (branch, group), moved by each new stock level it is shown.
+
+    A group goes low when it falls below its minimum and recovers only once it is back to the
+    minimum plus the hysteresis margin. Each transition is appended to the alert log and passed
+    to every listener, on the thread that reported the change.
+    """
+
+    def __init__(self, levels=None, hysteresis=ALERT_HYSTERESIS, log_path=ALERT_LOG_PATH):
+        self.levels = dict(levels or MIN_STOCK)
+        self.hysteresis = hysteresis
+        self.log_path = log_path
+        self.active = {}
+        self.listeners = []
+        self.lock = threading.Lock()
+
+    def recovery_level(self, blood_group):
+        minimum = self.levels.get(blood_group, 0)
+        return minimum + max(1, math.ceil(minimum * self.hysteresis)) if minimum else 0
+
+    def check(self, branch_id, blood_group, amount):
+        """Update one group from its new amount; returns the alert raised or cleared, or None."""
+        key = (branch_id, blood_group)
+        with self.lock:
+            alert = self.active.get(key)
+            if alert is None and amount < self.levels.get(blood_group, 0):
+                alert = {"branch_id": branch_id, "blood_group": blood_group, "amount": amount,
+                         "minimum": self.levels[blood_group], "state": "low", "at": datetime.now()}
+                self.active[key] = alert
+            elif alert is not None and amount >= self.recovery_level(blood_group):
+                del self.active[key]
+                alert = dict(alert, amount=amount, state="recovered", at=datetime.now())
+            else:
+                if alert is not None:
+                    alert["amount"] = amount
+                return None
+            self.log(alert)
+        for listener in self.listeners:
+            listener(alert)
+        return alert
+
+    def log(self, alert):
+        try:
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(alert, default=str) + "\n")
+        except OSError:
+            # A missing alert log must never fail the stock change that triggered it
+            pass
+
+    def low(self, branch_id=None):
+        """Active low-stock alerts, for one branch or all of them."""
+        with self.lock:
+            return [dict(alert) for (branch, _), alert in sorted(self.active.items())
+                    if branch_id is None or branch == branch_id]
+
+
+# Seconds before cached inventory is re-read when no change stream is available
+INVENTORY_CACHE_TTL = float(os.environ.get("BLOOD_BANK_INVENTORY_TTL", "30"))
+
+
+class InventoryCache:
+    """One branch's per-group stock levels, loaded with a single query and kept current from write results.
+
+    Every level it loads or is given is also passed to alerts, when set.
+    """
+
+    def __init__(self, collection, ttl=INVENTORY_CACHE_TTL, branch_id=DEFAULT_BRANCH, alerts=None):
+        self.collection = collection
+        self.ttl = ttl
+        self.branch_id = branch_id
+        self.alerts = alerts
+        self.amounts = {}
+        self.loaded_at = None
+        self.watching = False
+        self.watch_started = False
+        self.lock = threading.Lock()
+
+    def is_fresh(self):
+        if self.loaded_at is None:
+            return False
+        return self.watching or time.monotonic() - self.loaded_at < self.ttl
+
+    def snapshot(self):
+        """Return {blood_group: amount} for all groups, reloading from MongoDB only when stale."""
+        with self.lock:
+            if self.is_fresh():
+                return dict(self.amounts)
+        amounts = {group: 0 for group in BLOOD_GROUPS}
+        stocked = []
+        for doc in self.collection.find({"branch_id": self.branch_id}, {"_id": 0, "blood_group": 1, "amount": 1}):
+            amounts[doc["blood_group"]] = doc.get("amount", 0)
+            stocked.append(doc["blood_group"])
+        with self.lock:
+            self.amounts = amounts
+            self.loaded_at = time.monotonic()
+        if self.alerts is not None:
+            # Groups a branch has never held are not alerted on
+            for group in stocked:
+                self.alerts.check(self.branch_id, group, amounts[group])
+        return dict(amounts)
+
+    def get(self, blood_group):
+        return self.snapshot().get(blood_group, 0)
+
+    def apply(self, doc):
+        """Update one group in place from the document returned by an $inc.
+
+        Documents of other branches (from the change stream) only go to alerts.
+        """
+        if not doc:
+            return
+        branch_id = doc.get("branch_id", self.branch_id)
+        if self.alerts is not None:
+            self.alerts.check(branch_id, doc["blood_group"], doc.get("amount", 0))
+        if branch_id != self.branch_id:
+            return
+        with self.lock:
+            self.amounts[doc["blood_group"]] = doc.get("amount", 0)
+
+    def refresh(self):
+        """Drop the cached levels after a change with no result document; reloads right away when alerting."""
+        self.invalidate()
+        if self.alerts is not None:
+            self.snapshot()
+
+    def invalidate(self):
+        with self.lock:
+            self.loaded_at = None
+
+    def watch(self):
+        """Follow the collection's change stream in the background; the TTL applies when it is unsupported."""
+        if self.watch_started:
+            return
+        self.watch_started = True
+
+        def follow():
+            try:
+                with self.collection.watch(full_document="updateLookup") as stream:
+                    self.watching = True
+                    for change in stream:
+                        if change.get("fullDocument"):
+                            self.apply(change["fullDocument"])
+                        else:
+                            self.invalidate()
+            except PyMongoError:
+                pass
+            finally:
+                self.watching = False
+                self.watch_started = False
+                self.invalidate()
+
+        threading.Thread(target=follow, name="inventory-watch", daemon=True).start()
+
+
+# Extra attempts for an inventory update that lost a race (upsert collision or write conflict)
+TRANSACTION_RETRIES = 3
+WRITE_CONFLICT = 112
+
+
+class InventoryError(Exception):
+    """Raised when a transaction cannot be applied to the current stock."""
+
+
+class InsufficientStockError(InventoryError):
+    """Raised when a collect asks for more units than the group holds."""
+
+
+def update_inventory(collection, blood_group, transaction_type, amount, retries=TRANSACTION_RETRIES,
+                     branch_id=DEFAULT_BRANCH):
+    """Atomically collect or deposit units at a branch and return the updated inventory document.
+
+    A collect only matches while the group holds at least amount units, so concurrent
+    collects can never take the stock below zero or overwrite each other.
+    """
+    if amount <= 0:
+        raise InventoryError("Amount must be greater than zero")
+    if transaction_type == "collect":
+        query = {"branch_id": branch_id, "blood_group": blood_group, "amount": {"$gte": amount}}
+        change = -amount
+    else:
+        query = {"branch_id": branch_id, "blood_group": blood_group}
+        change = amount
+
+    for attempt in range(retries + 1):
+        try:
+            doc = collection.find_one_and_update(
+                query,
+                {"$inc": {"amount": change}},
+                upsert=transaction_type != "collect",
+                return_document=ReturnDocument.AFTER
+            )
+            break
+        except DuplicateKeyError:
+            # Another deposit created the group first; the $inc will now match it
+            if attempt == retries:
+                raise
+        except OperationFailure as e:
+            if e.code != WRITE_CONFLICT or attempt == retries:
+                raise
+        time.sleep(0.005 * (attempt + 1))
+
+    if doc is None:
+        if collection.find_one({"branch_id": branch_id, "blood_group": blood_group}, {"_id": 1}) is None:
+            raise InventoryError(f"No inventory found for {blood_group} blood group")
+        raise InsufficientStockError(f"Insufficient {blood_group} blood units")
+    return doc
+
+
+# Every donation or deposit becomes a batch that expires SHELF_LIFE_DAYS after collection
+SHELF_LIFE_DAYS = int(os.environ.get("BLOOD_BANK_SHELF_LIFE_DAYS", "42"))
+# Seconds between sweeps that retire expired batches
+EXPIRY_SWEEP_INTERVAL = float(os.environ.get("BLOOD_BANK_EXPIRY_SWEEP_INTERVAL", "3600"))
+
+
+def new_batch(blood_group, units, collected_at=None, source="donation", source_id=None, branch_id=DEFAULT_BRANCH):
+    collected_at = collected_at or datetime.now()
+    return {
+        "branch_id": branch_id,
+        "blood_group": blood_group,
+        "units": units,
+        "remaining": units,
+        "collected_at": collected_at,
+        "expires_at": collected_at + timedelta(days=SHELF_LIFE_DAYS),
+        "status": "available",
+        "source": source,
+        "source_id": source_id,
+    }
+
+
+def donation_batch(donation):
+    """Batch for a donation; back-dated donations are collected at the start of their date."""
+    collected_at = datetime.strptime(donation['date'], "%Y-%m-%d")
+    if collected_at.date() == datetime.now().date():
+        collected_at = datetime.now()
+    return new_batch(donation['blood_group'], donation['units'], collected_at, "donation", donation.get('_id'),
+                     donation.get('branch_id', DEFAULT_BRANCH))
+
+
+def allocate_batches(batches, blood_group, amount, now=None, branch_id=DEFAULT_BRANCH):
+    """Draw amount units from the branch's unexpired batches that expire soonest.
+
+    Callers draw before taking the units off the group total (update_inventory), so units in
+    expired batches can never be collected. Each draw is one atomic pipeline update on the batch
+    with the earliest expires_at, served by the (branch_id, blood_group, expires_at) index. Returns
+    [(batch_id, units, expires_at)]. Raises InsufficientStockError, with the partial draws put
+    back, when the unexpired batches hold fewer than amount units.
+    """
+    now = now or datetime.now()
+    allocations = []
+    needed = amount
+    while needed > 0:
+        before = batches.find_one_and_update(
+            {"branch_id": branch_id, "blood_group": blood_group, "expires_at": {"$gt": now},
+             "status": "available", "remaining": {"$gt": 0}},
+            [{"$set": {
+                "remaining": {"$max": [0, {"$subtract": ["$remaining", needed]}]},
+                "status": {"$cond": [{"$gt": ["$remaining", needed]}, "available", "depleted"]}
+            }}],
+            sort=[("expires_at", 1)],
+            return_document=ReturnDocument.BEFORE
+        )
+        if before is None:
+            break
+        taken = min(before["remaining"], needed)
+        allocations.append((before["_id"], taken, before["expires_at"]))
+        needed -= taken
+    if needed > 0:
+        release_batches(batches, allocations)
+        raise InsufficientStockError(f"Insufficient unexpired {blood_group} blood units")
+    return allocations
+
+
+def release_batches(batches, allocations):
+    """Put units drawn by allocate_batches() back on their batches when the collect does not go ahead."""
+    for batch_id, units, _ in allocations:
+        batches.update_one({"_id": batch_id}, [{"$set": {
+            "remaining": {"$add": ["$remaining", units]},
+            "status": {"$cond": [{"$eq": ["$status", "depleted"]}, "available", "$status"]}
+        }}])
+
+
+def expire_batches(batches, inventory, now=None, ledger=None, branch_id=None, blood_group=None):
+    """Retire every batch past its expiry in bulk and take its remaining units off the branch totals.
+
+    branch_id and blood_group narrow the sweep to one branch's group, as collects do before drawing.
+    The deductions are appended to ledger when one is given. Returns {(branch_id, blood_group): units expired}.
+    """
+    now = now or datetime.now()
+    sweep_id = ObjectId()
+    query = {"status": "available", "expires_at": {"$lte": now}}
+    if branch_id is not None:
+        query.update(branch_id=branch_id, blood_group=blood_group)
+    result = batches.update_many(query, {"$set": {"status": "expired", "sweep_id": sweep_id}})
+    if not result.modified_count:
+        return {}
+    # Draws only touch available batches, so the remaining counts are final once marked
+    expired = {(row["_id"]["branch"], row["_id"]["group"]): row["units"] for row in batches.aggregate([
+        {"$match": {"sweep_id": sweep_id}},
+        {"$group": {"_id": {"branch": "$branch_id", "group": "$blood_group"}, "units": {"$sum": "$remaining"}}}
+    ]) if row["units"]}
+    if expired:
+        inventory.bulk_write([
+            UpdateOne({"branch_id": branch, "blood_group": group}, {"$inc": {"amount": -units}})
+            for (branch, group), units in expired.items()
+        ], ordered=False)
+        if ledger is not None:
+            append_ledger(ledger, [ledger_entry(branch, group, -units, "expiry", ref=sweep_id)
+                                   for (branch, group), units in expired.items()])
+    return expired
+
+
+# Seconds between ledger snapshots
+LEDGER_SNAPSHOT_INTERVAL = float(os.environ.get("BLOOD_BANK_LEDGER_SNAPSHOT_INTERVAL", "3600"))
+# Entries this recent may still be on their way in when a snapshot is cut, so snapshots stop short of them
+LEDGER_SETTLE_SECONDS = 60
+
+
+def ledger_time(moment=None):
+    """A ledger timestamp: now (or moment) at the millisecond precision BSON dates keep."""
+    moment = moment or datetime.now()
+    return moment.replace(microsecond=moment.microsecond // 1000 * 1000)
+
+
+def ledger_entry(branch_id, blood_group, change, kind, entry_id=None, ref=None):
+    """One signed change to a branch's stock of a group.
+
+    Changes that can be written twice (journal replay, transfer recovery) pass a fixed entry_id so
+    the second copy is dropped by append_ledger().
+    """
+    return {"_id": entry_id or ObjectId(), "ts": ledger_time(), "branch_id": branch_id,
+            "blood_group": blood_group, "change": change, "kind": kind, "ref": ref}
+
+
+def append_ledger(ledger, entries):
+    """Insert ledger entries, skipping any already recorded under the same _id."""
+    if not entries:
+        return
+    try:
+        ledger.insert_many(entries, ordered=False)
+    except BulkWriteError as e:
+        if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+            raise
+
+
+def ledger_changes(ledger, after=None, until=None):
+    """({(branch_id, blood_group): net change}, entries) over ledger entries with after < ts <= until."""
+    ts = {}
+    if after is not None:
+        ts["$gt"] = after
+    if until is not None:
+        ts["$lte"] = until
+    pipeline = [{"$match": {"ts": ts}}] if ts else []
+    pipeline.append({"$group": {"_id": {"branch": "$branch_id", "group": "$blood_group"},
+                                "units": {"$sum": "$change"}, "entries": {"$sum": 1}}})
+    changes, count = {}, 0
+    for row in ledger.aggregate(pipeline):
+        changes[(row["_id"]["branch"], row["_id"]["group"])] = row["units"]
+        count += row["entries"]
+    return changes, count
+
+
+def snapshot_totals(snapshot):
+    if snapshot is None:
+        return {}
+    return {(row["branch_id"], row["blood_group"]): row["units"] for row in snapshot["totals"]}
+
+
+def add_totals(totals, changes):
+    for key, units in changes.items():
+        totals[key] = totals.get(key, 0) + units
+    return totals
+
+
+def take_snapshot(ledger, snapshots, now=None):
+    """Fold the ledger up to LEDGER_SETTLE_SECONDS ago into a snapshot of per-(branch, group) totals.
+
+    Each snapshot builds on the latest one, so only the entries since then are read. Returns the
+    new snapshot, the latest one when it is already that recent, or None before bootstrap_schema()
+    has opened the ledger.
+    """
+    now = now or datetime.now()
+    position = ledger_time(now - timedelta(seconds=LEDGER_SETTLE_SECONDS))
+    last = snapshots.find_one(sort=[("position", -1)])
+    if last is None or last["position"] >= position:
+        return last
+    changes, count = ledger_changes(ledger, last["position"], position)
+    totals = add_totals(snapshot_totals(last), changes)
+    snapshot = {
+        "position": position,
+        "taken_at": now,
+        "entries": count,
+        "totals": [{"branch_id": branch, "blood_group": group, "units": units}
+                   for (branch, group), units in sorted(totals.items())],
+    }
+    snapshots.insert_one(snapshot)
+    return snapshot
+
+
+def rebuild_inventory(ledger, snapshots):
+    """({(branch_id, blood_group): units}, snapshot) from the latest snapshot plus the ledger entries after it."""
+    snapshot = snapshots.find_one(sort=[("position", -1)])
+    changes, _ = ledger_changes(ledger, snapshot["position"] if snapshot else None)
+    return add_totals(snapshot_totals(snapshot), changes), snapshot
+
+
+# Red cell compatibility as bitmasks over BLOOD_GROUPS: bit i stands for BLOOD_GROUPS[i]
+GROUP_BITS = {group: 1 << i for i, group in enumerate(BLOOD_GROUPS)}
+
+
+def can_donate(donor, recipient):
+    """ABO/Rh red cell compatibility: O gives to every ABO type, Rh- gives to Rh+ and Rh-."""
+    donor_abo, donor_rh = donor[:-1], donor[-1]
+    recipient_abo, recipient_rh = recipient[:-1], recipient[-1]
+    abo_ok = donor_abo == "O" or donor_abo == recipient_abo or recipient_abo == "AB"
+    return abo_ok and (donor_rh == "-" or recipient_rh == "+")
+
+
+# recipient group -> bitmask of donor groups it can receive from
+COMPATIBLE_DONORS = {
+    recipient: sum(GROUP_BITS[donor] for donor in BLOOD_GROUPS if can_donate(donor, recipient))
+    for recipient in BLOOD_GROUPS
+}
+# donor group -> how many recipient groups it can serve; wider groups are kept back when possible
+DONOR_REACH = {
+    donor: sum(1 for recipient in BLOOD_GROUPS if can_donate(donor, recipient))
+    for donor in BLOOD_GROUPS
+}
+MATCH_LIMIT = 50
+
+
+def compatible_groups(recipient):
+    mask = COMPATIBLE_DONORS[recipient]
+    return [group for group in BLOOD_GROUPS if mask & GROUP_BITS[group]]
+
+
+def rank_substitutes(recipient, amounts):
+    """Rank compatible groups with stock: the exact group first, then the least universal, then most stock."""
+    candidates = [(group, amounts.get(group, 0)) for group in compatible_groups(recipient)]
+    candidates = [(group, amount) for group, amount in candidates if amount > 0]
+    return sorted(candidates, key=lambda c: (c[0] != recipient, DONOR_REACH[c[0]], -c[1]))
+
+
+# Dashboard counters live in one document; per-day unit totals in one document per day
+STATS_ID = "counters"
+STATS_DAYS = 7
+# Seconds between checks of the counters against real collection counts
+RECONCILE_INTERVAL = float(os.environ.get("BLOOD_BANK_RECONCILE_INTERVAL", "900"))
+
+
+def day_stats_id(date):
+    return f"day:{date}"
+
+
+def recent_days(days=STATS_DAYS):
+    """Return the last days dates as YYYY-MM-DD strings, today first."""
+    today = datetime.now().date()
+    return [(today - timedelta(days=i)).strftime("%Y-%m-%d") for i in range(days)]
+
+
+def stats_updates(kind, docs):
+    """Build the $inc operations that keep the stats collection in step with inserted donors or donations."""
+    ops = [UpdateOne({"_id": STATS_ID}, {"$inc": {kind: len(docs)}}, upsert=True)]
+    if kind == "donations":
+        by_day = {}
+        for doc in docs:
+            inc = by_day.setdefault(doc["date"], {})
+            key = f"units.{doc['blood_group']}"
+            inc[key] = inc.get(key, 0) + doc["units"]
+        ops += [UpdateOne({"_id": day_stats_id(date)}, {"$inc": inc}, upsert=True) for date, inc in by_day.items()]
+    return ops
+
+
+# Donation analytics are read from per-period, per-group buckets in donation_rollups
+ROLLUP_GRANULARITIES = ["day", "week", "month"]
+ROLLUP_BATCH_SIZE = 1000
+
+
+def rollup_periods(date):
+    """Return {granularity: period key} for a YYYY-MM-DD date, e.g. week "2024-W07", month "2024-02"."""
+    day = datetime.strptime(date, "%Y-%m-%d").date()
+    year, week, _ = day.isocalendar()
+    return {"day": date, "week": f"{year}-W{week:02d}", "month": date[:7]}
+
+
+def rollup_id(granularity, period, blood_group):
+    return f"{granularity}:{period}:{blood_group}"
+
+
+def rollup_updates(docs):
+    """Build the $inc upserts that add donations to their day, week and month buckets."""
+    totals = {}
+    for doc in docs:
+        for granularity, period in rollup_periods(doc["date"]).items():
+            key = (granularity, period, doc["blood_group"])
+            units, count = totals.get(key, (0, 0))
+            totals[key] = (units + doc["units"], count + 1)
+    return [
+        UpdateOne(
+            {"_id": rollup_id(granularity, period, group)},
+            {
+                "$inc": {"units": units, "donations": count},
+                "$setOnInsert": {"granularity": granularity, "period": period, "blood_group": group}
+            },
+            upsert=True
+        )
+        for (granularity, period, group), (units, count) in totals.items()
+    ]
+
+
+def backfill_rollups(db, report=print):
+    """Rebuild donation_rollups from the donations collection.
+
+    Days are totalled by the server and weeks/months are derived from those day rows, so only
+    one row per (date, group) ever leaves MongoDB. Run it while donations are not being recorded,
+    or those recorded during the backfill may be counted twice or not at all.
+    """
+    totals = {}
+    for row in db['donations'].aggregate([
+        {"$group": {"_id": {"date": "$date", "group": "$blood_group"},
+                    "units": {"$sum": "$units"}, "donations": {"$sum": 1}}}
+    ], allowDiskUse=True):
+        try:
+            periods = rollup_periods(row["_id"]["date"])
+        except (TypeError, ValueError):
+            report(f"Skipping donations with unparseable date {row['_id']['date']!r}")
+            continue
+        for granularity, period in periods.items():
+            key = rollup_id(granularity, period, row["_id"]["group"])
+            bucket = totals.setdefault(key, {"granularity": granularity, "period": period,
+                                             "blood_group": row["_id"]["group"], "units": 0, "donations": 0})
+            bucket["units"] += row["units"]
+            bucket["donations"] += row["donations"]
+
+    rollups = db['donation_rollups']
+    ops = [UpdateOne({"_id": key}, {"$set": bucket}, upsert=True) for key, bucket in totals.items()]
+    for start in range(0, len(ops), ROLLUP_BATCH_SIZE):
+        rollups.bulk_write(ops[start:start + ROLLUP_BATCH_SIZE], ordered=False)
+        report(f"Wrote {min(start + ROLLUP_BATCH_SIZE, len(ops))} of {len(ops)} buckets")
+    stale = rollups.delete_many({"_id": {"$nin": list(totals)}}).deleted_count
+    if stale:
+        report(f"Removed {stale} buckets with no donations")
+    return len(totals)
+
+
+# Name of the donations -> donors linking migration in migration_log
+LINK_MIGRATION = "donations.donor_id"
+LEGACY_BATCH_MIGRATION = "blood_batches.legacy"
+# When stock from before batch tracking was collected is unknown, so migrate_legacy_batches() counts it as
+# collected at the migration and lets it expire this many days later. Set it lower to retire old stock sooner
+LEGACY_SHELF_LIFE_DAYS = int(os.environ.get("BLOOD_BANK_LEGACY_SHELF_LIFE_DAYS", str(SHELF_LIFE_DAYS)))
+LINK_BATCH_SIZE = 1000
+
+
+def match_donors(donors, docs):
+    """Return {index in docs: donor} for docs matching exactly one donor on name, age and blood group.
+
+    One query per call, served by the donors (name_key, _id) index. The donor documents hold
+    name_key, age, blood_group and last_donated.
+    """
+    keys = list({name_key(doc["name"]) for doc in docs})
+    candidates = {}
+    for donor in donors.find({"name_key": {"$in": keys}}, {"name_key": 1, "age": 1, "blood_group": 1, "last_donated": 1}):
+        key = (donor["name_key"], donor.get("age"), donor.get("blood_group"))
+        candidates.setdefault(key, []).append(donor)
+    matches = {}
+    for i, doc in enumerate(docs):
+        found = candidates.get((name_key(doc["name"]), doc.get("age"), doc.get("blood_group")), [])
+        if len(found) == 1:
+            matches[i] = found[0]
+    return matches
+
+
+def link_donations(db, batch_size=LINK_BATCH_SIZE, report=print):
+    """Set donor_id on donations that have none by matching donors on name, age and blood group.
+
+    Walks donations in _id order in batches. Each batch is logged to migration_log before it is
+    applied, so the run can be stopped and restarted at any point (linked donations are skipped)
+    and rollback_donation_links() can undo it. Donations without exactly one matching donor get
+    donor_id None so later runs don't rescan them. Linked donors' last_donated is moved up to
+    their latest donation (and left in place by a rollback). Returns (linked, unmatched).
+    """
+    donations, log = db["donations"], db["migration_log"]
+    linked = unmatched = 0
+    last = None
+    while True:
+        query = {"donor_id": {"$exists": False}}
+        if last is not None:
+            query["_id"] = {"$gt": last}
+        batch = list(donations.find(query, {"name": 1, "age": 1, "blood_group": 1, "date": 1})
+                     .sort("_id", 1).limit(batch_size))
+        if not batch:
+            break
+        last = batch[-1]["_id"]
+        matches = match_donors(db["donors"], batch)
+        links = [[doc["_id"], matches[i]["_id"] if i in matches else None] for i, doc in enumerate(batch)]
+        log.insert_one({"migration": LINK_MIGRATION, "at": datetime.now(), "links": links})
+        donations.bulk_write([
+            UpdateOne({"_id": donation_id, "donor_id": {"$exists": False}}, {"$set": {"donor_id": donor_id}})
+            for donation_id, donor_id in links
+        ], ordered=False)
+        updates = last_donated_updates([dict(doc, donor_id=donor_id) for doc, (_, donor_id) in zip(batch, links)])
+        if updates:
+            db["donors"].bulk_write(updates, ordered=False)
+        linked += len(matches)
+        unmatched += len(batch) - len(matches)
+        report(f"Linked {linked} donations, {unmatched} without a single matching donor")
+    return linked, unmatched
+
+
+def rollback_donation_links(db, report=print):
+    """Undo link_donations batch by batch, newest first. Returns the number of donations unlinked.
+
+    Only donor_ids still holding the value the migration set are removed.
+    """
+    donations, log = db["donations"], db["migration_log"]
+    unlinked = 0
+    for entry in log.find({"migration": LINK_MIGRATION}).sort("_id", -1):
+        if entry["links"]:
+            result = donations.bulk_write([
+                UpdateOne({"_id": donation_id, "donor_id": donor_id}, {"$unset": {"donor_id": ""}})
+                for donation_id, donor_id in entry["links"]
+            ], ordered=False)
+            unlinked += result.modified_count
+        log.delete_one({"_id": entry["_id"]})
+        report(f"Rolled back batch from {entry['at']:%Y-%m-%d %H:%M:%S} ({unlinked} donations unlinked so far)")
+    return unlinked
+
+
+# Indexes backing every query shape the app issues: (collection, keys, options)
+INDEXES = [
+    ("users", [("name", 1)], {"unique": True}),
+    ("users", [("branch_id", 1)], {}),
+    ("blood_inventory", [("branch_id", 1), ("blood_group", 1)], {"unique": True}),
+    ("donations", [("blood_group", 1), ("date", 1)], {}),
+    ("donations", [("date", 1), ("_id", 1)], {}),
+    ("donations", [("name_key", 1), ("_id", 1)], {}),
+    ("donations", [("blood_group", 1), ("name_key", 1), ("_id", 1)], {}),
+    ("donations", [("donor_id", 1), ("date", 1), ("_id", 1)], {}),
+    ("donors", [("blood_group", 1), ("name", 1)], {}),
+    ("donors", [("name_key", 1), ("_id", 1)], {}),
+    ("donors", [("blood_group", 1), ("name_key", 1), ("_id", 1)], {}),
+    ("donors", [("blood_group", 1), ("last_donated", 1), ("age", 1)], {}),
+    ("donation_rollups", [("granularity", 1), ("period", 1)], {}),
+    ("blood_batches", [("branch_id", 1), ("blood_group", 1), ("expires_at", 1)], {}),
+    ("blood_batches", [("status", 1), ("expires_at", 1)], {}),
+    ("transfers", [("state", 1), ("created_at", 1)], {}),
+    ("inventory_ledger", [("branch_id", 1), ("blood_group", 1), ("ts", 1), ("_id", 1)], {}),
+    ("inventory_ledger", [("ts", 1)], {}),
+    ("inventory_snapshots", [("position", 1)], {}),
+]
+
+# Representative filters for the queries issued by the screens, used by the explain() check
+QUERY_SHAPES = [
+    ("login", "users", {"name": "user", "password": "secret"}),
+    ("duplicate username check", "users", {"name": "user"}),
+    ("inventory by branch and group", "blood_inventory", {"branch_id": "main", "blood_group": "A+"}),
+    ("donations by group and date", "donations", {"blood_group": "A+", "date": {"$gte": "2024-01-01"}}),
+    ("donations by date range", "donations", {"date": {"$gte": "2024-01-01", "$lte": "2024-12-31"}}),
+    ("donors by group", "donors", {"blood_group": "A+"}),
+    ("donor name search", "donors", {"name_key": {"$gte": "ann", "$lt": "ann\uffff"}}),
+    ("donor search by group", "donors", {"blood_group": "A+", "name_key": {"$gte": "ann", "$lt": "ann\uffff"}}),
+    ("donation name search", "donations", {"name_key": {"$gte": "ann", "$lt": "ann\uffff"}}),
+    ("analytics buckets", "donation_rollups", {"granularity": "day", "period": {"$gte": "2024-01-01"}}),
+    ("FIFO batch allocation", "blood_batches", {"branch_id": "main", "blood_group": "A+",
+                                                "expires_at": {"$gt": datetime(2024, 1, 1)},
+                                                "status": "available", "remaining": {"$gt": 0}}),
+    ("donors eligible today", "donors", eligible_filter()),
+    ("donations for a donor", "donations", {"donor_id": ObjectId("000000000000000000000000")}),
+    ("stalled transfers", "transfers", {"state": "pending", "created_at": {"$lt": datetime(2024, 1, 1)}}),
+    ("expiry sweep", "blood_batches", {"status": "available", "expires_at": {"$lte": datetime(2024, 1, 1)}}),
+    ("ledger since snapshot", "inventory_ledger", {"ts": {"$gt": datetime(2024, 1, 1)}}),
+    ("group ledger history", "inventory_ledger", {"branch_id": "main", "blood_group": "A+"}),
+]
+
+INDEX_PROGRESS_INTERVAL = 2.0
+
+
+def watch_index_build(db, collection_name, report, done):
+    """Report the server's progress message for an index build until done is set."""
+    while not done.wait(INDEX_PROGRESS_INTERVAL):
+        try:
+            ops = db.client.admin.aggregate([
+                {"$currentOp": {}},
+                {"$match": {"command.createIndexes": collection_name}}
+            ])
+            for op in ops:
+                if op.get("msg"):
+                    report(f"  {collection_name}: {op['msg']}")
+        except PyMongoError:
+            return
+
+
+def migrate_branches(inventory, batches, report=print):
+    """Assign stock recorded before branches existed to the default branch and drop the per-group unique index.
+
+    Stock reads and deposits depend on it, so it runs before the first of them (BloodBankService.ready()).
+    """
+    for collection in (inventory, batches):
+        result = collection.update_many({"branch_id": {"$exists": False}}, {"$set": {"branch_id": DEFAULT_BRANCH}})
+        if result.modified_count:
+            report(f"Assigned {result.modified_count} {collection.name} documents to branch {DEFAULT_BRANCH}")
+    if "blood_group_1" in inventory.index_information():
+        # One document per group no longer holds; (branch_id, blood_group) is unique instead
+        report("Dropping legacy unique index blood_inventory(blood_group)...")
+        inventory.drop_index("blood_group_1")
+
+
+def migrate_legacy_batches(inventory, batches, report=print):
+    """Give stock recorded before batch tracking a batch of its own (once), so collects can draw every unit.
+
+    Collects only draw from batches, so this too runs before the first of them (BloodBankService.ready()).
+    Call it after migrate_branches(). Returns the number of batches added.
+    """
+    log = batches.database["migration_log"]
+    if log.find_one({"migration": LEGACY_BATCH_MIGRATION}, {"_id": 1}) is not None:
+        return 0
+    tracked = {(row["_id"]["branch"], row["_id"]["group"]): row["units"] for row in batches.aggregate([
+        {"$match": {"status": "available"}},
+        {"$group": {"_id": {"branch": "$branch_id", "group": "$blood_group"}, "units": {"$sum": "$remaining"}}},
+    ])}
+    now = datetime.now()
+    legacy = []
+    for doc in inventory.find({}, {"branch_id": 1, "blood_group": 1, "amount": 1}):
+        branch = doc.get("branch_id", DEFAULT_BRANCH)
+        untracked = doc.get("amount", 0) - tracked.get((branch, doc["blood_group"]), 0)
+        if untracked > 0:
+            batch = new_batch(doc["blood_group"], untracked, now, source="legacy", branch_id=branch)
+            batch["expires_at"] = now + timedelta(days=LEGACY_SHELF_LIFE_DAYS)
+            legacy.append(batch)
+    if legacy:
+        batches.insert_many(legacy)
+        report(f"Added {len(legacy)} batches for stock recorded before batch tracking")
+    log.insert_one({"migration": LEGACY_BATCH_MIGRATION, "at": now, "batches": len(legacy)})
+    return len(legacy)
+
+
+def bootstrap_schema(db, report=print):
+    """Idempotently create and verify the indexes in INDEXES. Returns a list of problems."""
+    problems = []
+    migrate_branches(db["blood_inventory"], db["blood_batches"], report)
+    for collection_name, keys, options in INDEXES:
+        collection = db[collection_name]
+        label = f"{collection_name}({', '.join(field for field, _ in keys)})"
+        report(f"Ensuring index {label}{' unique' if options.get('unique') else ''}...")
+
+        done = threading.Event()
+        threading.Thread(
+            target=watch_index_build, args=(db, collection_name, report, done), daemon=True
+        ).start()
+        start = time.perf_counter()
+        try:
+            name = collection.create_index(keys, **options)
+        except OperationFailure as e:
+            problems.append(f"{label}: {e}")
+            report(f"  FAILED: {e}")
+            continue
+        finally:
+            done.set()
+
+        info = collection.index_information().get(name)
+        if info is None or info["key"] != keys or bool(info.get("unique")) != bool(options.get("unique")):
+            problems.append(f"{label}: index {name} does not match the expected definition")
+            report(f"  MISMATCH: existing index {name} is {info}")
+        else:
+            report(f"  ok ({time.perf_counter() - start:.2f}s)")
+
+    for collection_name in ("donors", "donations"):
+        # Documents written before search existed have no name_key yet
+        result = db[collection_name].update_many(
+            {"name_key": {"$exists": False}},
+            [{"$set": {"name_key": {"$toLower": {"$trim": {"input": "$name"}}}}}]
+        )
+        if result.modified_count:
+            report(f"Added name_key to {result.modified_count} {collection_name}")
+
+    migrate_legacy_batches(db["blood_inventory"], db["blood_batches"], report)
+
+    if db["inventory_snapshots"].find_one({}, {"_id": 1}) is None:
+        # Stock from before the ledger existed becomes its opening balance. Like take_snapshot(), the
+        # cut is LEDGER_SETTLE_SECONDS back, and what transactions running meanwhile already wrote to
+        # the ledger after it is taken off the live counters so rebuilds don't count it twice
+        now = datetime.now()
+        position = ledger_time(now - timedelta(seconds=LEDGER_SETTLE_SECONDS))
+        live = {(doc.get("branch_id", DEFAULT_BRANCH), doc["blood_group"]): doc.get("amount", 0)
+                for doc in db["blood_inventory"].find({}, {"branch_id": 1, "blood_group": 1, "amount": 1})}
+        changes, _ = ledger_changes(db["inventory_ledger"], position)
+        totals = add_totals(live, {key: -units for key, units in changes.items()})
+        db["inventory_snapshots"].insert_one({
+            "position": position, "taken_at": now, "entries": 0, "opening": True,
+            "totals": [{"branch_id": branch, "blood_group": group, "units": units}
+                       for (branch, group), units in sorted(totals.items())],
+        })
+        report(f"Opened the inventory ledger with {len(totals)} stock levels")
+    return problems
+
+
+def search_filter(name_prefix="", blood_group=None, gender=None, age_min=None, age_max=None,
+                  date_from=None, date_to=None):
+    """Build (query, sort) for a donor or donation search.
+
+    Searches sort by (name_key, _id) so the name_key and blood_group/name_key indexes serve
+    both the filter and the keyset pagination; with no criteria the natural _id order is kept.
+    """
+    query = {}
+    prefix = name_key(name_prefix or "")
+    if prefix:
+        query["name_key"] = {"$gte": prefix, "$lt": prefix + "\uffff"}
+    if blood_group:
+        query["blood_group"] = blood_group
+    if gender:
+        query["gender"] = gender
+    ages = {}
+    for op, value in (("$gte", age_min), ("$lte", age_max)):
+        if value not in (None, ""):
+            try:
+                ages[op] = int(value)
+            except ValueError:
+                raise ValueError("Age range must be numbers")
+    if ages:
+        query["age"] = ages
+    dates = {}
+    for op, value in (("$gte", date_from), ("$lte", date_to)):
+        if value:
+            try:
+                datetime.strptime(value, "%Y-%m-%d")
+            except ValueError:
+                raise ValueError(f"Date must be YYYY-MM-DD: {value}")
+            dates[op] = value
+    if dates:
+        query["date"] = dates
+
+    if not query:
+        return query, [("_id", 1)]
+    if dates and not prefix and not blood_group:
+        return query, [("date", 1), ("_id", 1)]
+    return query, [("name_key", 1), ("_id", 1)]
+
+
+def keyset_filter(sort, doc, forward=True):
+    """Build a filter matching documents strictly after (or before) doc in the given sort order."""
+    clauses = []
+    for i, (field, direction) in enumerate(sort):
+        op = "$gt" if (direction == 1) == forward else "$lt"
+        clause = {prev: doc.get(prev) for prev, _ in sort[:i]}
+        clause[field] = {op: doc.get(field)}
+        clauses.append(clause)
+    return clauses[0] if len(clauses) == 1 else {"$or": clauses}
+
+
+# Values a sort key may hold; anything else (such as an operator document) is not a key find_page() returned
+KEYSET_TYPES = (str, int, float, ObjectId, datetime)
+
+
+def check_keyset(sort, after):
+    """Raise ValueError unless after holds exactly the sort fields, each with a plain value."""
+    if not isinstance(after, dict) or set(after) != {field for field, _ in sort}:
+        raise ValueError("Invalid cursor")
+    if not all(value is None or isinstance(value, KEYSET_TYPES) for value in after.values()):
+        raise ValueError("Invalid cursor")
+
+
+def find_page(collection, query, sort, projection=None, after=None, limit=100):
+    """Return (docs, next_key): one keyset page after the sort key after, and the key to continue from.
+
+    after may come from a client (the API's cursor tokens), so it is checked with check_keyset().
+    next_key is None on the last page.
+    """
+    if after is not None:
+        check_keyset(sort, after)
+        keyset = keyset_filter(sort, after)
+        query = {"$and": [query, keyset]} if query else keyset
+    docs = list(collection.find(query, projection).sort(sort).limit(limit + 1))
+    if len(docs) <= limit:
+        return docs, None
+    docs = docs[:limit]
+    return docs, {field: docs[-1].get(field) for field, _ in sort}
+
+
+def plan_stages(plan):
+    """Yield every stage name in an explain() plan tree."""
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for value in plan.values():
+            yield from plan_stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from plan_stages(item)
+
+
+def check_query_plans(db, report=print):
+    """Explain each query in QUERY_SHAPES and return the ones that still scan the whole collection."""
+    scans = []
+    for label, collection_name, query in QUERY_SHAPES:
+        plan = db[collection_name].find(query).explain()
+        stages = set(plan_stages(plan.get("queryPlanner", {}).get("winningPlan", {})))
+        if "COLLSCAN" in stages:
+            scans.append(label)
+            report(f"COLLSCAN  {label} on {collection_name}: {query}")
+        else:
+            report(f"indexed   {label} on {collection_name}")
+    return scans
+
+
+IMPORT_BATCH_SIZE = 1000
+IMPORT_FIELDS = {
+    "donors": ["name", "age", "gender", "blood_group"],
+    "donations": ["name", "age", "gender", "blood_group", "units", "date"],
+}
+
+
+def read_rows(path):
+    """Lazily yield (line number, row) pairs from a .csv or .jsonl file.
+
+    Column names are normalized the same way as table headings ("Blood Group" -> "blood_group").
+    A line that is not valid JSON is yielded as its error message instead of a dict.
+    """
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.lower().endswith((".jsonl", ".ndjson", ".json")):
+            for line_no, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError as e:
+                    yield line_no, f"Invalid JSON: {e}"
+                    continue
+                if not isinstance(row, dict):
+                    yield line_no, "Row is not a JSON object"
+                    continue
+                yield line_no, {k.strip().lower().replace(" ", "_"): v for k, v in row.items()}
+        else:
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, {k.strip().lower().replace(" ", "_"): v for k, v in row.items() if k}
+
+
+def import_file(db, path, kind, batch_size=IMPORT_BATCH_SIZE, rejects_path=None, progress=None,
+                branch_id=DEFAULT_BRANCH):
+    """Stream donors or donations from a CSV/JSONL file into MongoDB in batches.
+
+    Rows failing validation or insertion are written to rejects_path (JSON lines) and
+    at most one batch is held in memory. Donations are linked to donors and checked for
+    deferrals as record_donation() does, against the donor's last donation before each
+    row's date, including earlier rows of the same file; deferred rows are rejected.
+    Donations are added to branch_id's stock. Returns {"read", "imported", "rejected"} counts.
+    """
+    validate = validate_donor if kind == "donors" else validate_donation
+    fields = IMPORT_FIELDS[kind]
+    collection = db[kind]
+    counts = {"read": 0, "imported": 0, "rejected": 0}
+    rejects_path = rejects_path or f"{path}.rejects.jsonl"
+    rejects = None
+    # donor _id -> dates of their donations known so far, stored or imported by this run
+    donor_dates = {}
+
+    def reject(line_no, error, row):
+        nonlocal rejects
+        if rejects is None:
+            rejects = open(rejects_path, "w", encoding="utf-8")
+        rejects.write(json.dumps({"line": line_no, "error": error, "row": row}, default=str) + "\n")
+        counts["rejected"] += 1
+
+    def flush(batch):
+        if kind == "donations":
+            matches = match_donors(db["donors"], [doc for _, doc in batch])
+            kept = []
+            for i, (line_no, doc) in enumerate(batch):
+                donor = matches.get(i)
+                dates = []
+                if donor is not None:
+                    dates = donor_dates.setdefault(donor["_id"], [donor["last_donated"]] if donor.get("last_donated") else [])
+                try:
+                    check_eligibility(doc["age"], max((d for d in dates if d <= doc["date"]), default=None), doc["date"])
+                except DeferralError as e:
+                    reject(line_no, str(e), doc)
+                    continue
+                if donor is not None:
+                    doc["donor_id"] = donor["_id"]
+                    dates.append(doc["date"])
+                kept.append((line_no, doc))
+            batch = kept
+            if not batch:
+                if progress:
+                    progress(dict(counts))
+                return
+        failed = set()
+        try:
+            collection.insert_many([doc for _, doc in batch], ordered=False)
+        except BulkWriteError as e:
+            for error in e.details.get("writeErrors", []):
+                failed.add(error["index"])
+                line_no, doc = batch[error["index"]]
+                reject(line_no, error.get("errmsg", "insert failed"), doc)
+        inserted = [doc for i, (_, doc) in enumerate(batch) if i not in failed]
+        counts["imported"] += len(inserted)
+        if inserted:
+            db["stats"].bulk_write(stats_updates(kind, inserted), ordered=False)
+            if kind == "donations":
+                db["donation_rollups"].bulk_write(rollup_updates(inserted), ordered=False)
+                db["blood_batches"].insert_many([donation_batch(doc) for doc in inserted])
+                updates = last_donated_updates(inserted)
+                if updates:
+                    db["donors"].bulk_write(updates, ordered=False)
+
+        if kind == "donations":
+            units = {}
+            for doc in inserted:
+                units[doc["blood_group"]] = units.get(doc["blood_group"], 0) + doc["units"]
+            if units:
+                db["blood_inventory"].bulk_write([
+                    UpdateOne({"branch_id": branch_id, "blood_group": group}, {"$inc": {"amount": amount}}, upsert=True)
+                    for group, amount in units.items()
+                ], ordered=False)
+                append_ledger(db["inventory_ledger"], [ledger_entry(branch_id, group, amount, "import")
+                                                       for group, amount in units.items()])
+        if progress:
+            progress(dict(counts))
+
+    try:
+        batch = []
+        for line_no, row in read_rows(path):
+            counts["read"] += 1
+            if isinstance(row, str):
+                reject(line_no, row, None)
+                continue
+            try:
+                doc = validate(*[str(row.get(field) or "").strip() for field in fields])
+            except ValueError as e:
+                reject(line_no, str(e), row)
+                continue
+            if kind == "donations":
+                doc["branch_id"] = branch_id
+            batch.append((line_no, doc))
+            if len(batch) >= batch_size:
+                flush(batch)
+                batch = []
+        if batch:
+            flush(batch)
+    finally:
+        if rejects is not None:
+            rejects.close()
+    return counts
+
+
+EXPORT_BATCH_SIZE = 5000
+EXPORT_FIELDS = {
+    "donations": ["name", "age", "gender", "blood_group", "units", "date"],
+    "donors": ["name", "age", "gender", "blood_group"],
+    "blood_inventory": ["branch_id", "blood_group", "amount"],
+}
+INTEGER_FIELDS = {"age", "units", "amount"}
+
+
+def export_query(kind, start=None, end=None, blood_group=None):
+    query = {}
+    if blood_group:
+        query["blood_group"] = blood_group
+    if kind == "donations" and (start or end):
+        query["date"] = {}
+        if start:
+            query["date"]["$gte"] = start
+        if end:
+            query["date"]["$lte"] = end
+    return query
+
+
+def export_batches(collection, query, fields, batch_size=EXPORT_BATCH_SIZE):
+    """Yield lists of row tuples read through a batched cursor, batch_size rows at a time."""
+    cursor = collection.find(query, {field: 1 for field in fields}).sort("_id", 1).batch_size(batch_size)
+    batch = []
+    for doc in cursor:
+        batch.append(tuple(doc.get(field) for field in fields))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def write_csv(path, fields, batches):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(fields)
+        for batch in batches:
+            writer.writerows(batch)
+            yield len(batch)
+
+
+def write_parquet(path, fields, batches):
+    """Write each batch as one Parquet row group. Requires pyarrow."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export requires pyarrow (pip install pyarrow)")
+    schema = pa.schema([(f, pa.int64() if f in INTEGER_FIELDS else pa.string()) for f in fields])
+    with pq.ParquetWriter(path, schema) as writer:
+        for batch in batches:
+            columns = [list(column) for column in zip(*batch)]
+            writer.write_table(pa.Table.from_arrays(columns, schema=schema))
+            yield len(batch)
+
+
+def export_collection(db, kind, path, fmt=None, start=None, end=None, blood_group=None, progress=None):
+    """Stream donations, donors or inventory to CSV or Parquet with constant memory.
+
+    start/end filter donations on their YYYY-MM-DD date. Returns (rows, rows_per_second).
+    """
+    fmt = fmt or ("parquet" if path.lower().endswith(".parquet") else "csv")
+    fields = EXPORT_FIELDS[kind]
+    batches = export_batches(db[kind], export_query(kind, start, end, blood_group), fields)
+    writer = write_parquet if fmt == "parquet" else write_csv
+
+    rows = 0
+    started = time.perf_counter()
+    for written in writer(path, fields, batches):
+        rows += written
+        if progress:
+            progress(rows, rows / max(time.perf_counter() - started, 1e-9))
+    elapsed = max(time.perf_counter() - started, 1e-9)
+    return rows, rows / elapsed
+
+
+# Writes made while MongoDB is unreachable are appended here and replayed once it answers
+JOURNAL_PATH = os.environ.get("BLOOD_BANK_JOURNAL", os.path.join(os.path.expanduser("~"), ".blood_bank_journal.jsonl"))
+# Appends arriving within this many seconds share one fsync
+JOURNAL_SYNC_INTERVAL = float(os.environ.get("BLOOD_BANK_JOURNAL_SYNC_INTERVAL", "0.01"))
+JOURNAL_REPLAY_INTERVAL = float(os.environ.get("BLOOD_BANK_JOURNAL_REPLAY_INTERVAL", "10"))
+JOURNAL_REPLAY_BATCH_SIZE = 500
+# Seconds after which a transfer still in progress is assumed to have been interrupted
+TRANSFER_RECOVERY_AGE = float(os.environ.get("BLOOD_BANK_TRANSFER_RECOVERY_AGE", "300"))
+
+
+class WriteJournal:
+    """Append-only JSON-lines file of offline writes, fsynced in groups.
+
+    append() returns once its line is on disk. A background thread fsyncs whatever has been
+    written every sync_interval, so concurrent appenders share one fsync. take() moves the
+    pending entries aside for replay; the .replaying file stays until the replay has finished.
+    """
+
+    def __init__(self, path=JOURNAL_PATH, sync_interval=JOURNAL_SYNC_INTERVAL):
+        self.path = path
+        self.replaying_path = path + ".replaying"
+        self.sync_interval = sync_interval
+        self.cond = threading.Condition()
+        self.file = open(path, "a", encoding="utf-8")
+        self.written = 0
+        self.synced = 0
+        threading.Thread(target=self.sync_loop, name="journal-sync", daemon=True).start()
+
+    def append(self, kind, docs):
+        lines = "".join(json_util.dumps({"kind": kind, "doc": doc}) + "\n" for doc in docs)
+        with self.cond:
+            self.file.write(lines)
+            self.written += 1
+            seq = self.written
+            self.cond.notify_all()
+            while self.synced < seq:
+                self.cond.wait()
+
+    def sync_loop(self):
+        while True:
+            with self.cond:
+                while self.synced == self.written:
+                    self.cond.wait()
+            # Let more appends join this fsync
+            time.sleep(self.sync_interval)
+            with self.cond:
+                target = self.written
+                self.file.flush()
+                os.fsync(self.file.fileno())
+                self.synced = target
+                self.cond.notify_all()
+
+    def pending(self):
+        with self.cond:
+            return os.path.exists(self.replaying_path) or self.file.tell() > 0
+
+    def take(self):
+        """Move pending entries to the .replaying file and return them, oldest first.
+
+        An unfinished earlier replay is returned as-is before the live journal is rotated.
+        """
+        with self.cond:
+            if not os.path.exists(self.replaying_path):
+                self.file.flush()
+                os.fsync(self.file.fileno())
+                self.synced = self.written
+                self.cond.notify_all()
+                self.file.close()
+                os.replace(self.path, self.replaying_path)
+                self.file = open(self.path, "a", encoding="utf-8")
+        entries = []
+        with open(self.replaying_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entries.append(json_util.loads(line))
+                except ValueError:
+                    # A crash mid-append leaves a torn last line; it was never acknowledged
+                    continue
+        return entries
+
+    def done(self):
+        os.remove(self.replaying_path)
+
+
+def upsert_new(collection, docs):
+    """Insert docs keyed by their _id unless already present; returns the ones this call inserted."""
+    if not docs:
+        return []
+    result = collection.bulk_write([
+        UpdateOne({"_id": doc["_id"]}, {"$setOnInsert": {k: v for k, v in doc.items() if k != "_id"}}, upsert=True)
+        for doc in docs
+    ], ordered=False)
+    return [docs[i] for i in result.upserted_ids]
+
+
+class BloodBankService:
+    """Login, signup, donor, donation, inventory and dashboard operations over injectable collections.
+
+    The MongoDB implementation of storage.Storage.
+    """
+
+    def __init__(self, users, donors, donations, inventory, stats, rollups, batches, transfers, ledger, snapshots,
+                 cache=None, journal=None, branch_id=DEFAULT_BRANCH, alerts=None):
+        self.users = users
+        self.donors = donors
+        self.donations = donations
+        self.inventory = inventory
+        self.stats = stats
+        self.rollups = rollups
+        self.batches = batches
+        self.transfers = transfers
+        # Every change to inventory amounts is appended to the ledger; snapshots fold it into totals
+        self.ledger = ledger
+        self.snapshots = snapshots
+        # Stock operations act on this branch; for_branch() gives the service for another one
+        self.branch_id = branch_id
+        # alerts (a StockAlerts shared by every branch) hears each stock level the caches see
+        self.cache = cache or InventoryCache(inventory, branch_id=branch_id, alerts=alerts)
+        self.branch_services = {branch_id: self}
+        # With a journal, donor, donation and deposit writes survive MongoDB being unreachable
+        self.journal = journal
+        self.offline = False
+        # Set by ready() once legacy stock has a branch and a batch; shared with the for_branch() copies
+        self.schema_ready = threading.Event()
+        self.schema_lock = threading.Lock()
+
+    @classmethod
+    def from_database(cls, db, journal=None, branch_id=DEFAULT_BRANCH, alerts=None):
+        return cls(db['users'], db['donors'], db['donations'], db['blood_inventory'], db['stats'],
+                   db['donation_rollups'], db['blood_batches'], db['transfers'], db['inventory_ledger'],
+                   db['inventory_snapshots'], journal=journal, branch_id=branch_id, alerts=alerts)
+
+    def for_branch(self, branch_id):
+        """The service scoped to branch_id; one instance (and cache) per branch is shared by all callers."""
+        service = self.branch_services.get(branch_id)
+        if service is None:
+            service = copy.copy(self)
+            service.branch_id = branch_id
+            service.cache = InventoryCache(self.inventory, self.cache.ttl, branch_id, self.cache.alerts)
+            self.branch_services[branch_id] = service
+        return service
+
+    def ping(self):
+        """Wait until the server answers; raises PyMongoError after the server selection timeout."""
+        self.users.database.client.admin.command("ping")
+
+    def branch_exists(self, branch_id):
+        """Whether any stock or user belongs to branch_id; served by the two branch_id indexes."""
+        return (self.inventory.find_one({"branch_id": branch_id}, {"_id": 1}) is not None
+                or self.users.find_one({"branch_id": branch_id}, {"_id": 1}) is not None)
+
+    def ready(self):
+        """Wait until the server answers, then (once) finish the stock migrations every stock operation depends on.
+
+        Raises PyMongoError while the server is unreachable.
+        """
+        if self.schema_ready.is_set():
+            return
+        self.ping()
+        with self.schema_lock:
+            if not self.schema_ready.is_set():
+                migrate_branches(self.inventory, self.batches, report=lambda message: None)
+                migrate_legacy_batches(self.inventory, self.batches, report=lambda message: None)
+                self.schema_ready.set()
+
+    def login(self, username, password):
+        """Return the user's branch id when the credentials match a user, otherwise None."""
+        if not username or not password:
+            raise ValueError("All fields are required.")
+        user = self.users.find_one({"name": username, "password": password}, {"_id": 1, "branch_id": 1})
+        return None if user is None else user.get("branch_id", DEFAULT_BRANCH)
+
+    def signup(self, username, password, dob, branch_id=DEFAULT_BRANCH):
+        """Create a user at a branch; returns False when the username is already taken."""
+        if not username or not password or not dob:
+            raise ValueError("All fields are required.")
+        # Prevent duplicate usernames
+        if self.users.find_one({"name": username}, {"_id": 1}):
+            return False
+        try:
+            self.users.insert_one({"name": username, "password": password, "dob": dob,
+                                   "branch_id": branch_id.strip() or DEFAULT_BRANCH})
+        except DuplicateKeyError:
+            return False
+        return True
+
+    def first_write(self, kind, docs, write):
+        """Run an operation's first write, or journal docs instead when MongoDB is unreachable.
+
+        Returns False when docs went to the journal. After one failure, writes go straight to the
+        journal until a replay succeeds, so each one does not wait out the server selection timeout.
+        """
+        if self.journal is None:
+            write()
+            return True
+        if not self.offline:
+            try:
+                write()
+                return True
+            except ConnectionFailure:
+                self.offline = True
+        self.journal.append(kind, docs)
+        return False
+
+    def add_donor(self, name, age, gender, blood_group, force=False):
+        """Store a donor; the returned document has journaled=True if it was saved offline.
+
+        Raises DeferralError for donors outside the age limits unless force is set.
+        """
+        donor = validate_donor(name, age, gender, blood_group)
+        if not force:
+            check_eligibility(donor["age"])
+        # Assigned here so a journaled copy replays as the same document
+        donor["_id"] = ObjectId()
+        if not self.first_write("donor", [donor], lambda: self.donors.insert_one(donor)):
+            return dict(donor, journaled=True)
+        self.stats.bulk_write(stats_updates("donors", [donor]))
+        return donor
+
+    def link_donors(self, donations, donor_ids):
+        """Set donor_id on donations: the id given for it, else the one donor matching its name, age and group.
+
+        donor_ids holds an id or None per donation. Returns ({index: error}, {index: donor}); errors
+        are for ids that are unknown or belong to a donor of another blood group, and the donor
+        documents hold age, blood_group and last_donated for eligibility checks. While offline ids
+        are stored unchecked and no matching is done; link_donations() can link those later.
+        """
+        errors, given, linked = {}, {}, {}
+        for i, donor_id in enumerate(donor_ids):
+            if donor_id:
+                try:
+                    given[i] = ObjectId(donor_id)
+                except (InvalidId, TypeError):
+                    errors[i] = "Unknown donor"
+        if self.offline:
+            for i, donor_id in given.items():
+                donations[i]["donor_id"] = donor_id
+            return errors, linked
+        unlinked = [i for i in range(len(donations)) if i not in given and i not in errors]
+        try:
+            found = {}
+            if given:
+                found = {donor["_id"]: donor for donor in self.donors.find(
+                    {"_id": {"$in": list(given.values())}}, {"age": 1, "blood_group": 1, "last_donated": 1})}
+            matches = match_donors(self.donors, [donations[i] for i in unlinked]) if unlinked else {}
+        except ConnectionFailure:
+            if self.journal is None:
+                raise
+            self.offline = True
+            return self.link_donors(donations, donor_ids)
+        for i, donor_id in given.items():
+            donor = found.get(donor_id)
+            if donor is None:
+                errors[i] = "Unknown donor"
+            elif donor["blood_group"] != donations[i]["blood_group"]:
+                errors[i] = f"Donor has blood group {donor['blood_group']}"
+            else:
+                donations[i]["donor_id"] = donor_id
+                linked[i] = donor
+        for j, donor in matches.items():
+            donations[unlinked[j]]["donor_id"] = donor["_id"]
+            linked[unlinked[j]] = donor
+        return errors, linked
+
+    def deferral(self, donation, donor=None):
+        """The DeferralError for donation under the age limits and its donor's last donation, or None."""
+        try:
+            check_eligibility(donation["age"], donor.get("last_donated") if donor else None, donation["date"])
+        except DeferralError as e:
+            return e
+        return None
+
+    def record_donation(self, name, age, gender, blood_group, units, date=None, donor_id=None, force=False):
+        """Store a donation and add its units to the inventory. Returns the donation document.
+
+        The donation is linked to donor_id, or to the single donor matching its name, age and
+        blood group. Unless force is set, a DeferralError is raised if the donor may not give
+        yet. The document has journaled=True if MongoDB was unreachable and it was saved offline.
+        """
+        donation = validate_donation(name, age, gender, blood_group, units, date)
+        errors, linked = self.link_donors([donation], [donor_id])
+        if errors:
+            raise ValueError(errors[0])
+        deferral = None if force else self.deferral(donation, linked.get(0))
+        if deferral:
+            raise deferral
+        donation["branch_id"] = self.branch_id
+        donation["_id"] = ObjectId()
+        if not self.first_write("donation", [donation], lambda: self.donations.insert_one(donation)):
+            return dict(donation, journaled=True)
+        self.stats.bulk_write(stats_updates("donations", [donation]), ordered=False)
+        self.rollups.bulk_write(rollup_updates([donation]), ordered=False)
+        self.batches.insert_one(donation_batch(donation))
+        if "donor_id" in donation:
+            self.donors.update_one({"_id": donation["donor_id"]}, {"$max": {"last_donated": donation["date"]}})
+        self.cache.apply(update_inventory(self.inventory, donation['blood_group'], "deposit", donation['units'],
+                                          branch_id=self.branch_id))
+        append_ledger(self.ledger, [ledger_entry(self.branch_id, donation["blood_group"], donation["units"],
+                                                 "donation", donation["_id"])])
+        return donation
+
+    def record_donations(self, rows):
+        """Validate and store many donations with one bulk write per collection.
+
+        rows are dicts with name, age, gender, blood_group, units and optionally date and donor_id;
+        donations are linked to donors and checked for deferrals as in record_donation(). A row
+        with a true "force" skips the deferral check. Invalid and deferred rows are skipped. Returns (stored donations, [(row index, error message)]); the stored
+        ones carry journaled=True if MongoDB was unreachable.
+        """
+        valid, errors = [], []
+        for i, row in enumerate(rows):
+            try:
+                donation = validate_donation(*[str(row.get(field) or "").strip() for field in IMPORT_FIELDS["donations"]])
+            except ValueError as e:
+                errors.append((i, str(e)))
+                continue
+            valid.append((i, donation, row.get("donor_id")))
+        link_errors, linked = self.link_donors([donation for _, donation, _ in valid],
+                                               [donor_id for _, _, donor_id in valid])
+        donations = []
+        for j, (i, donation, _) in enumerate(valid):
+            if j in link_errors:
+                errors.append((i, link_errors[j]))
+                continue
+            deferral = None if rows[i].get("force") else self.deferral(donation, linked.get(j))
+            if deferral:
+                errors.append((i, str(deferral)))
+                continue
+            donation["branch_id"] = self.branch_id
+            donation["_id"] = ObjectId()
+            donations.append(donation)
+        errors.sort()
+        if not donations:
+            return [], errors
+        if not self.first_write("donation", donations, lambda: self.donations.insert_many(donations, ordered=False)):
+            return [dict(donation, journaled=True) for donation in donations], errors
+        self.stats.bulk_write(stats_updates("donations", donations), ordered=False)
+        self.rollups.bulk_write(rollup_updates(donations), ordered=False)
+        self.batches.insert_many([donation_batch(donation) for donation in donations])
+        updates = last_donated_updates(donations)
+        if updates:
+            self.donors.bulk_write(updates, ordered=False)
+        units = {}
+        for donation in donations:
+            units[donation["blood_group"]] = units.get(donation["blood_group"], 0) + donation["units"]
+        for group, amount in units.items():
+            self.cache.apply(update_inventory(self.inventory, group, "deposit", amount, branch_id=self.branch_id))
+            append_ledger(self.ledger, [ledger_entry(self.branch_id, group, donation["units"], "donation", donation["_id"])
+                                        for donation in donations if donation["blood_group"] == group])
+        return donations, errors
+
+    def process_transaction(self, blood_group, transaction_type, amount):
+        """Collect or deposit units at this branch atomically.
+
+        Returns (updated inventory document, batch allocations); collects are served from the
+        batches that expire first and deposits create a new batch. A deposit made while MongoDB is
+        unreachable is journaled and returns ({"blood_group", "amount": None, "journaled": True}, []);
+        collects always need the live stock.
+        """
+        if blood_group not in BLOOD_GROUPS:
+            raise ValueError(f"Unknown blood group: {blood_group}")
+        try:
+            amount = int(amount)
+        except (TypeError, ValueError):
+            raise ValueError("Amount must be a number")
+        # Checked before anything is journaled: the replay cannot turn a bad deposit away
+        if amount <= 0:
+            raise InventoryError("Amount must be greater than zero")
+        if transaction_type == "deposit":
+            deposit = {"_id": ObjectId(), "branch_id": self.branch_id, "blood_group": blood_group,
+                       "amount": amount, "at": datetime.now()}
+            result = {}
+
+            def write():
+                result["doc"] = update_inventory(self.inventory, blood_group, transaction_type, amount,
+                                                 branch_id=self.branch_id)
+
+            if not self.first_write("deposit", [deposit], write):
+                return {"blood_group": blood_group, "amount": None, "journaled": True}, []
+            doc = result["doc"]
+            entry = ledger_entry(self.branch_id, blood_group, amount, "deposit", deposit["_id"])
+        else:
+            allocations = self.draw_batches(blood_group, amount)
+            try:
+                doc = update_inventory(self.inventory, blood_group, transaction_type, amount, branch_id=self.branch_id)
+            except InventoryError:
+                release_batches(self.batches, allocations)
+                raise
+            entry = ledger_entry(self.branch_id, blood_group, -amount, "collect")
+        append_ledger(self.ledger, [entry])
+        self.cache.apply(doc)
+        if transaction_type == "collect":
+            return doc, allocations
+        self.batches.insert_one(new_batch(blood_group, amount, source="deposit", branch_id=self.branch_id))
+        return doc, []
+
+    def draw_batches(self, blood_group, amount):
+        """Retire this branch's expired blood_group batches, then draw amount units from the rest.
+
+        Run before a collect takes units off the total, so expired units are never handed out and
+        the sweep never deducts units a collect already took. Raises InsufficientStockError.
+        """
+        if amount <= 0:
+            raise InventoryError("Amount must be greater than zero")
+        now = datetime.now()
+        if expire_batches(self.batches, self.inventory, now, self.ledger, self.branch_id, blood_group):
+            self.cache.refresh()
+        return allocate_batches(self.batches, blood_group, amount, now, self.branch_id)
+
+    def transfer(self, to_branch, blood_group, amount):
+        """Move units from this branch to to_branch. Returns (source inventory document, allocations).
+
+        Without multi-document transactions (standalone servers), the move is a two-phase commit
+        through a transfers document: each side's $inc pushes the transfer id onto the inventory
+        document, so recover_transfers() can finish a transfer interrupted between the debit and
+        the credit without applying either side twice. The units keep their batches' expiry dates:
+        the destination batches are written to the transfers document up front and inserted by
+        complete_transfer(), so a recovered transfer brings them along too.
+        """
+        if blood_group not in BLOOD_GROUPS:
+            raise ValueError(f"Unknown blood group: {blood_group}")
+        try:
+            amount = int(amount)
+        except (TypeError, ValueError):
+            raise ValueError("Amount must be a number")
+        to_branch = (to_branch or "").strip()
+        if not to_branch or to_branch == self.branch_id:
+            raise InventoryError("Choose another branch to transfer to")
+        if amount <= 0:
+            raise InventoryError("Amount must be greater than zero")
+        allocations = self.draw_batches(blood_group, amount)
+        transfer = {"_id": ObjectId(), "credit_id": ObjectId(), "from": self.branch_id, "to": to_branch,
+                    "blood_group": blood_group, "units": amount, "state": "pending", "created_at": datetime.now()}
+        sources = {doc["_id"]: doc for doc in self.batches.find(
+            {"_id": {"$in": [batch_id for batch_id, _, _ in allocations]}}, {"collected_at": 1})}
+        transfer["batches"] = [
+            dict(new_batch(blood_group, units, sources[batch_id]["collected_at"], "transfer", transfer["_id"], to_branch),
+                 _id=ObjectId(), expires_at=expires_at)
+            for batch_id, units, expires_at in allocations
+        ]
+        self.transfers.insert_one(transfer)
+        source = self.inventory.find_one_and_update(
+            {"branch_id": self.branch_id, "blood_group": blood_group, "amount": {"$gte": amount}},
+            {"$inc": {"amount": -amount}, "$push": {"transfers": transfer["_id"]}},
+            return_document=ReturnDocument.AFTER
+        )
+        if source is None:
+            release_batches(self.batches, allocations)
+            self.transfers.update_one({"_id": transfer["_id"]}, {"$set": {"state": "failed"}})
+            raise InsufficientStockError(f"Insufficient {blood_group} blood units")
+        self.cache.apply(source)
+        self.complete_transfer(transfer)
+        return source, allocations
+
+    def complete_transfer(self, transfer):
+        """Credit a debited transfer to its destination (at most once), add its batches there and mark it done.
+
+        The batches and both ledger sides are written under the ids stored on the transfer, so
+        recovering a transfer never records them twice.
+        """
+        tid = transfer["_id"]
+        group, units = transfer["blood_group"], transfer["units"]
+        if transfer["state"] == "pending":
+            try:
+                self.inventory.update_one({"branch_id": transfer["to"], "blood_group": group},
+                                          {"$setOnInsert": {"amount": 0}}, upsert=True)
+            except DuplicateKeyError:
+                pass
+            credited = self.inventory.find_one_and_update(
+                {"branch_id": transfer["to"], "blood_group": group, "transfers": {"$ne": tid}},
+                {"$inc": {"amount": units}, "$push": {"transfers": tid}},
+                return_document=ReturnDocument.AFTER
+            )
+            self.for_branch(transfer["to"]).cache.apply(credited)
+            self.transfers.update_one({"_id": tid}, {"$set": {"state": "applied"}})
+        upsert_new(self.batches, transfer.get("batches", []))
+        append_ledger(self.ledger, [
+            ledger_entry(transfer["from"], group, -units, "transfer_out", tid, tid),
+            ledger_entry(transfer["to"], group, units, "transfer_in", transfer.get("credit_id") or ObjectId(), tid),
+        ])
+        self.inventory.update_many({"transfers": tid}, {"$pull": {"transfers": tid}})
+        self.transfers.update_one({"_id": tid}, {"$set": {"state": "done", "completed_at": datetime.now()}})
+        self.for_branch(transfer["to"]).cache.refresh()
+
+    def recover_transfers(self, older_than=TRANSFER_RECOVERY_AGE):
+        """Finish or fail transfers left pending or applied for more than older_than seconds.
+
+        A pending transfer whose id is on the source document was debited and is completed;
+        otherwise the debit never happened and it is marked failed. Returns the number recovered.
+        """
+        cutoff = datetime.now() - timedelta(seconds=older_than)
+        recovered = 0
+        for transfer in self.transfers.find({"state": {"$in": ["pending", "applied"]}, "created_at": {"$lt": cutoff}}):
+            debited = self.inventory.find_one(
+                {"branch_id": transfer["from"], "blood_group": transfer["blood_group"], "transfers": transfer["_id"]},
+                {"_id": 1}
+            )
+            if transfer["state"] == "applied" or debited:
+                self.complete_transfer(transfer)
+                self.for_branch(transfer["from"]).cache.refresh()
+            else:
+                self.transfers.update_one({"_id": transfer["_id"], "state": "pending"}, {"$set": {"state": "failed"}})
+            recovered += 1
+        return recovered
+
+    def network_inventory(self):
+        """Stock across every branch from one aggregation.
+
+        Returns {"totals": {blood_group: units}, "branches": {branch_id: {blood_group: units}}}.
+        """
+        result = next(self.inventory.aggregate([{"$facet": {
+            "totals": [{"$group": {"_id": "$blood_group", "units": {"$sum": "$amount"}}}],
+            "branches": [{"$project": {"_id": 0, "branch_id": 1, "blood_group": 1, "amount": 1}}],
+        }}]), {"totals": [], "branches": []})
+        branches = {}
+        for doc in result["branches"]:
+            branches.setdefault(doc.get("branch_id", DEFAULT_BRANCH), {})[doc["blood_group"]] = doc.get("amount", 0)
+        totals = {group: 0 for group in BLOOD_GROUPS}
+        totals.update({row["_id"]: row["units"] for row in result["totals"]})
+        return {"totals": totals, "branches": branches}
+
+    def replay_journal(self, batch_size=JOURNAL_REPLAY_BATCH_SIZE):
+        """Apply journaled writes in bulk batches; safe to run again after a partial replay.
+
+        Donors, donations and batches are upserted by the _id given when they were journaled,
+        stats and rollups are only incremented for documents this replay actually inserted, and
+        each inventory increment is applied at most once (see apply_journal_batch()). Returns the
+        number of entries replayed.
+        """
+        entries = self.journal.take()
+        for start in range(0, len(entries), batch_size):
+            self.apply_journal_batch(entries[start:start + batch_size])
+        self.journal.done()
+        for service in self.branch_services.values():
+            service.offline = False
+            service.cache.refresh()
+        return len(entries)
+
+    def apply_journal_batch(self, entries):
+        """Apply one batch of journal entries.
+
+        An entry's inventory $inc is skipped once its ledger entry (same _id) exists. Between the
+        $inc and the ledger insert, the entry id sits in the group's "applied" array and guards
+        the $inc instead; the ids are pulled again at the end, so the array only ever holds the
+        batch in flight.
+        """
+        docs = {"donor": [], "donation": [], "deposit": []}
+        for entry in entries:
+            docs[entry["kind"]].append(entry["doc"])
+        # Journals from before amounts were validated may hold empty or negative writes; never apply them
+        donations = [d for d in docs["donation"] if d["units"] > 0]
+        deposits = [d for d in docs["deposit"] if d["amount"] > 0]
+
+        new_donors = upsert_new(self.donors, docs["donor"])
+        if new_donors:
+            self.stats.bulk_write(stats_updates("donors", new_donors))
+        new_donations = upsert_new(self.donations, donations)
+        if new_donations:
+            self.stats.bulk_write(stats_updates("donations", new_donations), ordered=False)
+            self.rollups.bulk_write(rollup_updates(new_donations), ordered=False)
+        updates = last_donated_updates(donations)
+        if updates:
+            self.donors.bulk_write(updates, ordered=False)
+
+        batches = [dict(donation_batch(d), _id=d["_id"]) for d in donations]
+        batches += [dict(new_batch(d["blood_group"], d["amount"], d["at"], "deposit",
+                                   branch_id=d.get("branch_id", DEFAULT_BRANCH)), _id=d["_id"]) for d in deposits]
+        upsert_new(self.batches, batches)
+
+        increments = [(d["_id"], d.get("branch_id", DEFAULT_BRANCH), d["blood_group"], d["units"]) for d in donations]
+        increments += [(d["_id"], d.get("branch_id", DEFAULT_BRANCH), d["blood_group"], d["amount"]) for d in deposits]
+        ids = [entry_id for entry_id, _, _, _ in increments]
+        recorded = {doc["_id"] for doc in self.ledger.find({"_id": {"$in": ids}}, {"_id": 1})}
+        increments = [increment for increment in increments if increment[0] not in recorded]
+        if increments:
+            self.apply_increments(increments, {d["_id"] for d in donations})
+        if ids:
+            self.inventory.update_many({"applied": {"$in": ids}}, {"$pull": {"applied": {"$in": ids}}})
+
+    def apply_increments(self, increments, donation_ids):
+        """$inc each (entry_id, branch_id, blood_group, units) unless its id is applied, then ledger it."""
+        try:
+            self.inventory.bulk_write([
+                UpdateOne({"branch_id": branch, "blood_group": group}, {"$setOnInsert": {"amount": 0}}, upsert=True)
+                for branch, group in {(branch, group) for _, branch, group, _ in increments}
+            ], ordered=False)
+        except BulkWriteError as e:
+            # Another writer created the group first
+            if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+                raise
+        self.inventory.bulk_write([
+            UpdateOne({"branch_id": branch, "blood_group": group, "applied": {"$ne": entry_id}},
+                      {"$inc": {"amount": units}, "$push": {"applied": entry_id}})
+            for entry_id, branch, group, units in increments
+        ], ordered=False)
+        append_ledger(self.ledger, [
+            ledger_entry(branch, group, units, "donation" if entry_id in donation_ids else "deposit", entry_id)
+            for entry_id, branch, group, units in increments
+        ])
+
+    def start_replay_job(self, interval=JOURNAL_REPLAY_INTERVAL):
+        """Replay the journal whenever it has entries and MongoDB answers, checking every interval seconds."""
+        stop = threading.Event()
+
+        def run():
+            while True:
+                if self.journal.pending():
+                    try:
+                        self.ping()
+                        self.replay_journal()
+                    except PyMongoError:
+                        pass
+                if stop.wait(interval):
+                    return
+
+        threading.Thread(target=run, name="journal-replay", daemon=True).start()
+        return stop
+
+    def expire_batches(self):
+        """Retire expired batches at every branch and refresh the cached totals they came out of."""
+        expired = expire_batches(self.batches, self.inventory, ledger=self.ledger)
+        for branch in {branch for branch, _ in expired}:
+            self.for_branch(branch).cache.refresh()
+        return expired
+
+    def start_expiry_job(self, interval=EXPIRY_SWEEP_INTERVAL):
+        """Sweep expired batches now and then every interval seconds on a daemon thread."""
+        stop = threading.Event()
+
+        def run():
+            while True:
+                try:
+                    self.expire_batches()
+                except PyMongoError:
+                    pass
+                if stop.wait(interval):
+                    return
+
+        threading.Thread(target=run, name="batch-expiry", daemon=True).start()
+        return stop
+
+    def take_snapshot(self):
+        """Fold the settled ledger into a new snapshot; see take_snapshot()."""
+        return take_snapshot(self.ledger, self.snapshots)
+
+    def reconcile_inventory(self, fix=False):
+        """Rebuild every branch's stock from the latest snapshot and the ledger after it.
+
+        Returns {(branch_id, blood_group): (live amount, rebuilt amount)} for the counters that
+        disagree. With fix, those counters are moved to the rebuilt amount. Transactions racing
+        the reconcile can show up as drift that is gone on the next run.
+        """
+        rebuilt, _ = rebuild_inventory(self.ledger, self.snapshots)
+        live = {(doc.get("branch_id", DEFAULT_BRANCH), doc["blood_group"]): doc.get("amount", 0)
+                for doc in self.inventory.find({}, {"branch_id": 1, "blood_group": 1, "amount": 1})}
+        drift = {key: (live.get(key, 0), rebuilt.get(key, 0))
+                 for key in set(live) | set(rebuilt) if live.get(key, 0) != rebuilt.get(key, 0)}
+        if fix and drift:
+            self.inventory.bulk_write([
+                UpdateOne({"branch_id": branch, "blood_group": group}, {"$inc": {"amount": actual - stored}}, upsert=True)
+                for (branch, group), (stored, actual) in drift.items()
+            ], ordered=False)
+            for branch in {branch for branch, _ in drift}:
+                self.for_branch(branch).cache.refresh()
+        return drift
+
+    def ledger_history(self, blood_group, after=None, limit=100):
+        """One page of this branch's ledger entries for blood_group, newest first, as find_page() returns."""
+        return find_page(self.ledger, {"branch_id": self.branch_id, "blood_group": blood_group},
+                         [("ts", -1), ("_id", -1)], after=after, limit=limit)
+
+    def start_snapshot_job(self, interval=LEDGER_SNAPSHOT_INTERVAL):
+        """Snapshot the ledger now and then every interval seconds on a daemon thread."""
+        stop = threading.Event()
+
+        def run():
+            while True:
+                try:
+                    self.take_snapshot()
+                except PyMongoError:
+                    pass
+                if stop.wait(interval):
+                    return
+
+        threading.Thread(target=run, name="ledger-snapshot", daemon=True).start()
+        return stop
+
+    def inventory_snapshot(self):
+        return self.cache.snapshot()
+
+    def list_page(self, kind, after=None, forward=True, limit=100):
+        """One page of donors or donations in _id order; see storage.Storage.list_page()."""
+        if kind not in ("donors", "donations"):
+            raise ValueError(f"Unknown list: {kind}")
+        query = {} if after is None else {"_id": {"$gt" if forward else "$lt": after["_id"]}}
+        docs = list(getattr(self, kind).find(query, {field: 1 for field in EXPORT_FIELDS[kind]})
+                    .sort("_id", 1 if forward else -1).limit(limit))
+        if not forward:
+            docs.reverse()
+        return docs
+
+    def find_matches(self, blood_group, limit=MATCH_LIMIT):
+        """Compatible substitute stock (from the cache) and up to limit donors of compatible groups.
+
+        Only donors who may give today are suggested, longest since their last donation first
+        (those who never gave lead). One $in query served by the (blood_group, last_donated, age) index.
+        """
+        donors = self.donors.find(
+            eligible_filter(blood_groups=compatible_groups(blood_group)),
+            {"_id": 0, "name": 1, "age": 1, "gender": 1, "blood_group": 1, "last_donated": 1}
+        ).sort([("last_donated", 1)]).limit(limit)
+        return {
+            "substitutes": rank_substitutes(blood_group, self.cache.snapshot()),
+            "donors": list(donors),
+        }
+
+    def suggest_donors(self, prefix, limit=8):
+        """Up to limit donors whose name starts with prefix, from the donors name_key index."""
+        query, sort = search_filter(prefix)
+        if not query:
+            return []
+        return find_page(self.donors, query, sort, {"name": 1, "age": 1, "gender": 1, "blood_group": 1}, limit=limit)[0]
+
+    def donor_donations(self, donor_id, after=None, limit=100):
+        """One page of a donor's donations, newest first, from the (donor_id, date, _id) index.
+
+        Returns (docs, next_key) as find_page() does.
+        """
+        try:
+            donor_id = ObjectId(donor_id)
+        except (InvalidId, TypeError):
+            raise ValueError("Unknown donor")
+        return find_page(self.donations, {"donor_id": donor_id}, [("date", -1), ("_id", -1)], after=after, limit=limit)
+
+    def donor_eligibility(self, donor_id, day=None):
+        """Return (eligible, reason, next_date) for one donor on day (default today), from one _id lookup."""
+        try:
+            donor = self.donors.find_one({"_id": ObjectId(donor_id)}, {"age": 1, "last_donated": 1})
+        except (InvalidId, TypeError):
+            donor = None
+        if donor is None:
+            raise ValueError("Unknown donor")
+        try:
+            check_eligibility(donor["age"], donor.get("last_donated"), day)
+        except DeferralError as e:
+            return False, str(e), e.next_date
+        return True, None, None
+
+    def eligible_counts(self, day=None, blood_groups=None):
+        """{blood_group: donors allowed to give on day}, counted by MongoDB from the eligibility index."""
+        counts = {group: 0 for group in blood_groups or BLOOD_GROUPS}
+        for doc in self.donors.aggregate([
+            {"$match": eligible_filter(day, blood_groups)},
+            {"$group": {"_id": "$blood_group", "donors": {"$sum": 1}}},
+        ]):
+            counts[doc["_id"]] = doc["donors"]
+        return counts
+
+    def eligible_donors(self, day=None, blood_groups=None):
+        """Stream donors allowed to give on day (a recall list), in index order."""
+        return self.donors.find(
+            eligible_filter(day, blood_groups),
+            {"_id": 1, "name": 1, "age": 1, "gender": 1, "blood_group": 1, "last_donated": 1},
+        ).batch_size(EXPORT_BATCH_SIZE)
+
+    def dashboard_stats(self):
+        """Totals and per-group units collected today and over the last STATS_DAYS days, from one stats query."""
+        days = recent_days()
+        ids = [STATS_ID] + [day_stats_id(day) for day in days]
+        docs = {doc["_id"]: doc for doc in self.stats.find({"_id": {"$in": ids}})}
+
+        counters = docs.get(STATS_ID)
+        if counters is None:
+            # Not reconciled yet: collection metadata is instant and close enough
+            donors = self.donors.estimated_document_count()
+            donations = self.donations.estimated_document_count()
+        else:
+            donors = counters.get("donors", 0)
+            donations = counters.get("donations", 0)
+
+        units_week = {}
+        for day in days:
+            for group, units in docs.get(day_stats_id(day), {}).get("units", {}).items():
+                units_week[group] = units_week.get(group, 0) + units
+
+        return {
+            "donors": donors,
+            "donations": donations,
+            "units_in_stock": sum(self.cache.snapshot().values()),
+            "units_today": docs.get(day_stats_id(days[0]), {}).get("units", {}),
+            "units_week": units_week,
+        }
+
+    def donation_analytics(self, granularity, periods):
+        """Units per blood group for the last periods days/weeks/months, read only from the rollups.
+
+        Returns [(period, {blood_group: units})] oldest first.
+        """
+        today = datetime.now().date()
+        if granularity == "day":
+            start = (today - timedelta(days=periods - 1)).strftime("%Y-%m-%d")
+        elif granularity == "week":
+            start = rollup_periods((today - timedelta(weeks=periods - 1)).strftime("%Y-%m-%d"))["week"]
+        else:
+            month = today.year * 12 + today.month - periods
+            start = f"{month // 12}-{month % 12 + 1:02d}"
+        rows = {}
+        for bucket in self.rollups.find(
+            {"granularity": granularity, "period": {"$gte": start}},
+            {"_id": 0, "period": 1, "blood_group": 1, "units": 1}
+        ):
+            rows.setdefault(bucket["period"], {})[bucket["blood_group"]] = bucket["units"]
+        return sorted(rows.items())
+
+    def reconcile_stats(self):
+        """Check the counters and recent daily totals against the real data and repair any drift.
+
+        Returns {field: (stored, actual)} for everything that was corrected. Writes racing the
+        reconcile can leave a small error behind; the next run picks it up.
+        """
+        drift = {}
+        counters = self.stats.find_one({"_id": STATS_ID}) or {}
+        actual = {
+            "donors": self.donors.count_documents({}),
+            "donations": self.donations.count_documents({}),
+        }
+        for key, value in actual.items():
+            if counters.get(key) != value:
+                drift[key] = (counters.get(key), value)
+        if drift:
+            self.stats.update_one({"_id": STATS_ID}, {"$set": actual}, upsert=True)
+
+        days = recent_days()
+        expected = {day: {} for day in days}
+        for row in self.donations.aggregate([
+            {"$match": {"date": {"$gte": days[-1], "$lte": days[0]}}},
+            {"$group": {"_id": {"date": "$date", "group": "$blood_group"}, "units": {"$sum": "$units"}}}
+        ]):
+            expected[row["_id"]["date"]][row["_id"]["group"]] = row["units"]
+        stored = {doc["_id"]: doc.get("units", {}) for doc in self.stats.find(
+            {"_id": {"$in": [day_stats_id(day) for day in days]}})}
+        for day, units in expected.items():
+            current = stored.get(day_stats_id(day), {})
+            if {g: n for g, n in current.items() if n} != units:
+                drift[day] = (current, units)
+                self.stats.update_one({"_id": day_stats_id(day)}, {"$set": {"units": units}}, upsert=True)
+        return drift
+
+    def start_reconcile_job(self, interval=RECONCILE_INTERVAL):
+        """Reconcile the stats and recover stalled transfers now and then every interval seconds."""
+        stop = threading.Event()
+
+        def run():
+            while True:
+                try:
+                    self.reconcile_stats()
+                    self.recover_transfers()
+                except PyMongoError:
+                    pass
+                if stop.wait(interval):
+                    return
+
+        threading.Thread(target=run, name="stats-reconcile", daemon=True).start()
+        return stop
@@ -0,0 +1,374 @@
+"""Storage backends for single-site deployments.
+
+BLOOD_BANK_STORAGE selects where users, donors, donations and blood inventory live:
+"mongo" (the default) uses BloodBankService over MongoDB, "sqlite" an embedded SQLite
+file at BLOOD_BANK_SQLITE_PATH, so a small branch needs no database server.
+open_storage() returns the configured one; the desktop app and the HTTP API run on either
+and benchmark.py compares them:
+
+    BLOOD_BANK_STORAGE=sqlite python blood.py
+    BLOOD_BANK_STORAGE=sqlite python blood.py --serve --port 8080
+    python benchmark.py --uri mongodb://localhost:27017/ storage --scales 1000 100000
+
+Both implement Storage. The MongoDB-only features (ledger, batches, transfers, rollups,
+alerts, journal, reports, search, import/export, analytics) are hidden on SQLite.
+"""
+from abc import ABC, abstractmethod
+from bson import ObjectId
+from bson.errors import InvalidId
+import copy
+import os
+import sqlite3
+import threading
+
+from services import (
+    BLOOD_GROUPS,
+    DEFAULT_BRANCH,
+    MONGO_URI,
+    STORAGE_BACKEND,
+    BloodBankService,
+    InsufficientStockError,
+    InventoryError,
+    check_eligibility,
+    connect,
+    validate_donation,
+    validate_donor,
+)
+
+SQLITE_PATH = os.environ.get("BLOOD_BANK_SQLITE_PATH", os.path.join(os.path.expanduser("~"), ".blood_bank.db"))
+# NORMAL is durable across crashes in WAL mode; a power cut may lose the last commits, like mongod's journal interval
+SQLITE_SYNCHRONOUS = os.environ.get("BLOOD_BANK_SQLITE_SYNCHRONOUS", "NORMAL")
+# Seconds a writer waits for another connection's write lock before failing
+SQLITE_BUSY_TIMEOUT = float(os.environ.get("BLOOD_BANK_SQLITE_BUSY_TIMEOUT", "5"))
+# Compiled statements kept per connection; every statement below is a fixed string with ? parameters
+SQLITE_CACHED_STATEMENTS = 64
+
+# Tables and indexes mirror the MongoDB documents and services.INDEXES
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    name TEXT PRIMARY KEY,
+    password TEXT NOT NULL,
+    dob TEXT NOT NULL,
+    branch_id TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS users_branch ON users (branch_id);
+CREATE TABLE IF NOT EXISTS donors (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    name_key TEXT NOT NULL,
+    age INTEGER NOT NULL,
+    gender TEXT NOT NULL,
+    blood_group TEXT NOT NULL,
+    last_donated TEXT
+);
+CREATE INDEX IF NOT EXISTS donors_name_key ON donors (name_key, id);
+CREATE INDEX IF NOT EXISTS donors_group_name_key ON donors (blood_group, name_key, id);
+CREATE INDEX IF NOT EXISTS donors_eligible ON donors (blood_group, last_donated, age);
+CREATE TABLE IF NOT EXISTS donations (
+    id TEXT PRIMARY KEY,
+    donor_id TEXT,
+    name TEXT NOT NULL,
+    name_key TEXT NOT NULL,
+    age INTEGER NOT NULL,
+    gender TEXT NOT NULL,
+    blood_group TEXT NOT NULL,
+    units INTEGER NOT NULL,
+    date TEXT NOT NULL,
+    branch_id TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS donations_group_date ON donations (blood_group, date);
+CREATE INDEX IF NOT EXISTS donations_date ON donations (date, id);
+CREATE INDEX IF NOT EXISTS donations_name_key ON donations (name_key, id);
+CREATE INDEX IF NOT EXISTS donations_group_name_key ON donations (blood_group, name_key, id);
+CREATE INDEX IF NOT EXISTS donations_donor ON donations (donor_id, date, id);
+CREATE TABLE IF NOT EXISTS blood_inventory (
+    branch_id TEXT NOT NULL,
+    blood_group TEXT NOT NULL,
+    amount INTEGER NOT NULL CHECK (amount >= 0),
+    PRIMARY KEY (branch_id, blood_group)
+) WITHOUT ROWID;
+"""
+
+# Columns list_page() returns, as services.EXPORT_FIELDS
+SQLITE_LIST_COLUMNS = {
+    "donors": ["name", "age", "gender", "blood_group"],
+    "donations": ["name", "age", "gender", "blood_group", "units", "date"],
+}
+# list_page() statements keyed by (kind, forward, with a key to start from); ids are ObjectId hex, so id order is _id order
+SQLITE_LIST_QUERIES = {
+    (kind, forward, keyed): f"SELECT id, {', '.join(columns)} FROM {kind}"
+                            + (f" WHERE id {'>' if forward else '<'} ?" if keyed else "")
+                            + f" ORDER BY id {'ASC' if forward else 'DESC'} LIMIT ?"
+    for kind, columns in SQLITE_LIST_COLUMNS.items() for forward in (True, False) for keyed in (True, False)
+}
+
+
+class Storage(ABC):
+    """The operations a single-site deployment needs from its storage backend.
+
+    services.BloodBankService implements them over MongoDB; SQLiteStorage over an embedded
+    SQLite file. Both validate input the same way and raise the same errors (ValueError,
+    DeferralError, InventoryError, InsufficientStockError), so callers need not know which
+    backend they hold; open_storage() picks one from BLOOD_BANK_STORAGE.
+    """
+
+    @abstractmethod
+    def ping(self):
+        """Return once the backend answers; raises when it is unreachable."""
+
+    def ready(self):
+        """Return once the backend answers and is ready for stock operations."""
+        self.ping()
+
+    @abstractmethod
+    def for_branch(self, branch_id):
+        """The same backend scoped to branch_id for stock operations."""
+
+    @abstractmethod
+    def branch_exists(self, branch_id):
+        """Whether any stock or user belongs to branch_id."""
+
+    @abstractmethod
+    def login(self, username, password):
+        """Return the user's branch id when the credentials match a user, otherwise None."""
+
+    @abstractmethod
+    def signup(self, username, password, dob, branch_id=DEFAULT_BRANCH):
+        """Create a user at a branch; returns False when the username is already taken."""
+
+    @abstractmethod
+    def add_donor(self, name, age, gender, blood_group, force=False):
+        """Store a donor and return its document; DeferralError outside the age limits unless force."""
+
+    @abstractmethod
+    def record_donation(self, name, age, gender, blood_group, units, date=None, donor_id=None, force=False):
+        """Store a donation linked to its donor, add its units to the inventory and return it."""
+
+    @abstractmethod
+    def process_transaction(self, blood_group, transaction_type, amount):
+        """Collect or deposit units atomically; returns (inventory document, batch allocations)."""
+
+    @abstractmethod
+    def inventory_snapshot(self):
+        """Return {blood_group: amount} for all groups at this branch."""
+
+    @abstractmethod
+    def list_page(self, kind, after=None, forward=True, limit=100):
+        """One page of "donors" or "donations" in _id order, after (going back: before) the key {"_id": id}.
+
+        The documents come in display order either way, as VirtualTable shows them.
+        """
+
+    def close(self):
+        """Release the backend's connections."""
+
+
+# services cannot import this module (it imports services), so the MongoDB backend is registered
+# rather than subclassed; tests/test_storage.py checks that it implements every abstract method
+Storage.register(BloodBankService)
+
+
+class SQLiteStorage(Storage):
+    """Users, donors, donations and inventory in one SQLite file in WAL mode.
+
+    Each thread gets its own connection: readers never block the writer or each other, and
+    writes run in BEGIN IMMEDIATE transactions so a donation and its stock change commit
+    together, and a collect can never take the stock below zero.
+    """
+
+    def __init__(self, path=SQLITE_PATH, branch_id=DEFAULT_BRANCH):
+        self.path = path
+        self.branch_id = branch_id
+        self.local = threading.local()
+        self.connections = []
+        self.lock = threading.Lock()
+        self.branch_storages = {branch_id: self}
+        self.connection().executescript(SQLITE_SCHEMA)
+
+    def connection(self):
+        """This thread's connection, opened on first use."""
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            # Autocommit mode: single statements commit alone, transaction() groups the rest
+            conn = sqlite3.connect(self.path, timeout=SQLITE_BUSY_TIMEOUT, isolation_level=None,
+                                   check_same_thread=False, cached_statements=SQLITE_CACHED_STATEMENTS)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+            self.local.conn = conn
+            with self.lock:
+                self.connections.append(conn)
+        return conn
+
+    def transaction(self, work):
+        """Run work(conn) in a write transaction and return its result; rolled back if it raises."""
+        conn = self.connection()
+        # IMMEDIATE takes the write lock up front, so reads inside work see the rows it updates
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = work(conn)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return result
+
+    def ping(self):
+        self.connection().execute("SELECT 1")
+
+    def for_branch(self, branch_id):
+        """The storage scoped to branch_id; copies share this one's connections."""
+        storage = self.branch_storages.get(branch_id)
+        if storage is None:
+            storage = copy.copy(self)
+            storage.branch_id = branch_id
+            self.branch_storages[branch_id] = storage
+        return storage
+
+    def branch_exists(self, branch_id):
+        conn = self.connection()
+        return (conn.execute("SELECT 1 FROM blood_inventory WHERE branch_id = ? LIMIT 1", (branch_id,)).fetchone()
+                is not None or conn.execute("SELECT 1 FROM users WHERE branch_id = ? LIMIT 1",
+                                            (branch_id,)).fetchone() is not None)
+
+    def close(self):
+        with self.lock:
+            connections, self.connections = self.connections, []
+        for conn in connections:
+            conn.close()
+        self.local = threading.local()
+
+    def login(self, username, password):
+        if not username or not password:
+            raise ValueError("All fields are required.")
+        row = self.connection().execute(
+            "SELECT branch_id FROM users WHERE name = ? AND password = ?", (username, password)).fetchone()
+        return None if row is None else row[0]
+
+    def signup(self, username, password, dob, branch_id=DEFAULT_BRANCH):
+        if not username or not password or not dob:
+            raise ValueError("All fields are required.")
+        try:
+            self.connection().execute("INSERT INTO users (name, password, dob, branch_id) VALUES (?, ?, ?, ?)",
+                                      (username, password, dob, branch_id.strip() or DEFAULT_BRANCH))
+        except sqlite3.IntegrityError:
+            return False
+        return True
+
+    def add_donor(self, name, age, gender, blood_group, force=False):
+        donor = validate_donor(name, age, gender, blood_group)
+        if not force:
+            check_eligibility(donor["age"])
+        donor["_id"] = ObjectId()
+        self.connection().execute(
+            "INSERT INTO donors (id, name, name_key, age, gender, blood_group) VALUES (?, ?, ?, ?, ?, ?)",
+            (str(donor["_id"]), donor["name"], donor["name_key"], donor["age"], donor["gender"], donor["blood_group"]))
+        return donor
+
+    def find_donor(self, conn, donation, donor_id):
+        """(donor id, last_donated) of donor_id, or of the one donor matching the donation's name, age and group.
+
+        Raises ValueError for an unknown donor_id or one of another blood group; (None, None) when unmatched.
+        """
+        if donor_id:
+            try:
+                donor_id = str(ObjectId(donor_id))
+            except (InvalidId, TypeError):
+                raise ValueError("Unknown donor")
+            row = conn.execute("SELECT blood_group, last_donated FROM donors WHERE id = ?", (donor_id,)).fetchone()
+            if row is None:
+                raise ValueError("Unknown donor")
+            if row[0] != donation["blood_group"]:
+                raise ValueError(f"Donor has blood group {row[0]}")
+            return donor_id, row[1]
+        rows = conn.execute(
+            "SELECT id, last_donated FROM donors WHERE blood_group = ? AND name_key = ? AND age = ? LIMIT 2",
+            (donation["blood_group"], donation["name_key"], donation["age"])).fetchall()
+        return tuple(rows[0]) if len(rows) == 1 else (None, None)
+
+    def record_donation(self, name, age, gender, blood_group, units, date=None, donor_id=None, force=False):
+        """Store a donation and add its units to the inventory in one transaction. Returns the donation.
+
+        Linking and deferral checks follow BloodBankService.record_donation().
+        """
+        donation = validate_donation(name, age, gender, blood_group, units, date)
+        donation["branch_id"] = self.branch_id
+        donation["_id"] = ObjectId()
+
+        def work(conn):
+            linked_id, last_donated = self.find_donor(conn, donation, donor_id)
+            if not force:
+                check_eligibility(donation["age"], last_donated, donation["date"])
+            conn.execute(
+                "INSERT INTO donations (id, donor_id, name, name_key, age, gender, blood_group, units, date, branch_id)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (str(donation["_id"]), linked_id, donation["name"], donation["name_key"], donation["age"],
+                 donation["gender"], donation["blood_group"], donation["units"], donation["date"], self.branch_id))
+            if linked_id:
+                donation["donor_id"] = ObjectId(linked_id)
+                conn.execute("UPDATE donors SET last_donated = ? WHERE id = ? AND ifnull(last_donated, '') < ?",
+                             (donation["date"], linked_id, donation["date"]))
+            self.change_stock(conn, donation["blood_group"], donation["units"])
+
+        self.transaction(work)
+        return donation
+
+    def change_stock(self, conn, blood_group, change):
+        """Add change (negative to collect) to a group's stock inside a transaction; returns the new amount."""
+        if change < 0:
+            updated = conn.execute(
+                "UPDATE blood_inventory SET amount = amount + ? WHERE branch_id = ? AND blood_group = ? AND amount >= ?",
+                (change, self.branch_id, blood_group, -change)).rowcount
+            if not updated:
+                if conn.execute("SELECT 1 FROM blood_inventory WHERE branch_id = ? AND blood_group = ?",
+                                (self.branch_id, blood_group)).fetchone() is None:
+                    raise InventoryError(f"No inventory found for {blood_group} blood group")
+                raise InsufficientStockError(f"Insufficient {blood_group} blood units")
+        else:
+            conn.execute(
+                "INSERT INTO blood_inventory (branch_id, blood_group, amount) VALUES (?, ?, ?)"
+                " ON CONFLICT (branch_id, blood_group) DO UPDATE SET amount = amount + excluded.amount",
+                (self.branch_id, blood_group, change))
+        return conn.execute("SELECT amount FROM blood_inventory WHERE branch_id = ? AND blood_group = ?",
+                            (self.branch_id, blood_group)).fetchone()[0]
+
+    def process_transaction(self, blood_group, transaction_type, amount):
+        """Collect or deposit units atomically. Returns (inventory document, []); there are no batches to allocate."""
+        if blood_group not in BLOOD_GROUPS:
+            raise ValueError(f"Unknown blood group: {blood_group}")
+        try:
+            amount = int(amount)
+        except (TypeError, ValueError):
+            raise ValueError("Amount must be a number")
+        if amount <= 0:
+            raise InventoryError("Amount must be greater than zero")
+        change = -amount if transaction_type == "collect" else amount
+        stock = self.transaction(lambda conn: self.change_stock(conn, blood_group, change))
+        return {"branch_id": self.branch_id, "blood_group": blood_group, "amount": stock}, []
+
+    def inventory_snapshot(self):
+        """Return {blood_group: amount} for all groups from one primary-key range read."""
+        amounts = {group: 0 for group in BLOOD_GROUPS}
+        amounts.update(self.connection().execute(
+            "SELECT blood_group, amount FROM blood_inventory WHERE branch_id = ?", (self.branch_id,)))
+        return amounts
+
+    def list_page(self, kind, after=None, forward=True, limit=100):
+        """One page of donors or donations from the primary key, as BloodBankService.list_page()."""
+        if kind not in SQLITE_LIST_COLUMNS:
+            raise ValueError(f"Unknown list: {kind}")
+        params = (limit,) if after is None else (str(after["_id"]), limit)
+        rows = self.connection().execute(SQLITE_LIST_QUERIES[(kind, forward, after is not None)], params).fetchall()
+        if not forward:
+            rows.reverse()
+        fields = SQLITE_LIST_COLUMNS[kind]
+        return [dict(zip(fields, row[1:]), _id=ObjectId(row[0])) for row in rows]
+
+
+def open_storage(backend=STORAGE_BACKEND, path=SQLITE_PATH, uri=MONGO_URI, db_name="blood_bank",
+                 branch_id=DEFAULT_BRANCH):
+    """The Storage for backend: "sqlite" opens (and creates) the file at path, "mongo" the database at uri."""
+    if backend == "sqlite":
+        return SQLiteStorage(path, branch_id)
+    if backend == "mongo":
+        return BloodBankService.from_database(connect(uri)[db_name], branch_id=branch_id)
+    raise ValueError(f"Unknown storage backend: {backend} (expected mongo or sqlite)")
@@ -0,0 +1,50 @@
+"""Per-operation latency of the service layer at 1k, 100k and 1M documents per collection.
+
+Each scale runs on mongomock and, when --uri is given, on that server:
+
+    python -m pytest tests/benchmarks
+    python -m pytest tests/benchmarks --uri mongodb://localhost:27017/ --benchmark-group-by=param:seeded
+    python -m pytest tests/benchmarks --instrument
+
+python -m pytest --benchmark-skip runs the rest of the tests without them.
+"""
+import itertools
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from benchmark import get_database, seed, service_operations  # noqa: E402
+from services import BloodBankService, InstrumentedDatabase, Metrics  # noqa: E402
+
+SCALES = [1000, 100000, 1000000]
+# mongomock scans every document on every query: past this it times mongomock, not the app's queries
+MONGOMOCK_MAX_SCALE = 1000
+OPERATIONS = list(service_operations(None, 0))
+
+
+@pytest.fixture(scope="module", params=[(backend, scale) for backend in ["mongomock", "mongodb"] for scale in SCALES],
+                ids=lambda param: f"{param[0]}-{param[1]}")
+def seeded(request):
+    """(seeded service, scale), shared by every operation timed on that backend and scale."""
+    backend, scale = request.param
+    uri = request.config.getoption("--uri")
+    if backend == "mongodb" and not uri:
+        pytest.skip("needs --uri")
+    if backend == "mongomock" and scale > MONGOMOCK_MAX_SCALE:
+        pytest.skip(f"mongomock at {scale} documents; run with --uri")
+    db = get_database(uri if backend == "mongodb" else None)
+    seed(db, scale)
+    if request.config.getoption("--instrument"):
+        db = InstrumentedDatabase(db, Metrics())
+    yield BloodBankService.from_database(db), scale
+    db.client.drop_database(db.name)
+
+
+@pytest.mark.parametrize("operation", OPERATIONS)
+def test_operation(benchmark, seeded, operation):
+    service, scale = seeded
+    fn = service_operations(service, scale)[operation]
+    calls = itertools.count()
+    benchmark.extra_info["scale"] = scale
+    benchmark(lambda: fn(next(calls)))
@@ -0,0 +1,30 @@
+import os
+import sys
+
+import mongomock
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import BloodBankService, bootstrap_schema  # noqa: E402
+
+
+def pytest_addoption(parser):
+    parser.addoption("--uri", help="MongoDB URI the benchmarks in tests/benchmarks also run against")
+    parser.addoption("--instrument", action="store_true",
+                     help="wrap the benchmark databases in the metrics layer to measure its overhead")
+
+
+@pytest.fixture
+def db():
+    """An empty in-memory database with the schema bootstrap_schema() sets up."""
+    database = mongomock.MongoClient()["blood_bank_test"]
+    bootstrap_schema(database, report=lambda message: None)
+    return database
+
+
+@pytest.fixture
+def service(db):
+    service = BloodBankService.from_database(db)
+    service.ready()
+    return service
@@ -0,0 +1,70 @@
+"""Low-stock alerts: raised below the minimum, cleared only past the hysteresis margin."""
+import json
+import os
+
+import pytest
+
+from services import DEFAULT_BRANCH, BloodBankService, StockAlerts, parse_min_stock
+
+
+@pytest.fixture
+def alerts(tmp_path):
+    return StockAlerts(levels={"O-": 10}, hysteresis=0.2, log_path=os.path.join(tmp_path, "alerts.jsonl"))
+
+
+def states(alerts, amounts, branch_id=DEFAULT_BRANCH):
+    return [(alert or {}).get("state") for alert in (alerts.check(branch_id, "O-", amount) for amount in amounts)]
+
+
+def test_min_stock_levels():
+    levels = parse_min_stock("O-=20, AB+=3", default=7)
+    assert (levels["O-"], levels["AB+"], levels["A+"]) == (20, 3, 7)
+    for spec in ["Q=1", "O-=many"]:
+        with pytest.raises(ValueError):
+            parse_min_stock(spec)
+
+
+def test_alert_does_not_flap_around_the_minimum(alerts):
+    assert alerts.recovery_level("O-") == 12
+    assert states(alerts, [10, 9, 10, 11, 9, 12, 11, 10, 9]) == [
+        None, "low", None, None, None, "recovered", None, None, "low"]
+    assert [alert["amount"] for alert in alerts.low()] == [9]
+
+
+def test_small_minimums_still_need_one_unit_of_margin(alerts):
+    alerts.levels["O-"] = 2
+    assert alerts.recovery_level("O-") == 3
+    assert states(alerts, [1, 2, 3]) == ["low", None, "recovered"]
+    alerts.levels["O-"] = 0
+    assert states(alerts, [0]) == [None]
+
+
+def test_branches_alert_separately_and_transitions_are_logged(alerts):
+    heard = []
+    alerts.listeners.append(heard.append)
+    states(alerts, [4])
+    states(alerts, [15, 3, 15], branch_id="north")
+
+    assert [alert["branch_id"] for alert in alerts.low()] == [DEFAULT_BRANCH]
+    assert alerts.low("north") == []
+    assert [(alert["branch_id"], alert["state"]) for alert in heard] == [
+        (DEFAULT_BRANCH, "low"), ("north", "low"), ("north", "recovered")]
+    with open(alerts.log_path) as f:
+        assert [json.loads(line)["state"] for line in f] == ["low", "low", "recovered"]
+
+
+def test_unwritable_log_does_not_fail_the_check(alerts, tmp_path):
+    alerts.log_path = os.path.join(tmp_path, "missing", "alerts.jsonl")
+    assert alerts.check(DEFAULT_BRANCH, "O-", 1)["state"] == "low"
+
+
+def test_transactions_drive_alerts(db, alerts):
+    service = BloodBankService.from_database(db, alerts=alerts)
+    service.ready()
+    service.process_transaction("O-", "deposit", 12)
+    service.process_transaction("O-", "collect", 3)
+    assert [alert["amount"] for alert in alerts.low()] == [9]
+    service.process_transaction("O-", "deposit", 2)
+    assert alerts.low() != []
+    service.process_transaction("O-", "deposit", 1)
+    assert alerts.low() == []
@@ -0,0 +1,58 @@
+"""HTTP API: request validation and how errors map to status codes."""
+import asyncio
+
+from aiohttp.test_utils import TestClient, TestServer
+from pymongo.errors import DuplicateKeyError, OperationFailure, ServerSelectionTimeoutError
+import pytest
+
+from api import create_app
+
+
+def request(service, method, path, **kwargs):
+    """(status, JSON body) of one request to an app serving service."""
+    async def run():
+        async with TestClient(TestServer(create_app(service, workers=2))) as client:
+            response = await client.request(method, path, **kwargs)
+            if response.content_type != "application/json":
+                return response.status, await response.text()
+            return response.status, await response.json()
+    return asyncio.run(run())
+
+
+def test_transaction_round_trip(service):
+    status, body = request(service, "POST", "/transactions", json={"type": "deposit", "blood_group": "A+", "amount": 3})
+    assert status == 200 and body["inventory"]["amount"] == 3
+    status, body = request(service, "POST", "/transactions", json={"type": "collect", "blood_group": "A+", "amount": 5})
+    assert status == 409 and "matches" in body
+
+
+@pytest.mark.parametrize("amount", [2.9, True, "2", None, 0, -1])
+def test_transaction_amount_must_be_a_positive_integer(service, amount):
+    status, _ = request(service, "POST", "/transactions", json={"type": "deposit", "blood_group": "A+", "amount": amount})
+    assert status == 400
+    assert service.inventory.count_documents({}) == 0
+
+
+def test_unknown_blood_group_and_branch(service):
+    status, _ = request(service, "POST", "/transactions", json={"type": "deposit", "blood_group": "Q", "amount": 1})
+    assert status == 400
+    status, _ = request(service, "GET", "/inventory", headers={"X-Branch": "nowhere"})
+    assert status == 404
+
+
+@pytest.mark.parametrize("cursor", ["not-base64!", "eyJuYW1lX2tleSI6IHsiJGd0IjogIiJ9LCAiX2lkIjogMX0="])
+def test_bad_cursor_is_a_client_error(service, cursor):
+    status, _ = request(service, "GET", "/donors", params={"cursor": cursor})
+    assert status == 400
+
+
+@pytest.mark.parametrize("error, status", [
+    (ServerSelectionTimeoutError("no servers"), 503),
+    (DuplicateKeyError("E11000"), 409),
+    (OperationFailure("bad update"), 500),
+])
+def test_database_errors_map_to_status(service, monkeypatch, error, status):
+    def fail():
+        raise error
+    monkeypatch.setattr(service, "inventory_snapshot", fail)
+    assert request(service, "GET", "/inventory")[0] == status
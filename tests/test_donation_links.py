@@ -0,0 +1,74 @@
+"""Linking existing donations to their donors, resuming an interrupted run and rolling it back."""
+import pytest
+
+from services import link_donations, rollback_donation_links
+
+
+def quiet(message):
+    pass
+
+
+def add_donor(db, name, age=30, blood_group="A+", **fields):
+    return db["donors"].insert_one(dict(
+        name=name, name_key=name.lower(), age=age, gender="female", blood_group=blood_group, **fields)).inserted_id
+
+
+def add_donation(db, name, date, age=30, blood_group="A+"):
+    """A donation recorded before donations carried a donor_id."""
+    return db["donations"].insert_one({"name": name, "name_key": name.lower(), "age": age, "gender": "female",
+                                       "blood_group": blood_group, "units": 1, "date": date}).inserted_id
+
+
+def donor_of(db, donation_id):
+    return db["donations"].find_one({"_id": donation_id}).get("donor_id", "missing")
+
+
+def test_links_only_single_matches(db):
+    ann = add_donor(db, "Ann", last_donated="2024-01-01")
+    add_donor(db, "Twin")
+    add_donor(db, "Twin")
+    first = add_donation(db, "ANN", "2024-03-01")
+    latest = add_donation(db, "ann", "2024-05-01")
+    other_group = add_donation(db, "Ann", "2024-06-01", blood_group="O-")
+    ambiguous = add_donation(db, "Twin", "2024-04-01")
+
+    assert link_donations(db, batch_size=3, report=quiet) == (2, 2)
+    assert donor_of(db, first) == donor_of(db, latest) == ann
+    assert donor_of(db, other_group) is None and donor_of(db, ambiguous) is None
+    assert db["donors"].find_one({"_id": ann})["last_donated"] == "2024-05-01"
+
+    # Unmatched donations hold donor_id None, so a second run has nothing left to scan
+    assert link_donations(db, report=quiet) == (0, 0)
+
+
+def test_interrupted_run_resumes_where_it_stopped(db):
+    donors = [add_donor(db, f"donor{i}") for i in range(5)]
+    donations = [add_donation(db, f"donor{i}", "2024-02-01") for i in range(5)]
+
+    def stop(message):
+        raise KeyboardInterrupt
+    with pytest.raises(KeyboardInterrupt):
+        link_donations(db, batch_size=2, report=stop)
+    assert db["donations"].count_documents({"donor_id": {"$exists": True}}) == 2
+
+    assert link_donations(db, batch_size=2, report=quiet) == (3, 0)
+    assert [donor_of(db, donation) for donation in donations] == donors
+
+
+def test_rollback_keeps_links_changed_since(db):
+    ann, bob = add_donor(db, "Ann"), add_donor(db, "Bob")
+    mine = add_donation(db, "Ann", "2024-02-01")
+    relinked = add_donation(db, "Ann", "2024-03-01")
+    unmatched = add_donation(db, "Nobody", "2024-03-01")
+    link_donations(db, batch_size=2, report=quiet)
+    db["donations"].update_one({"_id": relinked}, {"$set": {"donor_id": bob}})
+
+    assert rollback_donation_links(db, report=quiet) == 2
+    assert donor_of(db, mine) == donor_of(db, unmatched) == "missing"
+    assert donor_of(db, relinked) == bob
+    assert db["migration_log"].count_documents({"links": {"$exists": True}}) == 0
+    # last_donated is left where the migration moved it
+    assert db["donors"].find_one({"_id": ann})["last_donated"] == "2024-03-01"
+
+    assert link_donations(db, report=quiet) == (1, 1)
+    assert donor_of(db, mine) == ann
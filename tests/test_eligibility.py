@@ -0,0 +1,96 @@
+"""Deferral rules: age limits, the gap between donations and who is offered as a donor."""
+from datetime import datetime, timedelta
+import csv
+import json
+import os
+
+import pytest
+
+from services import (
+    DONATION_INTERVAL_DAYS,
+    MAX_DONOR_AGE,
+    MIN_DONOR_AGE,
+    DeferralError,
+    check_eligibility,
+    eligibility_cutoff,
+    import_file,
+)
+
+
+@pytest.mark.parametrize("age", [MIN_DONOR_AGE - 1, MAX_DONOR_AGE + 1])
+def test_age_limits(age):
+    with pytest.raises(DeferralError) as e:
+        check_eligibility(age)
+    assert e.value.next_date is None
+    check_eligibility(MIN_DONOR_AGE)
+    check_eligibility(MAX_DONOR_AGE)
+
+
+def days_after(day, days):
+    return (datetime.strptime(day, "%Y-%m-%d") + timedelta(days=days)).strftime("%Y-%m-%d")
+
+
+def test_gap_between_donations():
+    cutoff = eligibility_cutoff("2024-03-01")
+    assert days_after(cutoff, DONATION_INTERVAL_DAYS) == "2024-03-01"
+    with pytest.raises(DeferralError) as e:
+        check_eligibility(30, days_after(cutoff, 1), "2024-03-01")
+    assert e.value.next_date == "2024-03-02"
+    check_eligibility(30, cutoff, "2024-03-01")
+    # A back-dated record before the last donation is not deferred by it
+    check_eligibility(30, "2024-03-10", "2024-03-01")
+    with pytest.raises(ValueError):
+        eligibility_cutoff("01/03/2024")
+
+
+def test_recorded_donation_defers_the_donor(service):
+    donor = service.add_donor("Ann", "30", "female", "O-")
+    service.record_donation("Ann", "30", "female", "O-", "1", date="2024-01-10")
+    with pytest.raises(DeferralError):
+        service.record_donation("Ann", "30", "female", "O-", "1", date="2024-02-01")
+
+    eligible, reason, next_date = service.donor_eligibility(donor["_id"], "2024-02-01")
+    assert not eligible and "2024-01-10" in reason
+    assert service.donor_eligibility(donor["_id"], next_date) == (True, None, None)
+    with pytest.raises(ValueError):
+        service.donor_eligibility("not-an-id")
+
+
+def test_counts_and_matches_offer_only_eligible_donors(service):
+    today = datetime.now().strftime("%Y-%m-%d")
+    service.donors.insert_many([
+        {"name": "Never", "name_key": "never", "age": 40, "gender": "male", "blood_group": "O-"},
+        {"name": "Rested", "name_key": "rested", "age": 40, "gender": "male", "blood_group": "O-",
+         "last_donated": "2000-01-01"},
+        {"name": "Recent", "name_key": "recent", "age": 40, "gender": "male", "blood_group": "O-",
+         "last_donated": today},
+        {"name": "Old", "name_key": "old", "age": MAX_DONOR_AGE + 1, "gender": "male", "blood_group": "O-"},
+        {"name": "Other", "name_key": "other", "age": 40, "gender": "male", "blood_group": "A+"},
+    ])
+
+    assert service.eligible_counts(blood_groups=["O-", "A+"]) == {"O-": 2, "A+": 1}
+    assert sorted(donor["name"] for donor in service.eligible_donors(blood_groups=["O-"])) == ["Never", "Rested"]
+    # O- recipients take O- only; those who never gave lead
+    assert [donor["name"] for donor in service.find_matches("O-")["donors"]] == ["Never", "Rested"]
+    assert {donor["name"] for donor in service.find_matches("A+")["donors"]} == {"Never", "Rested", "Other"}
+
+
+def test_import_rejects_deferred_rows(db, tmp_path):
+    db["donors"].insert_one({"name": "Ann", "name_key": "ann", "age": 30, "gender": "female",
+                             "blood_group": "B+", "last_donated": "2024-01-01"})
+    deferred, allowed = days_after("2024-01-01", 1), days_after("2024-01-01", DONATION_INTERVAL_DAYS)
+    path = os.path.join(tmp_path, "donations.csv")
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["name", "age", "gender", "blood_group", "units", "date"])
+        writer.writerow(["Ann", "30", "female", "B+", "1", deferred])
+        writer.writerow(["Ann", "30", "female", "B+", "1", allowed])
+        # Deferred by the row above, from the same file
+        writer.writerow(["Ann", "30", "female", "B+", "1", days_after(allowed, 1)])
+        writer.writerow(["Kid", str(MIN_DONOR_AGE - 1), "male", "B+", "1", allowed])
+
+    counts = import_file(db, path, "donations", batch_size=2)
+    assert (counts["imported"], counts["rejected"]) == (1, 3)
+    with open(f"{path}.rejects.jsonl") as f:
+        assert [json.loads(line)["line"] for line in f] == [2, 4, 5]
+    assert db["donors"].find_one({"name": "Ann"})["last_donated"] == allowed
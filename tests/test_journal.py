@@ -0,0 +1,71 @@
+"""Offline journal: what may be journaled and how often a replay applies it."""
+from datetime import datetime
+import os
+
+from bson import ObjectId
+import pytest
+
+from services import DEFAULT_BRANCH, BloodBankService, InventoryError, WriteJournal
+
+
+@pytest.fixture
+def offline(db, tmp_path):
+    service = BloodBankService.from_database(db, journal=WriteJournal(os.path.join(tmp_path, "journal.jsonl")))
+    service.offline = True
+    return service
+
+
+def stock(service, blood_group):
+    doc = service.inventory.find_one({"branch_id": DEFAULT_BRANCH, "blood_group": blood_group})
+    return doc["amount"] if doc else 0
+
+
+@pytest.mark.parametrize("amount", [0, -3])
+def test_non_positive_deposits_are_not_journaled(offline, amount):
+    with pytest.raises(InventoryError):
+        offline.process_transaction("O+", "deposit", amount)
+    assert not offline.journal.pending()
+
+
+def test_non_positive_donations_are_not_journaled(offline):
+    with pytest.raises(ValueError):
+        offline.record_donation("Ann", "30", "female", "A+", "0", force=True)
+    assert not offline.journal.pending()
+
+
+def test_replay_applies_each_entry_once(offline):
+    for _ in range(3):
+        offline.process_transaction("B-", "deposit", 2)
+    offline.record_donation("Ann", "30", "female", "B-", "1", force=True)
+    entries = offline.journal.take()
+
+    # A replay that stopped between the $inc and the ledger insert, then the full replay of the same file
+    offline.apply_journal_batch(entries)
+    deposits = [entry["doc"]["_id"] for entry in entries if entry["kind"] == "deposit"]
+    offline.inventory.update_one({"blood_group": "B-"}, {"$push": {"applied": {"$each": deposits}}})
+    offline.ledger.delete_many({"_id": {"$in": deposits}})
+    offline.apply_journal_batch(entries)
+    offline.replay_journal()
+
+    assert stock(offline, "B-") == 7
+    assert offline.ledger.count_documents({}) == 4
+    assert offline.batches.count_documents({}) == 4
+    assert offline.donations.count_documents({}) == 1
+    assert not offline.offline
+
+
+def test_replay_leaves_no_guards_on_inventory(offline):
+    for _ in range(5):
+        offline.process_transaction("AB+", "deposit", 1)
+    offline.replay_journal()
+    assert stock(offline, "AB+") == 5
+    assert offline.inventory.count_documents({"applied.0": {"$exists": True}}) == 0
+
+
+def test_replay_skips_non_positive_entries(offline):
+    offline.process_transaction("O-", "deposit", 4)
+    offline.journal.append("deposit", [{"_id": ObjectId(), "branch_id": DEFAULT_BRANCH, "blood_group": "O-",
+                                        "amount": -10, "at": datetime.now()}])
+    entries = offline.journal.take()
+    offline.apply_journal_batch(entries)
+    assert stock(offline, "O-") == 4
@@ -0,0 +1,86 @@
+"""The inventory ledger: snapshots fold settled entries and stock rebuilds from them match the counters."""
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+import mongomock
+
+from services import (
+    DEFAULT_BRANCH,
+    LEDGER_SETTLE_SECONDS,
+    append_ledger,
+    bootstrap_schema,
+    ledger_entry,
+    rebuild_inventory,
+    take_snapshot,
+)
+
+
+def settle(service):
+    """Move the ledger and its snapshots back past the settle window, as if written a while ago."""
+    shift = timedelta(seconds=LEDGER_SETTLE_SECONDS + 1)
+    for collection, field in [(service.ledger, "ts"), (service.snapshots, "position")]:
+        for doc in collection.find({}, {field: 1}):
+            collection.update_one({"_id": doc["_id"]}, {"$set": {field: doc[field] - shift}})
+
+
+def stock(service):
+    return {(doc["branch_id"], doc["blood_group"]): doc["amount"] for doc in service.inventory.find() if doc["amount"]}
+
+
+def test_opening_balance_holds_stock_from_before_the_ledger():
+    db = mongomock.MongoClient()["blood_bank_ledger"]
+    assert take_snapshot(db["inventory_ledger"], db["inventory_snapshots"]) is None
+    db["blood_inventory"].insert_one({"branch_id": DEFAULT_BRANCH, "blood_group": "AB+", "amount": 7})
+    bootstrap_schema(db, report=lambda message: None)
+
+    totals, snapshot = rebuild_inventory(db["inventory_ledger"], db["inventory_snapshots"])
+    assert snapshot["opening"] and totals == {(DEFAULT_BRANCH, "AB+"): 7}
+
+
+def test_snapshots_fold_only_settled_entries(service):
+    service.process_transaction("A+", "deposit", 5)
+    # The entry above is newer than the settle window, so there is nothing to fold yet
+    assert service.take_snapshot()["entries"] == 0
+
+    settle(service)
+    now = datetime.now()
+    first = take_snapshot(service.ledger, service.snapshots, now=now)
+    assert first["entries"] == 1
+    assert take_snapshot(service.ledger, service.snapshots, now=now)["_id"] == first["_id"]
+
+    service.process_transaction("A+", "collect", 2)
+    service.for_branch("north").process_transaction("A+", "deposit", 4)
+    settle(service)
+    second = service.take_snapshot()
+    assert second["entries"] == 2
+    assert {(row["branch_id"], row["blood_group"]): row["units"] for row in second["totals"]} == stock(service)
+
+
+def test_rebuild_adds_entries_after_the_snapshot(service):
+    service.process_transaction("O+", "deposit", 6)
+    settle(service)
+    service.take_snapshot()
+    service.process_transaction("O+", "collect", 1)
+    service.transfer("north", "O+", 2)
+
+    rebuilt, snapshot = rebuild_inventory(service.ledger, service.snapshots)
+    assert snapshot["entries"] == 1
+    assert rebuilt == {(DEFAULT_BRANCH, "O+"): 3, ("north", "O+"): 2} == stock(service)
+    assert service.reconcile_inventory() == {}
+
+
+def test_duplicate_entries_are_dropped(service):
+    entry_id = ObjectId()
+    for _ in range(2):
+        append_ledger(service.ledger, [ledger_entry(DEFAULT_BRANCH, "B-", 3, "deposit", entry_id=entry_id)])
+    assert service.ledger.count_documents({"_id": entry_id}) == 1
+
+
+def test_reconcile_reports_and_fixes_drift(service):
+    service.process_transaction("B+", "deposit", 4)
+    service.inventory.update_one({"branch_id": DEFAULT_BRANCH, "blood_group": "B+"}, {"$inc": {"amount": 3}})
+
+    assert service.reconcile_inventory() == {(DEFAULT_BRANCH, "B+"): (7, 4)}
+    assert service.reconcile_inventory(fix=True) == {(DEFAULT_BRANCH, "B+"): (7, 4)}
+    assert service.reconcile_inventory() == {}
+    assert service.inventory_snapshot()["B+"] == 4
@@ -0,0 +1,62 @@
+"""Monthly reports: partition results and when a cached partition is recomputed."""
+from datetime import datetime
+
+from bson import ObjectId
+import pytest
+
+from reports import generate_report, parse_period, period_fingerprints
+from services import BLOOD_GROUPS
+
+
+@pytest.fixture
+def period():
+    return parse_period(f"{datetime.now():%Y-%m}")
+
+
+def report(db, months):
+    return generate_report(db, months, workers=1)
+
+
+def test_period_is_split_into_months():
+    assert parse_period("2024-11:2025-02") == ["2024-11", "2024-12", "2025-01", "2025-02"]
+    with pytest.raises(ValueError):
+        parse_period("2025-03:2025-01")
+
+
+def test_rows_count_donations_and_stock(service, period):
+    service.record_donation("Ann", "30", "female", "A+", "2", force=True)
+    service.process_transaction("A+", "deposit", 3)
+    service.process_transaction("A+", "collect", 1)
+
+    result, recomputed = report(service.donations.database, period)
+    row = next(row for row in result["rows"] if row["blood_group"] == "A+")
+    assert recomputed == len(BLOOD_GROUPS)
+    assert (row["donations"], row["units_donated"], row["received"], row["issued"]) == (1, 2, 5, 1)
+    assert row["closing_stock"] == 4
+
+
+def test_rerun_recomputes_only_changed_partitions(service, period):
+    db = service.donations.database
+    donation = service.record_donation("Ann", "30", "female", "O-", "1", force=True)
+    report(db, period)
+    assert report(db, period)[1] == 0
+
+    # Same count, different units
+    db["donations"].update_one({"_id": donation["_id"]}, {"$set": {"units": 3}})
+    assert report(db, period)[1] == 1
+
+    # Same count and units, different documents
+    db["donations"].delete_one({"_id": donation["_id"]})
+    db["donations"].insert_one(dict(donation, _id=ObjectId(), units=3))
+    assert report(db, period)[1] == 1
+
+
+def test_fingerprints_cover_every_partition_of_the_period(service):
+    months = parse_period("2024-12:2025-01")
+    service.record_donation("Ann", "30", "female", "B+", "2", date="2025-01-15", force=True)
+    service.record_donation("Bob", "30", "male", "B+", "1", date="2025-02-01", force=True)
+
+    fingerprints = period_fingerprints(service.donations.database, months)
+    assert set(fingerprints) == {(month, group) for month in months for group in BLOOD_GROUPS}
+    assert fingerprints[("2025-01", "B+")][:2] == [1, 2]
+    assert fingerprints[("2024-12", "B+")][:3] == [0, 0, None]
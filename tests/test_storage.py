@@ -0,0 +1,96 @@
+"""The Storage interface and its SQLite backend, which the desktop app and the API run on without MongoDB."""
+import os
+
+from bson import ObjectId
+import pytest
+
+from services import BloodBankService, DeferralError, InsufficientStockError, InventoryError
+from storage import SQLiteStorage, Storage, open_storage
+
+
+@pytest.fixture
+def sqlite(tmp_path):
+    storage = SQLiteStorage(os.path.join(tmp_path, "blood_bank.db"))
+    yield storage
+    storage.close()
+
+
+@pytest.fixture(params=["mongo", "sqlite"])
+def backend(request, service, sqlite):
+    return service if request.param == "mongo" else sqlite
+
+
+def test_both_backends_implement_storage(service, sqlite):
+    assert isinstance(service, Storage) and isinstance(sqlite, Storage)
+    assert all(callable(getattr(BloodBankService, name, None)) for name in Storage.__abstractmethods__)
+
+
+def test_incomplete_backend_cannot_be_created():
+    class Partial(Storage):
+        def ping(self):
+            pass
+
+    with pytest.raises(TypeError):
+        Partial()
+
+
+def test_open_storage(tmp_path):
+    storage = open_storage("sqlite", path=os.path.join(tmp_path, "site.db"), branch_id="north")
+    assert isinstance(storage, SQLiteStorage) and storage.branch_id == "north"
+    storage.close()
+    assert isinstance(open_storage("mongo"), BloodBankService)
+    with pytest.raises(ValueError):
+        open_storage("postgres")
+
+
+def test_login_and_signup(backend):
+    assert backend.signup("ann", "secret", "1990-01-01", "north")
+    assert not backend.signup("ann", "other", "1990-01-01")
+    assert backend.login("ann", "secret") == "north"
+    assert backend.login("ann", "wrong") is None
+    assert backend.branch_exists("north") and not backend.branch_exists("south")
+
+
+def test_donation_links_donor_and_defers_the_next_one(backend):
+    donor = backend.add_donor("Ann", "30", "female", "A+")
+    donation = backend.record_donation("ann", "30", "female", "A+", "2")
+    assert donation["donor_id"] == donor["_id"]
+    assert backend.inventory_snapshot()["A+"] == 2
+    with pytest.raises(DeferralError):
+        backend.record_donation("Ann", "30", "female", "A+", "1")
+    with pytest.raises(DeferralError):
+        backend.add_donor("Young", "16", "male", "O-")
+
+
+def test_collects_never_take_stock_below_zero(backend):
+    backend.process_transaction("B-", "deposit", 3)
+    with pytest.raises(InsufficientStockError):
+        backend.process_transaction("B-", "collect", 4)
+    doc, _ = backend.process_transaction("B-", "collect", 3)
+    assert doc["amount"] == 0
+    with pytest.raises(InventoryError):
+        backend.process_transaction("B-", "deposit", 0)
+    with pytest.raises(ValueError):
+        backend.process_transaction("Z", "deposit", 1)
+
+
+def test_stock_is_kept_per_branch(backend):
+    backend.for_branch("north").process_transaction("O+", "deposit", 5)
+    assert backend.for_branch("north").inventory_snapshot()["O+"] == 5
+    assert backend.inventory_snapshot()["O+"] == 0
+
+
+def test_list_pages_walk_both_ways(backend):
+    names = [f"donor{i:02d}" for i in range(7)]
+    for name in names:
+        backend.add_donor(name, "30", "male", "AB+")
+
+    first = backend.list_page("donors", limit=3)
+    second = backend.list_page("donors", {"_id": first[-1]["_id"]}, limit=3)
+    back = backend.list_page("donors", {"_id": second[0]["_id"]}, forward=False, limit=3)
+    assert [doc["name"] for doc in first + second] == names[:6]
+    assert [doc["name"] for doc in back] == names[:3]
+    assert isinstance(first[0]["_id"], ObjectId)
+    assert backend.list_page("donations") == []
+    with pytest.raises(ValueError):
+        backend.list_page("users")
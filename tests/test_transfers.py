@@ -0,0 +1,49 @@
+"""Transfers between branches: stock and batches arrive together, even after a crash."""
+import pytest
+
+from services import DEFAULT_BRANCH
+
+
+def stock(service, branch_id, blood_group):
+    doc = service.inventory.find_one({"branch_id": branch_id, "blood_group": blood_group})
+    return doc["amount"] if doc else 0
+
+
+def batch_units(service, branch_id, blood_group):
+    return sum(batch["remaining"] for batch in service.batches.find(
+        {"branch_id": branch_id, "blood_group": blood_group, "status": "available"}))
+
+
+def test_transfer_moves_units_with_their_expiry(service):
+    service.process_transaction("A+", "deposit", 5)
+    expires_at = service.batches.find_one({"blood_group": "A+"})["expires_at"]
+
+    service.transfer("north", "A+", 3)
+
+    assert stock(service, DEFAULT_BRANCH, "A+") == batch_units(service, DEFAULT_BRANCH, "A+") == 2
+    assert stock(service, "north", "A+") == batch_units(service, "north", "A+") == 3
+    assert service.batches.find_one({"branch_id": "north"})["expires_at"] == expires_at
+    service.for_branch("north").process_transaction("A+", "collect", 3)
+
+
+@pytest.mark.parametrize("crash_at", ["credit", "done"])
+def test_recovered_transfer_brings_its_batches(service, monkeypatch, crash_at):
+    service.process_transaction("O+", "deposit", 4)
+    complete = service.complete_transfer
+
+    def crash(transfer):
+        if crash_at == "done":
+            complete(transfer)
+            service.transfers.update_one({"_id": transfer["_id"]}, {"$set": {"state": "applied"}})
+        raise RuntimeError("process killed")
+
+    monkeypatch.setattr(service, "complete_transfer", crash)
+    with pytest.raises(RuntimeError):
+        service.transfer("north", "O+", 4)
+    monkeypatch.setattr(service, "complete_transfer", complete)
+
+    assert service.recover_transfers(older_than=-1) == 1
+    assert service.recover_transfers(older_than=-1) == 0
+    assert stock(service, "north", "O+") == batch_units(service, "north", "O+") == 4
+    assert stock(service, DEFAULT_BRANCH, "O+") == batch_units(service, DEFAULT_BRANCH, "O+") == 0
+    assert service.reconcile_inventory() == {}